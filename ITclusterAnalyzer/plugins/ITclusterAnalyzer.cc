@@ -18,11 +18,16 @@ Implementation:
 
 // system include files
 #include <algorithm>
+#include <cmath>
+#include <map>
 #include <memory>
+#include <mutex>
+#include <unordered_map>
+#include <vector>
 
 // user include files
 #include "FWCore/Framework/interface/Frameworkfwd.h"
-#include "FWCore/Framework/interface/one/EDAnalyzer.h"
+#include "FWCore/Framework/interface/global/EDAnalyzer.h"
 
 #include "FWCore/Framework/interface/Event.h"
 #include "FWCore/Framework/interface/MakerMacros.h"
@@ -33,6 +38,7 @@ Implementation:
 
 #include "FWCore/Framework/interface/ConsumesCollector.h"
 #include "FWCore/Framework/interface/ESHandle.h"
+#include "FWCore/Framework/interface/ESWatcher.h"
 #include "Geometry/CommonDetUnit/interface/GeomDet.h"
 #include "Geometry/Records/interface/TrackerDigiGeometryRecord.h"
 #include "Geometry/CommonTopologies/interface/PixelGeomDetUnit.h"
@@ -60,11 +66,6 @@ Implementation:
 // class declaration
 //
 
-// If the analyzer does not use TFileService, please remove
-// the template argument to the base class so the class inherits
-// from  edm::one::EDAnalyzer<>
-// This will improve performance in multithreaded jobs.
-
 // a struct to hold the residuals for each matched cluster
 struct Residual {
 
@@ -82,26 +83,295 @@ struct Residual {
 
 };
 
-class ITclusterAnalyzer : public edm::one::EDAnalyzer<edm::one::SharedResources> {
+// a PXF module in the module table: its DetId and geomdet and its neighbors
+// the neighbors are indices in the module table and the ring table, so finding them is an array access
+struct PXFModule {
+
+    uint32_t rawid;
+    const GeomDetUnit* geomDetUnit;
+    //the next module clockwise in the same ring, for the 2x coincidences
+    unsigned int next;
+    //the ring of the module and the next lower and upper ring on the same disk, -1 if there is none
+    int ring;
+    int lowerRing;
+    int upperRing;
+    //the clusters of the module are sorted along global y if the module is closer to the y axis, otherwise along x
+    bool sortY;
+
+};
+
+// the global positions of all clusters of an event as a struct of arrays, computed once per cluster
+// the clusters of module i of the module table are [offset[i], offset[i+1]), in the order of its DetSet
+// sorted has the same ranges with the cluster indices of each module sorted along x or y, key is their coordinate
+struct ClusterPositions {
+
+    std::vector<float> x;
+    std::vector<float> y;
+    std::vector<float> z;
+    std::vector<float> r;
+    std::vector<float> phi;
+    std::vector<unsigned int> offset;
+    std::vector<unsigned int> sorted;
+    std::vector<float> key;
+
+    void clear() {
+        x.clear();
+        y.clear();
+        z.clear();
+        r.clear();
+        phi.clear();
+        offset.clear();
+        sorted.clear();
+        key.clear();
+    }
+
+    void push_back(const Global3DPoint& pos) {
+        x.push_back(pos.x());
+        y.push_back(pos.y());
+        z.push_back(pos.z());
+        r.push_back(pos.perp());
+        phi.push_back(pos.phi());
+    }
+
+    Global3DPoint point(unsigned int i) const {
+        return Global3DPoint(x[i], y[i], z[i]);
+    }
+
+};
+
+// a PixelDigiSimLink reduced to (channel, SimTrackId), for the channel index of the simlinks
+typedef std::pair<unsigned int, unsigned int> ChannelLink;
+
+static bool lessChannel(const ChannelLink& first, const ChannelLink& second) {
+    return first.first < second.first;
+}
+
+// all histograms of the analyzer: the ones booked with the TFileService and a copy per stream that is filled in the
+// event loop and added to the booked ones at the end of the stream
+// histograms that are not booked (e.g. the coincidences without docoincidence) stay NULL
+struct ITclusterHistograms {
+
+    //array of TH2F for clusters per disk per ring
+    TH2F* m_diskHistosCluster[8] = {};
+    TH2F* m_diskHistosCluster_TFPX[16] = {};
+    //array of TH2F for hits per disk per ring
+    TH2F* m_diskHistosHits[8] = {};
+    TH2F* m_diskHistosHits_TFPX[16] = {};
+
+    //tracker maps for clusters
+    TH2F* m_trackerLayoutClustersZR = NULL;
+    TH2F* m_trackerLayoutClustersYX = NULL;
+    TH2F* m_trackerLayoutClustersZR_TFPX = NULL;
+    TH2F* m_trackerLayoutClustersYX_TFPX = NULL;
+    //tracker maps for hits
+    TH2F* m_trackerLayoutHitsZR = NULL;
+    TH2F* m_trackerLayoutHitsYX = NULL;
+    TH2F* m_trackerLayoutHitsZR_TFPX = NULL;
+    TH2F* m_trackerLayoutHitsYX_TFPX = NULL;
+
+    //array of TH2F for 2xcoinc per disk per ring
+    //first all coincidences
+    TH2F* m_diskHistos2x[8] = {};
+    TH2F* m_diskHistos2x_TFPX[16] = {};
+    TH2F* m_diskHistos2xInR[8] = {};
+    TH2F* m_diskHistos2xInR_TFPX[16] = {};
+    //and the real ones
+    TH2F* m_diskHistos2xreal[8] = {};
+    TH2F* m_diskHistos2xrealInR[8] = {};
+    TH2F* m_diskHistos2xreal_TFPX[16] = {};
+    TH2F* m_diskHistos2xrealInR_TFPX[16] = {};
+    //tracker maps for 2xcoinc
+    TH2F* m_trackerLayout2xZR = NULL;
+    TH2F* m_trackerLayout2xYX = NULL;
+    TH2F* m_trackerLayout2xZR_TFPX = NULL;
+    TH2F* m_trackerLayout2xYX_TFPX = NULL;
+    TH2F* m_trackerLayout2xZR_InR = NULL;
+    TH2F* m_trackerLayout2xYX_InR = NULL;
+    TH2F* m_trackerLayout2xZR_InR_TFPX = NULL;
+    TH2F* m_trackerLayout2xYX_InR_TFPX = NULL;
+
+    //array of TH2F for 3xcoinc per disk per ring
+    //first all coincidences
+    TH2F* m_diskHistos3x[8] = {};
+    TH2F* m_diskHistos3x_TFPX[16] = {};
+    //and the real ones
+    TH2F* m_diskHistos3xreal[8] = {};
+    TH2F* m_diskHistos3xreal_TFPX[16] = {};
+    //tracker maps for 3xcoinc
+    TH2F* m_trackerLayout3xZR = NULL;
+    TH2F* m_trackerLayout3xYX = NULL;
+    TH2F* m_trackerLayout3xZR_TFPX = NULL;
+    TH2F* m_trackerLayout3xYX_TFPX = NULL;
+
+    //simple residual histograms for the cuts
+    TH1F* m_residualX = NULL;
+    TH1F* m_residualY = NULL;
+    TH1F* m_residualR = NULL;
+    TH1F* m_residualX_TFPX = NULL;
+    TH1F* m_residualY_TFPX = NULL;
+    TH1F* m_residualR_TFPX = NULL;
+    TH1F* m_residualX_InR = NULL;
+    TH1F* m_residualY_InR = NULL;
+    TH1F* m_residualR_InR = NULL;
+    TH1F* m_residualX_TFPX_InR = NULL;
+    TH1F* m_residualY_TFPX_InR = NULL;
+    TH1F* m_residualR_TFPX_InR = NULL;
+
+    //the number of clusters per module
+    TH1F* m_nClusters = NULL;
+    TH1F* m_nHits = NULL;
+
+    TH1F* m_nHits_TFPX = NULL;
+    TH1F* m_nClusters_TFPX = NULL;
+
+    //call f(histogram, otherHistogram) for every histogram pointer of this set and the same one of another set
+    template <typename F>
+    void forEach(const ITclusterHistograms& other, F f) {
+        for (unsigned int i = 0; i < 8; i++) {
+            f(m_diskHistosCluster[i], other.m_diskHistosCluster[i]);
+            f(m_diskHistosHits[i], other.m_diskHistosHits[i]);
+            f(m_diskHistos2x[i], other.m_diskHistos2x[i]);
+            f(m_diskHistos2xInR[i], other.m_diskHistos2xInR[i]);
+            f(m_diskHistos2xreal[i], other.m_diskHistos2xreal[i]);
+            f(m_diskHistos2xrealInR[i], other.m_diskHistos2xrealInR[i]);
+            f(m_diskHistos3x[i], other.m_diskHistos3x[i]);
+            f(m_diskHistos3xreal[i], other.m_diskHistos3xreal[i]);
+        }
+        for (unsigned int i = 0; i < 16; i++) {
+            f(m_diskHistosCluster_TFPX[i], other.m_diskHistosCluster_TFPX[i]);
+            f(m_diskHistosHits_TFPX[i], other.m_diskHistosHits_TFPX[i]);
+            f(m_diskHistos2x_TFPX[i], other.m_diskHistos2x_TFPX[i]);
+            f(m_diskHistos2xInR_TFPX[i], other.m_diskHistos2xInR_TFPX[i]);
+            f(m_diskHistos2xreal_TFPX[i], other.m_diskHistos2xreal_TFPX[i]);
+            f(m_diskHistos2xrealInR_TFPX[i], other.m_diskHistos2xrealInR_TFPX[i]);
+            f(m_diskHistos3x_TFPX[i], other.m_diskHistos3x_TFPX[i]);
+            f(m_diskHistos3xreal_TFPX[i], other.m_diskHistos3xreal_TFPX[i]);
+        }
+        f(m_trackerLayoutClustersZR, other.m_trackerLayoutClustersZR);
+        f(m_trackerLayoutClustersYX, other.m_trackerLayoutClustersYX);
+        f(m_trackerLayoutClustersZR_TFPX, other.m_trackerLayoutClustersZR_TFPX);
+        f(m_trackerLayoutClustersYX_TFPX, other.m_trackerLayoutClustersYX_TFPX);
+        f(m_trackerLayoutHitsZR, other.m_trackerLayoutHitsZR);
+        f(m_trackerLayoutHitsYX, other.m_trackerLayoutHitsYX);
+        f(m_trackerLayoutHitsZR_TFPX, other.m_trackerLayoutHitsZR_TFPX);
+        f(m_trackerLayoutHitsYX_TFPX, other.m_trackerLayoutHitsYX_TFPX);
+        f(m_trackerLayout2xZR, other.m_trackerLayout2xZR);
+        f(m_trackerLayout2xYX, other.m_trackerLayout2xYX);
+        f(m_trackerLayout2xZR_TFPX, other.m_trackerLayout2xZR_TFPX);
+        f(m_trackerLayout2xYX_TFPX, other.m_trackerLayout2xYX_TFPX);
+        f(m_trackerLayout2xZR_InR, other.m_trackerLayout2xZR_InR);
+        f(m_trackerLayout2xYX_InR, other.m_trackerLayout2xYX_InR);
+        f(m_trackerLayout2xZR_InR_TFPX, other.m_trackerLayout2xZR_InR_TFPX);
+        f(m_trackerLayout2xYX_InR_TFPX, other.m_trackerLayout2xYX_InR_TFPX);
+        f(m_trackerLayout3xZR, other.m_trackerLayout3xZR);
+        f(m_trackerLayout3xYX, other.m_trackerLayout3xYX);
+        f(m_trackerLayout3xZR_TFPX, other.m_trackerLayout3xZR_TFPX);
+        f(m_trackerLayout3xYX_TFPX, other.m_trackerLayout3xYX_TFPX);
+        f(m_residualX, other.m_residualX);
+        f(m_residualY, other.m_residualY);
+        f(m_residualR, other.m_residualR);
+        f(m_residualX_TFPX, other.m_residualX_TFPX);
+        f(m_residualY_TFPX, other.m_residualY_TFPX);
+        f(m_residualR_TFPX, other.m_residualR_TFPX);
+        f(m_residualX_InR, other.m_residualX_InR);
+        f(m_residualY_InR, other.m_residualY_InR);
+        f(m_residualR_InR, other.m_residualR_InR);
+        f(m_residualX_TFPX_InR, other.m_residualX_TFPX_InR);
+        f(m_residualY_TFPX_InR, other.m_residualY_TFPX_InR);
+        f(m_residualR_TFPX_InR, other.m_residualR_TFPX_InR);
+        f(m_nClusters, other.m_nClusters);
+        f(m_nHits, other.m_nHits);
+        f(m_nHits_TFPX, other.m_nHits_TFPX);
+        f(m_nClusters_TFPX, other.m_nClusters_TFPX);
+    }
+
+};
+
+// the event and coincidence counters, per stream and summed up at the end of every stream
+struct ITclusterCounters {
+
+    //event counter
+    uint32_t m_nevents = 0;
+    //coincidence counter
+    uint32_t m_total2xcoincidences = 0;
+    uint32_t m_total2xcoincidences_TFPX = 0;
+    uint32_t m_total2xcoincidencesInR = 0;
+    uint32_t m_total2xcoincidencesInR_TFPX = 0;
+    uint32_t m_fake2xcoincidences = 0;
+    uint32_t m_fake2xcoincidences_TFPX = 0;
+    uint32_t m_fake2xcoincidencesInR = 0;
+    uint32_t m_fake2xcoincidencesInR_TFPX = 0;
+    uint32_t m_total3xcoincidences = 0;
+    uint32_t m_total3xcoincidences_TFPX = 0;
+    uint32_t m_fake3xcoincidences = 0;
+    uint32_t m_fake3xcoincidences_TFPX = 0;
+
+    void add(const ITclusterCounters& other) {
+        m_nevents += other.m_nevents;
+        m_total2xcoincidences += other.m_total2xcoincidences;
+        m_total2xcoincidences_TFPX += other.m_total2xcoincidences_TFPX;
+        m_total2xcoincidencesInR += other.m_total2xcoincidencesInR;
+        m_total2xcoincidencesInR_TFPX += other.m_total2xcoincidencesInR_TFPX;
+        m_fake2xcoincidences += other.m_fake2xcoincidences;
+        m_fake2xcoincidences_TFPX += other.m_fake2xcoincidences_TFPX;
+        m_fake2xcoincidencesInR += other.m_fake2xcoincidencesInR;
+        m_fake2xcoincidencesInR_TFPX += other.m_fake2xcoincidencesInR_TFPX;
+        m_total3xcoincidences += other.m_total3xcoincidences;
+        m_total3xcoincidences_TFPX += other.m_total3xcoincidences_TFPX;
+        m_fake3xcoincidences += other.m_fake3xcoincidences;
+        m_fake3xcoincidences_TFPX += other.m_fake3xcoincidences_TFPX;
+    }
+
+};
+
+// an entry of the cluster tree
+struct ClusterRow {
+
+    double CluX;
+    double CluY;
+    double CluZ;
+    double CluArea;
+    double CluSize;
+    double CluTheta;
+    double CluPhi;
+    double CluCharge;
+    unsigned int CluNum;
+    unsigned int CluMerge;
+    //event number and raw DetId of the module, to group the clusters per event and per module
+    unsigned long long CluEvent;
+    unsigned int CluDetId;
+    //position of the module from the TrackerTopology: side (1 = -z, 2 = +z), disk (1-8 TFPX, 9-12 TEPX), ring and module
+    unsigned char CluSide;
+    unsigned char CluDisk;
+    unsigned char CluRing;
+    unsigned short CluModule;
+
+};
+
+// everything a stream needs to analyze its events: the per event data, the module table, its own copy of the
+// histograms and counters and the clusters of the event for the tree
+// every stream analyzes its events independently, the analyzer merges the streams
+class ITclusterStream : public ITclusterHistograms, public ITclusterCounters {
 public:
-    explicit ITclusterAnalyzer(const edm::ParameterSet&);
-    ~ITclusterAnalyzer();
+    ITclusterStream(edm::EDGetTokenT<edmNew::DetSetVector<SiPixelCluster>>, edm::EDGetTokenT<edm::DetSetVector<PixelDigiSimLink>>,
+                    edm::EDGetTokenT<edm::DetSetVector<PixelDigi>>, bool, double, double, double, bool);
 
-    static void fillDescriptions(edm::ConfigurationDescriptions& descriptions);
+    void cloneHistograms(const ITclusterHistograms&);
+    void analyze(const edm::Event&, const edm::EventSetup&);
+    const std::vector<ClusterRow>& clusterRows() const { return m_clusterRows; }
 
 private:
-    virtual void beginJob() override;
-    virtual void analyze(const edm::Event&, const edm::EventSetup&) override;
-    virtual void endJob() override;
-
+    void buildModuleTable();
+    void indexClusters();
+    std::pair<unsigned int, unsigned int> candidateWindow(unsigned int, const Global3DPoint&) const;
     //bool findCoincidence(DetId, Global3DPoint, bool);
-    bool findCoincidence2x(DetId, Global3DPoint, bool, unsigned int&, edmNew::DetSet<SiPixelCluster>::const_iterator&);
-    bool findCoincidence3x(DetId, Global3DPoint, bool, unsigned int&, edmNew::DetSet<SiPixelCluster>::const_iterator&);
-    bool findCoincidenceInR2x(DetId, Global3DPoint, bool, std::vector<unsigned int>&, std::vector<edmNew::DetSet<SiPixelCluster>::const_iterator>&, std::vector<float>&);
+    bool findCoincidence2x(unsigned int, Global3DPoint, bool, unsigned int&, edmNew::DetSet<SiPixelCluster>::const_iterator&);
+    bool findCoincidence3x(unsigned int, Global3DPoint, bool, unsigned int&, edmNew::DetSet<SiPixelCluster>::const_iterator&);
+    bool findCoincidenceInR2x(unsigned int, Global3DPoint, bool, std::vector<unsigned int>&, std::vector<edmNew::DetSet<SiPixelCluster>::const_iterator>&, std::vector<float>&);
     edm::DetSetVector<PixelDigiSimLink>::const_iterator findSimLinkDetSet(unsigned int thedetid);
+    std::pair<unsigned int, unsigned int> simLinkChannels(edm::DetSetVector<PixelDigiSimLink>::const_iterator);
     std::set<unsigned int> getSimTrackId(edm::DetSetVector<PixelDigiSimLink>::const_iterator, edmNew::DetSet<SiPixelCluster>::const_iterator, bool print);
     bool areSameSimTrackId(std::set<unsigned int> first, std::set<unsigned int> second, std::set<unsigned int>&);
-    uint32_t getModuleID(bool, unsigned int, unsigned int, unsigned int);
     // ----------member data ---------------------------
     edm::EDGetTokenT<edmNew::DetSetVector<SiPixelCluster>> m_tokenClusters;
     edm::EDGetTokenT<edm::DetSetVector<PixelDigiSimLink>> m_tokenSimLinks;
@@ -115,121 +385,83 @@ private:
     const edm::DetSetVector<PixelDigiSimLink>* simlinks = NULL;
     const edm::DetSetVector<PixelDigi>* digis = NULL;  //defining pointer to digis - COB 26.02.19
 
-    //max bins of Counting histogram
-    uint32_t m_maxBin;
+    // the table of all PXF modules, built from the geometry and topology whenever the geometry changes
+    // m_rings has the module indices of every ring ordered by module number
+    edm::ESWatcher<TrackerDigiGeometryRecord> m_geomWatcher;
+    std::vector<PXFModule> m_modules;
+    std::vector<std::vector<unsigned int>> m_rings;
+    std::unordered_map<uint32_t, unsigned int> m_moduleIndex;
+    // the cluster DetSet of every module of the table in this event, clusters->end() if it has no clusters
+    std::vector<edmNew::DetSetVector<SiPixelCluster>::const_iterator> m_moduleClusters;
+    // and the global positions of their clusters, used by the cluster loop, the coincidence searches and the tree
+    ClusterPositions m_positions;
+    // the links of every simlink DetSet of the event sorted by channel, built the first time the DetSet is used
+    // m_simLinkRange has the range of each DetSet in m_simLinkChannels once m_simLinkIndexed is set
+    std::vector<ChannelLink> m_simLinkChannels;
+    std::vector<std::pair<unsigned int, unsigned int>> m_simLinkRange;
+    std::vector<bool> m_simLinkIndexed;
+
     //flag for checking coincidences
     bool m_docoincidence;
 
-    //array of TH2F for clusters per disk per ring
-    TH2F* m_diskHistosCluster[8];
-    TH2F* m_diskHistosCluster_TFPX[16];
-    //array of TH2F for hits per disk per ring
-    TH2F* m_diskHistosHits[8];
-    TH2F* m_diskHistosHits_TFPX[16];
+    //cuts for the coincidence
+    double m_dx;
+    double m_dy;
+    double m_dz;
 
-    //tracker maps for clusters
-    TH2F* m_trackerLayoutClustersZR;
-    TH2F* m_trackerLayoutClustersYX;
-    TH2F* m_trackerLayoutClustersZR_TFPX;
-    TH2F* m_trackerLayoutClustersYX_TFPX;
-    //tracker maps for hits
-    TH2F* m_trackerLayoutHitsZR;
-    TH2F* m_trackerLayoutHitsYX;
-    TH2F* m_trackerLayoutHitsZR_TFPX;
-    TH2F* m_trackerLayoutHitsYX_TFPX;
+    //the histograms of this stream, owned by it
+    std::vector<std::unique_ptr<TH1>> m_ownedHistograms;
 
-    //array of TH2F for 2xcoinc per disk per ring
-    //first all coincidences
-    TH2F* m_diskHistos2x[8];
-    TH2F* m_diskHistos2x_TFPX[16];
-    TH2F* m_diskHistos2xInR[8];
-    TH2F* m_diskHistos2xInR_TFPX[16];
-    //and the real ones
-    TH2F* m_diskHistos2xreal[8];
-    TH2F* m_diskHistos2xrealInR[8];
-    TH2F* m_diskHistos2xreal_TFPX[16];
-    TH2F* m_diskHistos2xrealInR_TFPX[16];
-    //tracker maps for 2xcoinc
-    TH2F* m_trackerLayout2xZR;
-    TH2F* m_trackerLayout2xYX;
-    TH2F* m_trackerLayout2xZR_TFPX;
-    TH2F* m_trackerLayout2xYX_TFPX;
-    TH2F* m_trackerLayout2xZR_InR;
-    TH2F* m_trackerLayout2xYX_InR;
-    TH2F* m_trackerLayout2xZR_InR_TFPX;
-    TH2F* m_trackerLayout2xYX_InR_TFPX;
+    // the clusters of the current event for the cluster tree
+    bool m_storeClusterTree;
+    std::vector<ClusterRow> m_clusterRows;
 
-    //array of TH2F for 3xcoinc per disk per ring
-    //first all coincidences
-    TH2F* m_diskHistos3x[8];
-    TH2F* m_diskHistos3x_TFPX[16];
-    //and the real ones
-    TH2F* m_diskHistos3xreal[8];
-    TH2F* m_diskHistos3xreal_TFPX[16];
-    //tracker maps for 3xcoinc
-    TH2F* m_trackerLayout3xZR;
-    TH2F* m_trackerLayout3xYX;
-    TH2F* m_trackerLayout3xZR_TFPX;
-    TH2F* m_trackerLayout3xYX_TFPX;
+};
 
-    //simple residual histograms for the cuts
-    TH1F* m_residualX;
-    TH1F* m_residualY;
-    TH1F* m_residualR;
-    TH1F* m_residualX_TFPX;
-    TH1F* m_residualY_TFPX;
-    TH1F* m_residualR_TFPX;
-    TH1F* m_residualX_InR;
-    TH1F* m_residualY_InR;
-    TH1F* m_residualR_InR;
-    TH1F* m_residualX_TFPX_InR;
-    TH1F* m_residualY_TFPX_InR;
-    TH1F* m_residualR_TFPX_InR;
+// the analyzer is a global module: the events are analyzed concurrently by the streams, see ITclusterStream
+// the booked histograms and the counters are only touched at the end of every stream and the cluster tree once per
+// event, always under m_mutex
+class ITclusterAnalyzer : public edm::global::EDAnalyzer<edm::StreamCache<ITclusterStream>>, private ITclusterHistograms {
+public:
+    explicit ITclusterAnalyzer(const edm::ParameterSet&);
+    ~ITclusterAnalyzer();
 
-    //the number of clusters per module
-    TH1F* m_nClusters;
-    TH1F* m_nHits;
+    static void fillDescriptions(edm::ConfigurationDescriptions& descriptions);
 
-    TH1F* m_nHits_TFPX;
-    TH1F* m_nClusters_TFPX;
+private:
+    virtual void beginJob() override;
+    virtual std::unique_ptr<ITclusterStream> beginStream(edm::StreamID) const override;
+    virtual void analyze(edm::StreamID, const edm::Event&, const edm::EventSetup&) const override;
+    virtual void endStream(edm::StreamID) const override;
+    virtual void endJob() override;
+
+    // ----------member data ---------------------------
+    edm::EDGetTokenT<edmNew::DetSetVector<SiPixelCluster>> m_tokenClusters;
+    edm::EDGetTokenT<edm::DetSetVector<PixelDigiSimLink>> m_tokenSimLinks;
+    edm::EDGetTokenT<edm::DetSetVector<PixelDigi>> m_tokenDigis;
+
+    //max bins of Counting histogram
+    uint32_t m_maxBin;
+    //flag for checking coincidences
+    bool m_docoincidence;
 
     //cuts for the coincidence
     double m_dx;
     double m_dy;
     double m_dz;
 
-    //event counter
-    uint32_t m_nevents;
-    //coincidence counter
-    uint32_t m_total2xcoincidences;
-    uint32_t m_total2xcoincidences_TFPX;
-    uint32_t m_total2xcoincidencesInR;
-    uint32_t m_total2xcoincidencesInR_TFPX;
-    uint32_t m_fake2xcoincidences;
-    uint32_t m_fake2xcoincidences_TFPX;
-    uint32_t m_fake2xcoincidencesInR;
-    uint32_t m_fake2xcoincidencesInR_TFPX;
-    uint32_t m_total3xcoincidences;
-    uint32_t m_total3xcoincidences_TFPX;
-    uint32_t m_fake3xcoincidences;
-    uint32_t m_fake3xcoincidences_TFPX;
+    //the counters of all streams
+    mutable ITclusterCounters m_counters;
+    //for the booked histograms, the counters and the cluster tree
+    mutable std::mutex m_mutex;
 
     // --
     // Variables for cluster parameterization studies
     bool m_storeClusterTree;
     TFile *outFileCluster;
     TTree *outTreeCluster;
-    double CluX;
-    double CluY;
-    double CluZ;
-    double CluArea;
-    double CluSize;
-    double CluTheta;
-    double CluPhi;
-    double CluCharge;
-    unsigned int CluNum;
-    unsigned int CluMerge;
-    unsigned int mergeClu;
+    //the branches of the tree
+    mutable ClusterRow m_clusterRow;
 
 };
 
@@ -256,19 +488,31 @@ ITclusterAnalyzer::ITclusterAnalyzer(const edm::ParameterSet& iConfig)
         , m_dz(iConfig.getParameter<double>("dz_cut"))
         , m_storeClusterTree(iConfig.getUntrackedParameter<bool>("storeClusterTree")) {
     //now do what ever initialization is needed
-    m_nevents = 0;
-    m_total2xcoincidences = 0;
-    m_total2xcoincidences_TFPX = 0;
-    m_total2xcoincidencesInR = 0;
-    m_total2xcoincidencesInR_TFPX = 0;
-    m_fake2xcoincidences = 0;
-    m_fake2xcoincidences_TFPX = 0;
-    m_fake2xcoincidencesInR = 0;
-    m_fake2xcoincidencesInR_TFPX = 0;
-    m_total3xcoincidences = 0;
-    m_total3xcoincidences_TFPX = 0;
-    m_fake3xcoincidences = 0;
-    m_fake3xcoincidences_TFPX = 0;
+}
+
+ITclusterStream::ITclusterStream(edm::EDGetTokenT<edmNew::DetSetVector<SiPixelCluster>> tokenClusters,
+                                 edm::EDGetTokenT<edm::DetSetVector<PixelDigiSimLink>> tokenSimLinks,
+                                 edm::EDGetTokenT<edm::DetSetVector<PixelDigi>> tokenDigis,
+                                 bool docoincidence, double dx, double dy, double dz, bool storeClusterTree)
+        : m_tokenClusters(tokenClusters)
+        , m_tokenSimLinks(tokenSimLinks)
+        , m_tokenDigis(tokenDigis)
+        , m_docoincidence(docoincidence)
+        , m_dx(dx)
+        , m_dy(dy)
+        , m_dz(dz)
+        , m_storeClusterTree(storeClusterTree) {
+}
+
+//the histograms of the stream are empty copies of the booked ones, not attached to any file
+void ITclusterStream::cloneHistograms(const ITclusterHistograms& booked) {
+    forEach(booked, [this](auto& histo, auto& bookedHisto) {
+        if (bookedHisto == NULL)
+            return;
+        histo = static_cast<std::decay_t<decltype(bookedHisto)>>(bookedHisto->Clone());
+        histo->SetDirectory(NULL);
+        m_ownedHistograms.emplace_back(histo);
+    });
 }
 
 ITclusterAnalyzer::~ITclusterAnalyzer() {
@@ -516,23 +760,69 @@ void ITclusterAnalyzer::beginJob() {
         outFileCluster->cd();
         outTreeCluster = new TTree("cluster_tree","cluster");
 
-        outTreeCluster->Branch("CluX", &CluX);
-        outTreeCluster->Branch("CluY", &CluY);
-        outTreeCluster->Branch("CluZ", &CluZ);
-        outTreeCluster->Branch("CluTheta", &CluTheta);
-        outTreeCluster->Branch("CluPhi", &CluPhi);
-        outTreeCluster->Branch("CluCharge", &CluCharge);
-        outTreeCluster->Branch("CluArea", &CluArea);
-        outTreeCluster->Branch("CluSize", &CluSize);
-        outTreeCluster->Branch("CluMerge", &CluMerge);
-        outTreeCluster->Branch("CluNum", &CluNum);
+        m_clusterRow = ClusterRow();
+        outTreeCluster->Branch("CluX", &m_clusterRow.CluX);
+        outTreeCluster->Branch("CluY", &m_clusterRow.CluY);
+        outTreeCluster->Branch("CluZ", &m_clusterRow.CluZ);
+        outTreeCluster->Branch("CluTheta", &m_clusterRow.CluTheta);
+        outTreeCluster->Branch("CluPhi", &m_clusterRow.CluPhi);
+        outTreeCluster->Branch("CluCharge", &m_clusterRow.CluCharge);
+        outTreeCluster->Branch("CluArea", &m_clusterRow.CluArea);
+        outTreeCluster->Branch("CluSize", &m_clusterRow.CluSize);
+        outTreeCluster->Branch("CluMerge", &m_clusterRow.CluMerge);
+        outTreeCluster->Branch("CluNum", &m_clusterRow.CluNum);
+        outTreeCluster->Branch("CluEvent", &m_clusterRow.CluEvent);
+        outTreeCluster->Branch("CluDetId", &m_clusterRow.CluDetId);
+        outTreeCluster->Branch("CluSide", &m_clusterRow.CluSide, "CluSide/b");
+        outTreeCluster->Branch("CluDisk", &m_clusterRow.CluDisk, "CluDisk/b");
+        outTreeCluster->Branch("CluRing", &m_clusterRow.CluRing, "CluRing/b");
+        outTreeCluster->Branch("CluModule", &m_clusterRow.CluModule, "CluModule/s");
 
     }
 
 }
 
-// ------------ method called for each event  ------------
-void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup& iSetup) {
+// ------------ method called once for each stream before its first event  ------------
+std::unique_ptr<ITclusterStream> ITclusterAnalyzer::beginStream(edm::StreamID) const {
+
+    std::unique_ptr<ITclusterStream> stream(new ITclusterStream(m_tokenClusters, m_tokenSimLinks, m_tokenDigis, m_docoincidence,
+                                                                m_dx, m_dy, m_dz, m_storeClusterTree));
+    std::lock_guard<std::mutex> guard(m_mutex);
+    stream->cloneHistograms(*this);
+    return stream;
+}
+
+// ------------ method called for each event, concurrently in the streams  ------------
+void ITclusterAnalyzer::analyze(edm::StreamID streamID, const edm::Event& iEvent, const edm::EventSetup& iSetup) const {
+
+    ITclusterStream* stream = streamCache(streamID);
+    stream->analyze(iEvent, iSetup);
+
+    //the clusters of the event go to the tree in one go
+    if (m_storeClusterTree) {
+        std::lock_guard<std::mutex> guard(m_mutex);
+        for (const ClusterRow& row : stream->clusterRows()) {
+            m_clusterRow = row;
+            outTreeCluster->Fill();
+        }
+    }
+}
+
+// ------------ method called once for each stream after its last event  ------------
+void ITclusterAnalyzer::endStream(edm::StreamID streamID) const {
+
+    ITclusterStream* stream = streamCache(streamID);
+    //add the histograms and counters of the stream to the booked histograms and the totals
+    std::lock_guard<std::mutex> guard(m_mutex);
+    stream->forEach(*this, [](auto& histo, auto& bookedHisto) {
+        if (histo != NULL)
+            bookedHisto->Add(histo);
+    });
+    m_counters.add(*stream);
+}
+
+// ------------ method called for each event of the stream  ------------
+void ITclusterStream::analyze(const edm::Event& iEvent, const edm::EventSetup& iSetup) {
 
     //get the digis - COB 26.02.19
     edm::Handle<edm::DetSetVector<PixelDigi>> tdigis;
@@ -562,6 +852,17 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
     simlinks = tsimlinks.product();
     digis = tdigis.product();  //pointer to digis - COB 26.02.19
 
+    //the module table only changes with the geometry, so at most once per run
+    if (m_geomWatcher.check(iSetup))
+        buildModuleTable();
+    indexClusters();
+    m_clusterRows.clear();
+
+    //the channel index of the simlinks is built lazily, only for the modules that are used for the truth matching
+    m_simLinkChannels.clear();
+    m_simLinkRange.assign(simlinks->size(), std::make_pair(0u, 0u));
+    m_simLinkIndexed.assign(simlinks->size(), false);
+
     //a 2D counter array to count the number of clusters per disk and per ring
     unsigned int cluCounter[8][5];
     memset(cluCounter, 0, sizeof(cluCounter));
@@ -753,10 +1054,11 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                 hist_id = 4 + layer - 9;
             }
 
-            // Get the geomdet
-            const GeomDetUnit* geomDetUnit(tkGeom->idToDetUnit(detId));
-            if (!geomDetUnit)
+            // Get the module from the module table
+            std::unordered_map<uint32_t, unsigned int>::const_iterator moduleIt = m_moduleIndex.find(rawid);
+            if (moduleIt == m_moduleIndex.end())
                 continue;
+            unsigned int moduleIndex = moduleIt->second;
 
             unsigned int nClu = 0;
 
@@ -769,13 +1071,12 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                 nClu++;
                 cluCounter[hist_id][ring_id]++;
 
-                // determine the position
-                MeasurementPoint mpClu(cluit->x(), cluit->y());
-                Local3DPoint localPosClu = geomDetUnit->topology().localPosition(mpClu);
-                Global3DPoint globalPosClu = geomDetUnit->surface().toGlobal(localPosClu);
+                // the position from the per-event cache
+                unsigned int cluIndex = m_positions.offset[moduleIndex] + (cluit - DSVit->begin());
+                Global3DPoint globalPosClu = m_positions.point(cluIndex);
 
                 //fill TkLayout histos
-                m_trackerLayoutClustersZR->Fill(globalPosClu.z(), globalPosClu.perp());
+                m_trackerLayoutClustersZR->Fill(globalPosClu.z(), m_positions.r[cluIndex]);
                 m_trackerLayoutClustersYX->Fill(globalPosClu.x(), globalPosClu.y());
 
                 //for cluster parameterization studies...
@@ -784,24 +1085,31 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                     edm::DetSetVector<PixelDigiSimLink>::const_iterator simLinkDSViter = findSimLinkDetSet(rawid);
                     std::set<unsigned int> mergeClu = this->getSimTrackId(simLinkDSViter, cluit, false);
 
-                    CluX = globalPosClu.x();
-	            CluY = globalPosClu.y();
-	            CluZ = globalPosClu.z();
-	            CluPhi = globalPosClu.phi();
-	            CluTheta = globalPosClu.theta();
-	            CluCharge = cluit->charge();
-	            CluArea = (cluit->sizeY())*(cluit->sizeX());
-	            CluSize = cluit->size();
-	            CluMerge = mergeClu.size();
-
-                    outTreeCluster->Fill();
+                    ClusterRow row = ClusterRow();
+                    row.CluX = globalPosClu.x();
+                    row.CluY = globalPosClu.y();
+                    row.CluZ = globalPosClu.z();
+                    row.CluPhi = m_positions.phi[cluIndex];
+                    row.CluTheta = std::atan2(m_positions.r[cluIndex], m_positions.z[cluIndex]);
+                    row.CluCharge = cluit->charge();
+                    row.CluArea = (cluit->sizeY())*(cluit->sizeX());
+                    row.CluSize = cluit->size();
+                    row.CluMerge = mergeClu.size();
+                    row.CluEvent = iEvent.id().event();
+                    row.CluDetId = rawid;
+                    row.CluSide = side;
+                    row.CluDisk = layer;
+                    row.CluRing = ring;
+                    row.CluModule = tTopo->pxfModule(detId);
+
+                    m_clusterRows.push_back(row);
                  }
 
                 //std::cout << globalPosClu.x() << " " << globalPosClu.y() << std::endl;
                 if (m_docoincidence) {
                     unsigned int coincidenceId;
                     edmNew::DetSet<SiPixelCluster>::const_iterator coincidenceCluster;
-                    bool found = this->findCoincidence2x(detId, globalPosClu, true, coincidenceId, coincidenceCluster);
+                    bool found = this->findCoincidence2x(moduleIndex, globalPosClu, true, coincidenceId, coincidenceCluster);
                     if (found) {
                         m_total2xcoincidences++;
                         x2Counter[hist_id][ring_id]++;
@@ -827,7 +1135,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                             m_fake2xcoincidences++;
                         }
 
-                        m_trackerLayout2xZR->Fill(globalPosClu.z(), globalPosClu.perp());
+                        m_trackerLayout2xZR->Fill(globalPosClu.z(), m_positions.r[cluIndex]);
                         m_trackerLayout2xYX->Fill(globalPosClu.x(), globalPosClu.y());
 
                         //done with 2 fold coincidences, now 3 fold
@@ -835,7 +1143,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                         found = false;
                         unsigned int coincidenceId3x;
                         edmNew::DetSet<SiPixelCluster>::const_iterator coincidenceCluster3x;
-                        found = this->findCoincidence3x(detId, globalPosClu, true, coincidenceId3x, coincidenceCluster3x);
+                        found = this->findCoincidence3x(moduleIndex, globalPosClu, true, coincidenceId3x, coincidenceCluster3x);
                         if (found) {
                             m_total3xcoincidences++;
                             x3Counter[hist_id][ring_id]++;
@@ -860,7 +1168,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                                 m_fake3xcoincidences++;
                             }
 
-                            m_trackerLayout3xZR->Fill(globalPosClu.z(), globalPosClu.perp());
+                            m_trackerLayout3xZR->Fill(globalPosClu.z(), m_positions.r[cluIndex]);
                             m_trackerLayout3xYX->Fill(globalPosClu.x(), globalPosClu.y());
                         }
                     }
@@ -868,7 +1176,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                     std::vector<unsigned int> coincidenceIdInR;
                     std::vector<edmNew::DetSet<SiPixelCluster>::const_iterator> coincidenceClusterInR;
                     std::vector<float> coincidenceClusterdr;
-                    bool found2xinR = this-> findCoincidenceInR2x(detId, globalPosClu, true, coincidenceIdInR, coincidenceClusterInR, coincidenceClusterdr);
+                    bool found2xinR = this->findCoincidenceInR2x(moduleIndex, globalPosClu, true, coincidenceIdInR, coincidenceClusterInR, coincidenceClusterdr);
                     if (found2xinR) {
                         m_total2xcoincidencesInR++;
                         x2CounterInR[hist_id][ring_id]++;
@@ -897,7 +1205,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                             m_fake2xcoincidencesInR++;
                         }
 
-                        m_trackerLayout2xZR_InR->Fill(globalPosClu.z(), globalPosClu.perp());
+                        m_trackerLayout2xZR_InR->Fill(globalPosClu.z(), m_positions.r[cluIndex]);
                         m_trackerLayout2xYX_InR->Fill(globalPosClu.x(), globalPosClu.y());
                     }
                     //----------------------------------------- 
@@ -917,10 +1225,11 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                 hist_id = 8 + layer - 1;
             }
 
-            // Get the geomdet
-            const GeomDetUnit* geomDetUnit(tkGeom->idToDetUnit(detId));
-            if (!geomDetUnit)
+            // Get the module from the module table
+            std::unordered_map<uint32_t, unsigned int>::const_iterator moduleIt = m_moduleIndex.find(rawid);
+            if (moduleIt == m_moduleIndex.end())
                 continue;
+            unsigned int moduleIndex = moduleIt->second;
 
             unsigned int nClu = 0;
 
@@ -933,19 +1242,18 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                 nClu++;
                 cluCounter_TFPX[hist_id][ring_id]++;
 
-                // determine the position
-                MeasurementPoint mpClu(cluit->x(), cluit->y());
-                Local3DPoint localPosClu = geomDetUnit->topology().localPosition(mpClu);
-                Global3DPoint globalPosClu = geomDetUnit->surface().toGlobal(localPosClu);
+                // the position from the per-event cache
+                unsigned int cluIndex = m_positions.offset[moduleIndex] + (cluit - DSVit->begin());
+                Global3DPoint globalPosClu = m_positions.point(cluIndex);
 
                 //fill TkLayout histos
-                m_trackerLayoutClustersZR_TFPX->Fill(globalPosClu.z(), globalPosClu.perp());
+                m_trackerLayoutClustersZR_TFPX->Fill(globalPosClu.z(), m_positions.r[cluIndex]);
                 m_trackerLayoutClustersYX_TFPX->Fill(globalPosClu.x(), globalPosClu.y());
 
                 if (m_docoincidence) {
                     unsigned int coincidenceId;
                     edmNew::DetSet<SiPixelCluster>::const_iterator coincidenceCluster;
-                    bool found = this->findCoincidence2x(detId, globalPosClu, false, coincidenceId, coincidenceCluster);
+                    bool found = this->findCoincidence2x(moduleIndex, globalPosClu, false, coincidenceId, coincidenceCluster);
                     if (found) {
                         m_total2xcoincidences_TFPX++;
                         x2Counter_TFPX[hist_id][ring_id]++;
@@ -965,7 +1273,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                             m_fake2xcoincidences_TFPX++;
                         }
 
-                        m_trackerLayout2xZR_TFPX->Fill(globalPosClu.z(), globalPosClu.perp());
+                        m_trackerLayout2xZR_TFPX->Fill(globalPosClu.z(), m_positions.r[cluIndex]);
                         m_trackerLayout2xYX_TFPX->Fill(globalPosClu.x(), globalPosClu.y());
 
                         //done with 2 fold coincidences, now 3 fold
@@ -973,7 +1281,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                         found = false;
                         unsigned int coincidenceId3x;
                         edmNew::DetSet<SiPixelCluster>::const_iterator coincidenceCluster3x;
-                        found = this->findCoincidence3x(detId, globalPosClu, false, coincidenceId3x, coincidenceCluster3x);
+                        found = this->findCoincidence3x(moduleIndex, globalPosClu, false, coincidenceId3x, coincidenceCluster3x);
                         if (found) {
                             m_total3xcoincidences_TFPX++;
                             x3Counter_TFPX[hist_id][ring_id]++;
@@ -991,7 +1299,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                                 m_fake3xcoincidences_TFPX++;
                             }
 
-                            m_trackerLayout3xZR_TFPX->Fill(globalPosClu.z(), globalPosClu.perp());
+                            m_trackerLayout3xZR_TFPX->Fill(globalPosClu.z(), m_positions.r[cluIndex]);
                             m_trackerLayout3xYX_TFPX->Fill(globalPosClu.x(), globalPosClu.y());
                         }
 
@@ -1000,7 +1308,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                     std::vector<unsigned int> coincidenceIdInR;
                     std::vector<edmNew::DetSet<SiPixelCluster>::const_iterator> coincidenceClusterInR;
                     std::vector<float> coincidenceClusterdr;
-                    bool found2xinR = this-> findCoincidenceInR2x(detId, globalPosClu, false, coincidenceIdInR, coincidenceClusterInR, coincidenceClusterdr);
+                    bool found2xinR = this->findCoincidenceInR2x(moduleIndex, globalPosClu, false, coincidenceIdInR, coincidenceClusterInR, coincidenceClusterdr);
                     if (found2xinR) {
                         m_total2xcoincidencesInR_TFPX++;
                         x2CounterInR_TFPX[hist_id][ring_id]++;
@@ -1020,7 +1328,7 @@ void ITclusterAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup&
                             m_fake2xcoincidencesInR_TFPX++;
                         }
 
-                        m_trackerLayout2xZR_InR_TFPX->Fill(globalPosClu.z(), globalPosClu.perp());
+                        m_trackerLayout2xZR_InR_TFPX->Fill(globalPosClu.z(), m_positions.r[cluIndex]);
                         m_trackerLayout2xYX_InR_TFPX->Fill(globalPosClu.x(), globalPosClu.y());       
                     }
                     //-----------------------------------------
@@ -1079,19 +1387,19 @@ void ITclusterAnalyzer::endJob() {
         outFileCluster->Close();
     }
 
-    std::cout << "IT cluster Analyzer processed " << m_nevents << " events!" << std::endl;
+    std::cout << "IT cluster Analyzer processed " << m_counters.m_nevents << " events!" << std::endl;
     if (m_docoincidence) {
-        std::cout << "IT cluster Analyzer found " << m_fake2xcoincidences / (double)m_total2xcoincidences * 100 
+        std::cout << "IT cluster Analyzer found " << m_counters.m_fake2xcoincidences / (double)m_counters.m_total2xcoincidences * 100 
                   << "\% fake double coincidences in TEPX modules." << std::endl;
-        std::cout << "IT cluster Analyzer found " << m_fake3xcoincidences / (double)m_total3xcoincidences * 100 
+        std::cout << "IT cluster Analyzer found " << m_counters.m_fake3xcoincidences / (double)m_counters.m_total3xcoincidences * 100 
                   << "\% fake triple coincidences in TEPX modules." << std::endl;
-        std::cout << "IT cluster Analyzer found " << m_fake2xcoincidences_TFPX / (double)m_total2xcoincidences_TFPX * 100 
+        std::cout << "IT cluster Analyzer found " << m_counters.m_fake2xcoincidences_TFPX / (double)m_counters.m_total2xcoincidences_TFPX * 100 
                   << "\% fake double coincidences in TFPX modules." << std::endl;
-        std::cout << "IT cluster Analyzer found " << m_fake3xcoincidences_TFPX / (double)m_total3xcoincidences_TFPX * 100 
+        std::cout << "IT cluster Analyzer found " << m_counters.m_fake3xcoincidences_TFPX / (double)m_counters.m_total3xcoincidences_TFPX * 100 
                   << "\% fake triple coincidences in TFPX modules." << std::endl;
-        std::cout << "IT cluster Analyzer found " << m_fake2xcoincidencesInR / (double)m_total2xcoincidencesInR * 100
+        std::cout << "IT cluster Analyzer found " << m_counters.m_fake2xcoincidencesInR / (double)m_counters.m_total2xcoincidencesInR * 100
                   << "\% fake double coincidences in R in TEPX modules." << std::endl;
-        std::cout << "IT cluster Analyzer found " << m_fake2xcoincidencesInR_TFPX / (double)m_total2xcoincidencesInR_TFPX * 100
+        std::cout << "IT cluster Analyzer found " << m_counters.m_fake2xcoincidencesInR_TFPX / (double)m_counters.m_total2xcoincidencesInR_TFPX * 100
                   << "\% fake double coincidences in R in TFPX modules." << std::endl;
     }
 }
@@ -1114,75 +1422,37 @@ void ITclusterAnalyzer::fillDescriptions(edm::ConfigurationDescriptions& descrip
 //----------
 //Adding function to find 2x coincidences in R
 //COB - 21.May.2019
-bool ITclusterAnalyzer::findCoincidenceInR2x(DetId thedetid, Global3DPoint theglobalPosClu, bool isTEPX, std::vector<unsigned int>& ovModIds, std::vector<edmNew::DetSet<SiPixelCluster>::const_iterator>& ovClusIds, std::vector<float>& ovDr) {
+bool ITclusterStream::findCoincidenceInR2x(unsigned int theindex, Global3DPoint theglobalPosClu, bool isTEPX, std::vector<unsigned int>& ovModIds, std::vector<edmNew::DetSet<SiPixelCluster>::const_iterator>& ovClusIds, std::vector<float>& ovDr) {
 
     bool found = false;
 
-    //getting ring and module for initial cluster
-    unsigned int thering = (tTopo->pxfBlade(thedetid));
-    unsigned int thedisk = (tTopo->pxfDisk(thedetid));
-    unsigned int theside = (tTopo->pxfSide(thedetid));
-
-    //debugging...
-    //std::string dumpId = tTopo->print(thedetid);
-    //std::cout << "=> Initial detector Id: " << dumpId << std::endl;
-
     //go to the next ring
-    uint32_t newring = thering + 1;
-    if (isTEPX) {
-        if (thering == 5) 
-            return false;  //can't search for coincidences in R in the last ring
-    } else {  //TFPX
-        if (thering == 4)
-            return false;  //can't search for coincidences in R in the last ring
-    }
+    int newring = m_modules[theindex].upperRing;
+    if (newring < 0)
+        return false;  //can't search for coincidences in R in the last ring
 
     //get the geomdet
-    const GeomDetUnit* geomDetUnit(tkGeom->idToDetUnit(thedetid));
+    const GeomDetUnit* geomDetUnit(m_modules[theindex].geomDetUnit);
     std::pair<float,float> phiSpan = geomDetUnit->surface().phiSpan();
     //std::pair<float,float> zSpan = geomDetUnit->surface().zSpan();
     //std::pair<float,float> rSpan = geomDetUnit->surface().rSpan();
 
-    //define number of modules in each ring
-    int nmod = -99;
-    if (isTEPX) {
-        if (newring==2) {
-            nmod = 28;
-        } else if (newring==3) {
-            nmod = 36;
-        } else if (newring==4) {
-            nmod = 44;
-        } else if (newring==5) {
-            nmod = 48;
-        }
-    } else {  //TFPX
-        if (newring==2) {
-            nmod = 32;
-        } else if (newring==3) {
-            nmod = 24;
-        } else if (newring==4) {
-            nmod = 32;
-        }
-    }
-
     //debugging...
     //std::cout << "phiSpan " << phiSpan.first << "," << phiSpan.second << std::endl;
     //std::cout << "zSpan " << zSpan.first << "," << zSpan.second << std::endl;
     //std::cout << "rSpan " << rSpan.first << "," << rSpan.second << std::endl;
 
-    //loop over modules in new ring
-    //find first the id of the first module in the new ring
-    uint32_t tmpid = getModuleID(isTEPX, theside, thedisk, newring);
-    for (int i=1; i<=nmod; i++) {
+    //loop over modules in new ring, from the module table
+    for (unsigned int newindex : m_rings[newring]) {
 
         found = false;
 
-        DetId tmp(tmpid);
-       
-        //debugging... 
-        //std::cout << "tmp " << tTopo->print(tmp) << std::endl;
+        uint32_t tmpid = m_modules[newindex].rawid;
+
+        //debugging...
+        //std::cout << "tmp " << tTopo->print(DetId(tmpid)) << std::endl;
 
-        const GeomDetUnit* geomDetUnit_tmp(tkGeom->idToDetUnit(tmpid));
+        const GeomDetUnit* geomDetUnit_tmp(m_modules[newindex].geomDetUnit);
         std::pair<float,float> phiSpan_tmp = geomDetUnit_tmp->surface().phiSpan();
         //std::pair<float,float> rSpan_tmp = geomDetUnit_tmp->surface().rSpan();   
 
@@ -1235,11 +1505,9 @@ bool ITclusterAnalyzer::findCoincidenceInR2x(DetId thedetid, Global3DPoint thegl
             //std::cout << "module " << tTopo->pxfModule(tmpid) << " overlaps in phi with " << tTopo->pxfModule(thedetid) << std::endl;
    
             //check if there are clusters in this new module
-            edmNew::DetSetVector<SiPixelCluster>::const_iterator theit = clusters->find(tmpid);
-            if (theit == clusters->end()) {
-                tmpid = (tmpid & 0xFFFFFC03) | (((i+1) & 0xFF) << 2);
+            edmNew::DetSetVector<SiPixelCluster>::const_iterator theit = m_moduleClusters[newindex];
+            if (theit == clusters->end())
                 continue;
-            }
 
             //debugging...
             //std::cout << "there are clusters in module " << tTopo->pxfModule(tmpid) << ". checking for overlaps..." << std::endl;
@@ -1250,13 +1518,16 @@ bool ITclusterAnalyzer::findCoincidenceInR2x(DetId thedetid, Global3DPoint thegl
 
             foundCluster = theit->end();
 
-            //loop over clusters in module and check if they overlap with the original cluster
-            for (edmNew::DetSet<SiPixelCluster>::const_iterator cluit = theit->begin(); cluit != theit->end(); cluit++) {
+            unsigned int foundIndex = 0;
+
+            //loop over the clusters in the window of the module and check if they overlap with the original cluster
+            std::pair<unsigned int, unsigned int> window = candidateWindow(newindex, theglobalPosClu);
+            for (unsigned int k = window.first; k < window.second; k++) {
 
-                //determine the position
-                MeasurementPoint mpClu(cluit->x(), cluit->y());
-                Local3DPoint localPosClu = geomDetUnit_tmp->topology().localPosition(mpClu);
-                Global3DPoint globalPosClu = geomDetUnit_tmp->surface().toGlobal(localPosClu);
+                //the position from the per-event cache
+                unsigned int cluIndex = m_positions.sorted[k];
+                edmNew::DetSet<SiPixelCluster>::const_iterator cluit = theit->begin() + (cluIndex - m_positions.offset[newindex]);
+                Global3DPoint globalPosClu = m_positions.point(cluIndex);
 
                 //now check that the global position is within the cuts
                 if (fabs(globalPosClu.x() - theglobalPosClu.x()) < m_dx
@@ -1275,11 +1546,13 @@ bool ITclusterAnalyzer::findCoincidenceInR2x(DetId thedetid, Global3DPoint thegl
                     //debugging...
                     //std::cout << "and has dr of " << r.dr << std::endl;
 
-                    if (r.dr < r_min) {
+                    //for equal distances the first cluster of the module as before the sorting
+                    if (r.dr < r_min || (r.dr == r_min && cluIndex < foundIndex)) {
                         r_min = r.dr;
                         found = true;
                         foundCluster = cluit;
                         foundDetId = tmpid;
+                        foundIndex = cluIndex;
                     }
 
                 }
@@ -1315,9 +1588,6 @@ bool ITclusterAnalyzer::findCoincidenceInR2x(DetId thedetid, Global3DPoint thegl
 
         }
 
-        //go to the next module in the new ring
-        tmpid = (tmpid & 0xFFFFFC03) | (((i+1) & 0xFF) << 2);
-
     }
 
     //debugging...
@@ -1336,57 +1606,20 @@ bool ITclusterAnalyzer::findCoincidenceInR2x(DetId thedetid, Global3DPoint thegl
 
 //---------
 
-bool ITclusterAnalyzer::findCoincidence2x(DetId thedetid, Global3DPoint theglobalPosClu, bool isTEPX, unsigned int& foundDetId, edmNew::DetSet<SiPixelCluster>::const_iterator& foundCluster) {
+bool ITclusterStream::findCoincidence2x(unsigned int theindex, Global3DPoint theglobalPosClu, bool isTEPX, unsigned int& foundDetId, edmNew::DetSet<SiPixelCluster>::const_iterator& foundCluster) {
 
     bool found = false;
-    uint32_t rawid = thedetid.rawId();
-    uint32_t newid = rawid;
-    //now I have the raw ID and can mess with the bits
-    //the side, layer and ring are the same and I just have to increment or decrement the module number
-    unsigned int themodule = (tTopo->pxfModule(thedetid));
-    unsigned int thering = (tTopo->pxfBlade(thedetid));
 
     //in order to avoid duplicates, only look in the next module clockwise
-    //depending on the ring, if I am already on the module with the highest module id in the ring, I need to go to the first one
-    uint32_t newmodule = themodule + 1;
-    if (isTEPX) {
-        if (thering == 1 && themodule == 20)
-            newmodule = 1;
-        else if (thering == 2 && themodule == 28)
-            newmodule = 1;
-        else if (thering == 3 && themodule == 36)
-            newmodule = 1;
-        else if (thering == 4 && themodule == 44)
-            newmodule = 1;
-        else if (thering == 5 && themodule == 48)
-            newmodule = 1;
-    } else {  //TFPX
-        if (thering == 1 && themodule == 20)
-            newmodule = 1;
-        else if (thering == 2 && themodule == 32)
-            newmodule = 1;
-        else if (thering == 3 && themodule == 24)
-            newmodule = 1;
-        else if (thering == 4 && themodule == 32)
-            newmodule = 1;
-    }
+    //the module table has it for every module, including the wrap around from the last to the first module in the ring
+    unsigned int newindex = m_modules[theindex].next;
+    uint32_t newid = m_modules[newindex].rawid;
 
-    //now encode
-    newid = (newid & 0xFFFFFC03) | ((newmodule & 0xFF) << 2);
-
-    //now I have a raw id of the module I want to use
-    DetId id(newid);
-    //unsigned int ring = (tTopo->pxfBlade(id));
-    //unsigned int module = (tTopo->pxfModule(id));
-
-    edmNew::DetSetVector<SiPixelCluster>::const_iterator theit = clusters->find(id);
+    edmNew::DetSetVector<SiPixelCluster>::const_iterator theit = m_moduleClusters[newindex];
     if (theit == clusters->end()) {
         return false;
     }
 
-    // Get the geomdet
-    const GeomDetUnit* geomDetUnit(tkGeom->idToDetUnit(id));
-
     unsigned int nClu = 0;
     //at the end of the day, need to find the closest coincidence hit, so store the minimum 2D distance in a temporary variable and a vector for all values
     double r_min = 1000.;
@@ -1394,13 +1627,16 @@ bool ITclusterAnalyzer::findCoincidence2x(DetId thedetid, Global3DPoint thegloba
 
     //make the return value end();
     foundCluster = theit->end();
+    unsigned int foundIndex = 0;
 
-    for (edmNew::DetSet<SiPixelCluster>::const_iterator cluit = theit->begin(); cluit != theit->end(); cluit++) {
+    //only the clusters in the window along the sorted coordinate of the module can be within the cuts
+    std::pair<unsigned int, unsigned int> window = candidateWindow(newindex, theglobalPosClu);
+    for (unsigned int k = window.first; k < window.second; k++) {
 
-        // determine the position
-        MeasurementPoint mpClu(cluit->x(), cluit->y());
-        Local3DPoint localPosClu = geomDetUnit->topology().localPosition(mpClu);
-        Global3DPoint globalPosClu = geomDetUnit->surface().toGlobal(localPosClu);
+        // the position from the per-event cache
+        unsigned int cluIndex = m_positions.sorted[k];
+        edmNew::DetSet<SiPixelCluster>::const_iterator cluit = theit->begin() + (cluIndex - m_positions.offset[newindex]);
+        Global3DPoint globalPosClu = m_positions.point(cluIndex);
 
         //now check that the global position is within the cuts
         if (fabs(globalPosClu.x() - theglobalPosClu.x()) < m_dx
@@ -1413,12 +1649,14 @@ bool ITclusterAnalyzer::findCoincidence2x(DetId thedetid, Global3DPoint thegloba
             Residual r(delta_x, delta_y);
             r_vec.push_back(r);
 
-            if (r.dr < r_min) {
+            //for equal distances the first cluster of the module as before the sorting
+            if (r.dr < r_min || (r.dr == r_min && cluIndex < foundIndex)) {
                 r_min = r.dr;
                 found = true;
                 // I assign this here to always have the closest cluster
                 foundCluster = cluit;
                 foundDetId = newid;
+                foundIndex = cluIndex;
             }
 
             //std::cout << "Found matching cluster # " << nClu << std::endl;
@@ -1452,79 +1690,39 @@ bool ITclusterAnalyzer::findCoincidence2x(DetId thedetid, Global3DPoint thegloba
 
 }
 
-bool ITclusterAnalyzer::findCoincidence3x(DetId thedetid, Global3DPoint theglobalPosClu, bool isTEPX, unsigned int& foundDetId, edmNew::DetSet<SiPixelCluster>::const_iterator& foundCluster) {
+bool ITclusterStream::findCoincidence3x(unsigned int theindex, Global3DPoint theglobalPosClu, bool isTEPX, unsigned int& foundDetId, edmNew::DetSet<SiPixelCluster>::const_iterator& foundCluster) {
 
     bool found = false;
-    uint32_t rawid = thedetid.rawId();
-    uint32_t newid = rawid;
-    //now I have the raw ID and can mess with the bits
     //the side and layer are the same and I just have to look in a lower ring
-    //unsigned int themodule = (tTopo->pxfModule(thedetid));
-    unsigned int thering = (tTopo->pxfBlade(thedetid));
-
-    unsigned int maxmodule = 0;
-    unsigned int newring = 0;
-
-    if (isTEPX) {
-        if (thering > 1 && thering <= 5) {
-            newring = thering - 1; //look in a lower ring
-            //now get the max range of modules for the respective ring
-            if (newring == 1)
-                maxmodule = 20;
-            else if (newring == 2)
-                maxmodule = 28;
-            else if (newring == 3)
-                maxmodule = 36;
-            else if (newring == 4)
-                maxmodule = 44;
-        } else
-            return false;
-    } else {
-        if (thering > 1 && thering <= 4) {
-            newring = thering - 1; //look in a lower ring
-            //now get the max range of modules for the respective ring
-            if (newring == 1)
-                maxmodule = 20;
-            else if (newring == 2)
-                maxmodule = 32;
-            else if (newring == 3)
-                maxmodule = 24;
-            //else if (newring == 4)
-            //    maxmodule = 32;
-        } else
-            return false;
-    }
+    int newring = m_modules[theindex].lowerRing;
+    if (newring < 0)
+        return false;
 
     unsigned int nClu = 0;
     //to make sure we only use the closest hit
     double r_min = 1000.;
     std::vector<Residual> r_vec;
+    unsigned int foundIndex = 0;
 
     //make the return value end();
     //foundCluster = theit->end();
 
-    for (uint32_t newmodule = 1; newmodule <= maxmodule; newmodule++) {
-        newid = (newid & 0xFFFC0C03) | ((newring & 0x3F) << 12) | ((newmodule & 0xFF) << 2);
+    //all modules of the lower ring, ordered by module number
+    for (unsigned int newindex : m_rings[newring]) {
+        uint32_t newid = m_modules[newindex].rawid;
 
-        DetId id(newid);
-        //unsigned int ring = (tTopo->pxfBlade(id));
-        //unsigned int module = (tTopo->pxfModule(id));
-
-        edmNew::DetSetVector<SiPixelCluster>::const_iterator theit = clusters->find(id);
+        edmNew::DetSetVector<SiPixelCluster>::const_iterator theit = m_moduleClusters[newindex];
         if (theit == clusters->end()) {
             return false;
         }
-        // Get the geomdet
-        const GeomDetUnit* geomDetUnit(tkGeom->idToDetUnit(id));
-        if (!geomDetUnit)
-            continue;
-
-        for (edmNew::DetSet<SiPixelCluster>::const_iterator cluit = theit->begin(); cluit != theit->end(); cluit++) {
+        //only the clusters in the window along the sorted coordinate of the module can be within the cuts
+        std::pair<unsigned int, unsigned int> window = candidateWindow(newindex, theglobalPosClu);
+        for (unsigned int k = window.first; k < window.second; k++) {
 
-            // determine the position
-            MeasurementPoint mpClu(cluit->x(), cluit->y());
-            Local3DPoint localPosClu = geomDetUnit->topology().localPosition(mpClu);
-            Global3DPoint globalPosClu = geomDetUnit->surface().toGlobal(localPosClu);
+            // the position from the per-event cache
+            unsigned int cluIndex = m_positions.sorted[k];
+            edmNew::DetSet<SiPixelCluster>::const_iterator cluit = theit->begin() + (cluIndex - m_positions.offset[newindex]);
+            Global3DPoint globalPosClu = m_positions.point(cluIndex);
 
             //now check that the global position is within the cuts
             if (fabs(globalPosClu.x() - theglobalPosClu.x()) < m_dx
@@ -1540,12 +1738,14 @@ bool ITclusterAnalyzer::findCoincidence3x(DetId thedetid, Global3DPoint thegloba
                 Residual r(delta_x, delta_y);
                 r_vec.push_back(r);
 
-                if (r.dr < r_min) {
+                //for equal distances the first cluster of the first module as before the sorting
+                if (r.dr < r_min || (r.dr == r_min && foundDetId == newid && cluIndex < foundIndex)) {
                     r_min = r.dr;
                     found = true;
                     // i assign this here to be sure to always have the closest cluster
                     foundCluster = cluit;
                     foundDetId = newid;
+                    foundIndex = cluIndex;
                     //std::cout << "New det ID: " << newid << std::endl;
                 }
                 //std::cout << "Found matching cluster # " << nClu << " which is a 3x coincidence" << std::endl;
@@ -1565,29 +1765,51 @@ bool ITclusterAnalyzer::findCoincidence3x(DetId thedetid, Global3DPoint thegloba
     return found;
 }
 
-edm::DetSetVector<PixelDigiSimLink>::const_iterator ITclusterAnalyzer::findSimLinkDetSet(unsigned int thedetid) {
+edm::DetSetVector<PixelDigiSimLink>::const_iterator ITclusterStream::findSimLinkDetSet(unsigned int thedetid) {
     ////basic template
     edm::DetSetVector<PixelDigiSimLink>::const_iterator simLinkDS = simlinks->find(thedetid);
     return simLinkDS;
 }
 
-std::set<unsigned int> ITclusterAnalyzer::getSimTrackId(edm::DetSetVector<PixelDigiSimLink>::const_iterator simLinkDSViter, edmNew::DetSet<SiPixelCluster>::const_iterator cluster, bool print) {
+//the range of the links of a simlink DetSet in m_simLinkChannels, sorted by channel
+//the DetSet is indexed the first time it is used in an event
+std::pair<unsigned int, unsigned int> ITclusterStream::simLinkChannels(edm::DetSetVector<PixelDigiSimLink>::const_iterator simLinkDSViter) {
+    unsigned int index = simLinkDSViter - simlinks->begin();
+    if (!m_simLinkIndexed[index]) {
+        unsigned int first = m_simLinkChannels.size();
+        for (edm::DetSet<PixelDigiSimLink>::const_iterator it = simLinkDSViter->data.begin(); it != simLinkDSViter->data.end(); it++)
+            m_simLinkChannels.push_back(ChannelLink(it->channel(), it->SimTrackId()));
+        //stable, so the links of a channel stay in the order of the DetSet
+        std::stable_sort(m_simLinkChannels.begin() + first, m_simLinkChannels.end(), lessChannel);
+        m_simLinkRange[index] = std::make_pair(first, (unsigned int)m_simLinkChannels.size());
+        m_simLinkIndexed[index] = true;
+    }
+    return m_simLinkRange[index];
+}
+
+std::set<unsigned int> ITclusterStream::getSimTrackId(edm::DetSetVector<PixelDigiSimLink>::const_iterator simLinkDSViter, edmNew::DetSet<SiPixelCluster>::const_iterator cluster, bool print) {
     int size = cluster->size();
     std::set<unsigned int> simTrackIds;
 
+    if (simLinkDSViter == simlinks->end())
+        return simTrackIds;
+
+    //the links of the module sorted by channel, so the links of every pixel are found with a binary search
+    std::pair<unsigned int, unsigned int> range = simLinkChannels(simLinkDSViter);
+    std::vector<ChannelLink>::const_iterator first = m_simLinkChannels.begin() + range.first;
+    std::vector<ChannelLink>::const_iterator last = m_simLinkChannels.begin() + range.second;
+
     for (int i = 0; i < size; i++) {
 
         SiPixelCluster::Pixel pix = cluster->pixel(i);
         unsigned int clusterChannel = PixelDigi::pixelToChannel(pix.x, pix.y);
 
-        if (simLinkDSViter != simlinks->end()) {
-            for (edm::DetSet<PixelDigiSimLink>::const_iterator it = simLinkDSViter->data.begin(); it != simLinkDSViter->data.end(); it++) {
-                if (clusterChannel == it->channel()) {
-                    simTrackIds.insert(it->SimTrackId());
-                    if (print)
-                        std::cout << "Channel: " << clusterChannel << " SimTrack ID: " << it->SimTrackId() << std::endl;
-                }
-            }
+        std::pair<std::vector<ChannelLink>::const_iterator, std::vector<ChannelLink>::const_iterator> links =
+                std::equal_range(first, last, ChannelLink(clusterChannel, 0), lessChannel);
+        for (std::vector<ChannelLink>::const_iterator it = links.first; it != links.second; it++) {
+            simTrackIds.insert(it->second);
+            if (print)
+                std::cout << "Channel: " << clusterChannel << " SimTrack ID: " << it->second << std::endl;
         }
     }
     //if(simTrackIds.size() != 1){
@@ -1597,7 +1819,7 @@ std::set<unsigned int> ITclusterAnalyzer::getSimTrackId(edm::DetSetVector<PixelD
     return simTrackIds;
 }
 
-bool ITclusterAnalyzer::areSameSimTrackId(std::set<unsigned int> first, std::set<unsigned int> second, std::set<unsigned int>& intersection) {
+bool ITclusterStream::areSameSimTrackId(std::set<unsigned int> first, std::set<unsigned int> second, std::set<unsigned int>& intersection) {
     //method to check if the sim Track id is present in both sets
     //std::set<unsigned int> intersection;
     std::set_intersection(first.begin(), first.end(), second.begin(), second.end(), std::inserter(intersection, intersection.begin()));
@@ -1613,329 +1835,117 @@ bool ITclusterAnalyzer::areSameSimTrackId(std::set<unsigned int> first, std::set
 }
 
 //----------
-//Adding function to construct DetId from PXFDetId
-//COB - 22.May.2019
-uint32_t ITclusterAnalyzer::getModuleID(bool isTEPX, unsigned int side, unsigned int disk, unsigned int ring) {
-
-    //std::cout << "isTEPX " << isTEPX << " side " << side << " disk " << disk << " ring " << ring << std::endl;
-
-    uint32_t modid = -999;
-
-    if (isTEPX) {
-        if (side==1) {
-            if (disk==9) {
-                if (ring==2) {
-                    modid = 346301444;
-                } else if (ring==3) {
-                    modid = 346305540;
-                } else if (ring==4) {
-                    modid = 346309636;
-                } else if (ring==5) {
-                    modid = 346313732;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << " side " << side << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==10) {
-                if (ring==2) {
-                    modid = 346563588;
-                } else if (ring==3) {
-                    modid = 346567684;
-                } else if (ring==4) {
-                    modid = 346571780;
-                } else if (ring==5) {
-                    modid = 346575876;
-                } else {
-                   std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                   return modid;
-                }
-            } else if (disk==11) {
-                if (ring==2) {
-                    modid = 346825732;
-                } else if (ring==3) {
-                    modid = 346829828;
-                } else if (ring==4) {
-                    modid = 346833924;
-                } else if (ring==5) {
-                    modid = 346838020;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==12) {
-                if (ring==2) {
-                    modid = 347087876;
-                } else if (ring==3) {
-                    modid = 347091972;
-                } else if (ring==4) {
-                    modid = 347096068;
-                } else if (ring==5) {
-                    modid = 347100164;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else {
-                std::cout << "Non-existent disk for TEPX!" << std::endl;
-                return modid;
-            }
-        } else if (side==2) {
-            if (disk==9) {
-                if (ring==2) {
-                    modid = 354690052;
-                } else if (ring==3) {
-                    modid = 354694148;
-                } else if (ring==4) {
-                    modid = 354698244;
-                } else if (ring==5) {
-                    modid = 354702340;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==10) {
-                if (ring==2) {
-                    modid = 354952196;
-                } else if (ring==3) {
-                    modid = 354956292;
-                } else if (ring==4) {
-                    modid = 354960388;
-                } else if (ring==5) {
-                    modid = 354964484;
-                } else {
-                   std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                   return modid;
-                }
-            } else if (disk==11) {
-                if (ring==2) {
-                    modid = 355214340;
-                } else if (ring==3) {
-                    modid = 355218436;
-                } else if (ring==4) {
-                    modid = 355222532;
-                } else if (ring==5) {
-                    modid = 355226628;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==12) {
-                if (ring==2) {
-                    modid = 355476484;
-                } else if (ring==3) {
-                    modid = 355480580;
-                } else if (ring==4) {
-                    modid = 355484676;
-                } else if (ring==5) {
-                    modid = 355488772;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else {
-                std::cout << "Non-existent disk for TEPX!" << std::endl;
-                return modid;
-            }
-        } else {
-            std::cout << "Non-existent side!" << std::endl;
-            return modid;
+//the module table: every PXF module with its geomdet, the next module clockwise in its ring and the neighboring rings
+//replaces the hardcoded number of modules per ring and the DetIds built from bit masks
+void ITclusterStream::buildModuleTable() {
+
+    m_modules.clear();
+    m_rings.clear();
+    m_moduleIndex.clear();
+
+    //the modules of every ring ordered by module number, the key is (side << 16) | (disk << 8) | ring
+    std::map<uint32_t, std::map<unsigned int, unsigned int>> ringModules;
+    for (auto const& rawid : tkGeom->detUnitIds()) {
+        DetId detId(rawid);
+        TrackerGeometry::ModuleType mType = tkGeom->getDetectorType(detId);
+        if (mType != TrackerGeometry::ModuleType::Ph2PXF && detId.subdetId() != PixelSubdetector::PixelEndcap)
+            continue;
+        const GeomDetUnit* geomDetUnit(tkGeom->idToDetUnit(detId));
+        if (!geomDetUnit)
+            continue;
+
+        PXFModule module;
+        module.rawid = detId.rawId();
+        module.geomDetUnit = geomDetUnit;
+        module.next = m_modules.size();
+        module.ring = module.lowerRing = module.upperRing = -1;
+        module.sortY = fabs(geomDetUnit->surface().position().y()) > fabs(geomDetUnit->surface().position().x());
+
+        uint32_t key = (tTopo->pxfSide(detId) << 16) | (tTopo->pxfDisk(detId) << 8) | tTopo->pxfBlade(detId);
+        ringModules[key][tTopo->pxfModule(detId)] = m_modules.size();
+        m_moduleIndex[module.rawid] = m_modules.size();
+        m_modules.push_back(module);
+    }
+
+    //the next module clockwise, the last module of a ring is followed by the first one
+    std::map<uint32_t, int> ringIndex;
+    for (auto const& ring : ringModules) {
+        std::vector<unsigned int> modules;
+        for (auto const& module : ring.second)
+            modules.push_back(module.second);
+        for (unsigned int i = 0; i < modules.size(); i++) {
+            m_modules[modules[i]].next = modules[(i + 1) % modules.size()];
+            m_modules[modules[i]].ring = m_rings.size();
         }
-    } else {  //TFPX
-
-        if (side==1) {
-            if (disk==1) {
-                if (ring==2) {
-                    modid = 344204292;
-                } else if (ring==3) {
-                    modid = 344208388;
-                } else if (ring==4) {
-                    modid = 344212484;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==2) {
-                if (ring==2) {
-                    modid = 344466436;
-                } else if (ring==3) {
-                    modid = 344470532;
-                } else if (ring==4) {
-                    modid = 344474628;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==3) {
-                if (ring==2) {
-                    modid = 344728580;
-                } else if (ring==3) {
-                    modid = 344732676;
-                } else if (ring==4) {
-                    modid = 344736772;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==4) {
-                if (ring==2) {
-                    modid = 344990724;
-                } else if (ring==3) {
-                    modid = 344994820;
-                } else if (ring==4) {
-                    modid = 344998916;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==5) {
-                if (ring==2) {
-                    modid = 345252868;
-                } else if (ring==3) {
-                    modid = 345256964;
-                } else if (ring==4) {
-                    modid = 345261060;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==6) {
-                if (ring==2) {
-                    modid = 345515012;
-                } else if (ring==3) {
-                    modid = 345519108;
-                } else if (ring==4) {
-                    modid = 345523204;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==7) {
-                if (ring==2) {
-                    modid = 345777156;
-                } else if (ring==3) {
-                    modid = 345781252;
-                } else if (ring==4) {
-                    modid = 345785348;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==8) {
-                if (ring==2) {
-                    modid = 346039300;
-                } else if (ring==3) {
-                    modid = 346043396;
-                } else if (ring==4) {
-                    modid = 346047492;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else {
-                std::cout << "Non-existent disk for TFPX!" << std::endl;
-                return modid;
-            }
-        } else if (side==2) {
-            if (disk==1) {
-                if (ring==2) {
-                    modid = 352592900;
-                } else if (ring==3) { 
-                    modid = 352596996;
-                } else if (ring==4) {
-                    modid = 352601092;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==2) {
-                if (ring==2) {
-                    modid = 352855044;
-                } else if (ring==3) {
-                    modid = 352859140;
-                } else if (ring==4) {
-                    modid = 352863236;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==3) {
-                if (ring==2) {
-                    modid = 353117188;
-                } else if (ring==3) {
-                    modid = 353121284;
-                } else if (ring==4) {
-                    modid = 353125380;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==4) {
-                if (ring==2) {
-                    modid = 353379332;
-                } else if (ring==3) {
-                    modid = 353383428;
-                } else if (ring==4) {
-                    modid = 353387524;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==5) {
-                if (ring==2) {
-                    modid = 353641476;
-                } else if (ring==3) {
-                    modid = 353645572;
-                } else if (ring==4) {
-                    modid = 353649668;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==6) {
-                if (ring==2) {
-                    modid = 353903620;
-                } else if (ring==3) {
-                    modid = 353907716;
-                } else if (ring==4) {
-                    modid = 353911812;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==7) {
-                if (ring==2) {
-                    modid = 354165764;
-                } else if (ring==3) {
-                    modid = 354169860;
-                } else if (ring==4) {
-                    modid = 354173956;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else if (disk==8) {
-                if (ring==2) {
-                    modid = 354427908;
-                } else if (ring==3) {
-                    modid = 354432004;
-                } else if (ring==4) {
-                    modid = 354436100;
-                } else {
-                    std::cout << "Non-existent ring number for disk " << disk << "!" << std::endl;
-                    return modid;
-                }
-            } else {
-                std::cout << "Non-existent disk for TFPX!" << std::endl;
-                return modid;
-            }                            
-        } else {
-            std::cout << "Non-existent side!" << std::endl;
-            return modid;
+        ringIndex[ring.first] = m_rings.size();
+        m_rings.push_back(modules);
+    }
+
+    //and the rings next to it on the same disk
+    for (auto const& ring : ringIndex) {
+        std::map<uint32_t, int>::const_iterator lower = ringIndex.find(ring.first - 1);
+        std::map<uint32_t, int>::const_iterator upper = ringIndex.find(ring.first + 1);
+        for (unsigned int index : m_rings[ring.second]) {
+            m_modules[index].lowerRing = (lower != ringIndex.end()) ? lower->second : -1;
+            m_modules[index].upperRing = (upper != ringIndex.end()) ? upper->second : -1;
         }
+    }
+
+}
+
+//the cluster DetSet of every module of the table for this event, in a single pass over the clusters
+//and the global positions of all their clusters, so every position is transformed exactly once per event
+void ITclusterStream::indexClusters() {
 
+    m_moduleClusters.assign(m_modules.size(), clusters->end());
+    for (typename edmNew::DetSetVector<SiPixelCluster>::const_iterator DSVit = clusters->begin(); DSVit != clusters->end(); DSVit++) {
+        std::unordered_map<uint32_t, unsigned int>::const_iterator moduleIt = m_moduleIndex.find(DSVit->detId());
+        if (moduleIt != m_moduleIndex.end())
+            m_moduleClusters[moduleIt->second] = DSVit;
+    }
+
+    //the vectors keep their capacity from the previous events
+    m_positions.clear();
+    for (unsigned int i = 0; i < m_modules.size(); i++) {
+        m_positions.offset.push_back(m_positions.x.size());
+        if (m_moduleClusters[i] == clusters->end())
+            continue;
+        const GeomDetUnit* geomDetUnit(m_modules[i].geomDetUnit);
+        for (edmNew::DetSet<SiPixelCluster>::const_iterator cluit = m_moduleClusters[i]->begin(); cluit != m_moduleClusters[i]->end(); cluit++) {
+            MeasurementPoint mpClu(cluit->x(), cluit->y());
+            Local3DPoint localPosClu = geomDetUnit->topology().localPosition(mpClu);
+            m_positions.push_back(geomDetUnit->surface().toGlobal(localPosClu));
+        }
+    }
+    m_positions.offset.push_back(m_positions.x.size());
+
+    //the clusters of every module sorted along its coordinate, for the binary searches in candidateWindow
+    for (unsigned int i = 0; i < m_modules.size(); i++) {
+        const std::vector<float>& coordinate = m_modules[i].sortY ? m_positions.y : m_positions.x;
+        unsigned int first = m_positions.offset[i];
+        for (unsigned int cluIndex = first; cluIndex < m_positions.offset[i + 1]; cluIndex++)
+            m_positions.sorted.push_back(cluIndex);
+        std::stable_sort(m_positions.sorted.begin() + first, m_positions.sorted.end(),
+                         [&coordinate](unsigned int a, unsigned int b) { return coordinate[a] < coordinate[b]; });
+        for (unsigned int k = first; k < m_positions.sorted.size(); k++)
+            m_positions.key.push_back(coordinate[m_positions.sorted[k]]);
     }
 
-    return modid;
+}
+
+//the range [first, last) in m_positions.sorted of the clusters of a module that can be within the cuts around a position:
+//found with binary searches along the sorted coordinate, the other cuts still have to be applied
+std::pair<unsigned int, unsigned int> ITclusterStream::candidateWindow(unsigned int index, const Global3DPoint& pos) const {
+
+    const bool sortY = m_modules[index].sortY;
+    const double center = sortY ? pos.y() : pos.x();
+    const double cut = sortY ? m_dy : m_dx;
+
+    std::vector<float>::const_iterator first = m_positions.key.begin() + m_positions.offset[index];
+    std::vector<float>::const_iterator last = m_positions.key.begin() + m_positions.offset[index + 1];
+    first = std::lower_bound(first, last, center - cut);
+    last = std::upper_bound(first, last, center + cut);
+    return std::make_pair(first - m_positions.key.begin(), last - m_positions.key.begin());
 
 }
 
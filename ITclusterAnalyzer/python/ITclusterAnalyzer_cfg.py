@@ -13,6 +13,11 @@ options.inputFiles = 'file:/afs/cern.ch/user/g/gauzinge/BIBSim/CMSSW_11_2_0_pre6
 # options.inputFiles = 'file:/afs/cern.ch/work/c/cbarrera/private/BRIL/outputDir/step3_pixel_PU_20.0.0.root'
 options.outputFile='summary.root'
 options.maxEvents = -1 #all events
+options.register ('nThreads',
+                                 1,
+                                 VarParsing.multiplicity.singleton,
+                                 VarParsing.varType.int,
+                  "The number of threads to use: 1")
 
 #get and parse command line arguments
 options.parseArguments()
@@ -37,6 +42,10 @@ process.options = cms.untracked.PSet(wantSummary=cms.untracked.bool(False)
                                     # ,SkipEvent = cms.untracked.vstring('ProductNotFound')
                                     )
 
+#Setup FWK for multithreaded, the analyzer runs one stream per thread
+process.options.numberOfThreads=cms.untracked.uint32(options.nThreads)
+process.options.numberOfStreams=cms.untracked.uint32(options.nThreads)
+
 process.maxEvents = cms.untracked.PSet(input=cms.untracked.int32(options.maxEvents))
 
 # the input file
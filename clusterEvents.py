@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function
+import numpy as np
+#chunked reader for the cluster trees
+import clusterTree
+#disk and ring codes of the clusters
+import clusterGeometry
+
+#per event grouping of the clusters in the cluster_tree (needs the CluEvent branch)
+#the analyzer fills the tree event by event, so the clusters of an event are a contiguous run of rows with the
+#same CluEvent; runs are used instead of the event numbers themselves, so merged trees of several jobs with
+#repeating event numbers still give one group per event
+#only events with at least one cluster are in the tree
+
+#the number of disks and rings per side of TEPX
+disks = len(clusterGeometry.zMaskRange)
+rings = len(clusterGeometry.rMaskRange)
+
+#the runs of equal event numbers: a dense code 0..nevents-1 for every cluster, the first row of every event
+#and the event numbers
+def eventCodes(events):
+    events = np.asarray(events)
+    if len(events) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), events
+    starts = np.flatnonzero(np.concatenate([[True], events[1:] != events[:-1]]))
+    codes = np.zeros(len(events), dtype=np.int64)
+    codes[starts[1:]] = 1
+    codes = np.cumsum(codes)
+    return codes, starts, events[starts]
+
+#the number of clusters per event and group (events, groups), clusters with a negative group are not counted
+def countsPerEvent(codes, group, groups, nevents=None):
+    if nevents is None:
+        nevents = codes[-1]+1 if len(codes) else 0
+    valid = group >= 0
+    flat = codes[valid]*groups + group[valid]
+    return np.bincount(flat, minlength=nevents*groups).reshape(nevents, groups)
+
+#the sum of a per cluster value for every event, e.g. the charge, starts as returned by eventCodes
+def sumPerEvent(values, starts):
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.asarray(values).dtype)
+    return np.add.reduceat(np.asarray(values), starts)
+
+#the group of a cluster: disk and ring per side in the order of the analyzer histograms, i.e. the minus side
+#disks first, (side*disks + disk-1)*rings + ring-1, -1 outside of all disks and rings
+#from the disk and ring codes and the side (0 for -z, 1 for +z)
+def groupCodes(disk, ring, side):
+    side = np.asarray(side).astype(np.int64)
+    inside = (disk > 0) & (ring > 0)
+    return np.where(inside, (side*disks + disk.astype(np.int64)-1)*rings + ring.astype(np.int64)-1, -1)
+
+#from the z/r windows
+def ringGroups(z, r):
+    disk, subdisk, ring = clusterGeometry.classifyClusters(z, r)
+    return groupCodes(disk, ring, np.asarray(z) > 0)
+
+#stream a cluster tree and count the clusters per event, side, disk and ring
+#returns the event numbers (events,) and the counts (events, 2*disks, rings) with the minus side disks first
+#an event that is split between two chunks is joined again
+#disk and ring come from the CluSide/CluDisk/CluRing branches if the tree has them, otherwise from the z/r windows
+def eventRingCounts(fileName, chunksize=clusterTree.chunksize):
+    groups = 2*disks*rings
+    numbers = []
+    counts = []
+    useModule = clusterTree.hasColumns(fileName, clusterGeometry.moduleColumns)
+    columns = ["CluEvent"] + (clusterGeometry.moduleColumns if useModule else clusterGeometry.positionColumns)
+    for chunk in clusterTree.iterateClusters(fileName, columns, chunksize):
+        codes, starts, events = eventCodes(chunk["CluEvent"])
+        if len(events) == 0:
+            continue
+        chunkcounts = countsPerEvent(codes, groupCodes(*clusterGeometry.chunkCodes(chunk)), groups, len(events))
+        if numbers and numbers[-1][-1] == events[0]:
+            #the first event of this chunk continues the last one of the previous chunk
+            counts[-1][-1] += chunkcounts[0]
+            events = events[1:]
+            chunkcounts = chunkcounts[1:]
+        if len(events):
+            numbers.append(events)
+            counts.append(chunkcounts)
+    if not numbers:
+        return np.zeros(0, dtype=np.uint64), np.zeros((0, 2*disks, rings), dtype=np.int64)
+    return np.concatenate(numbers), np.concatenate(counts).reshape(-1, 2*disks, rings)
+
+#the distribution of the number of clusters per event for every side, disk and ring: (..., maxcount+1),
+#like the "Number of clusters for Disk" histograms of the analyzer, counts above maxcount go to the last bin
+def countDistribution(counts, maxcount):
+    counts = np.asarray(counts)
+    shape = counts.shape[1:]
+    groups = int(np.prod(shape))
+    flat = np.arange(groups)*(maxcount+1) + np.minimum(counts.reshape(len(counts), groups), maxcount)
+    return np.bincount(flat.ravel(), minlength=groups*(maxcount+1)).reshape(shape+(maxcount+1,))
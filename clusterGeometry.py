@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function
+from collections import namedtuple
+import numpy as np
+
+#disk, sub-disk and ring windows of TEPX in |z| and r (in cm) and a classifier that turns the cluster
+#positions into int8 disk, sub-disk and ring codes with np.searchsorted on sorted edge tables
+#the codes are the keys of the windows (disk 1-4, sub-disk 1-4, ring 1-5) and -1 outside of all windows,
+#so selections become comparisons like disk == 2 instead of chains of np.logical_and/np.logical_or
+#both sides of the detector share the windows, the classification uses |z|
+
+# =====================
+# Geometrical Filters:
+# These will allow us to identify the disk/ring in which the cluster was found
+rMaskRange = { 
+    1:[6.5,9.7], 
+    2:[10.9,13.7], 
+    3:[14.5,17.3], 
+    4:[18.4,20.9], 
+    5:[21.9,25.3] 
+}
+
+zMaskRange = { 
+    1:[174,176], 
+    2:[200,202], 
+    3:[230,232], 
+    4:[264,266] 
+}
+
+zMaskRangeInner = {
+    1:{
+        1:[174  ,174.5],
+        2:[174.5,175  ],
+        3:[175  ,175.5],
+        4:[175.5,176 ]
+    },
+    2:{
+        1:[200  ,200.5],
+        2:[200.5,201  ],
+        3:[201  ,201.5],
+        4:[202.5,203  ]
+    },
+    3:{
+        1:[230  ,230.5],
+        2:[230.5,230.7],
+        3:[230.7,231.2],
+        4:[231.2,231.6]
+    },
+    4:{
+        1:[264  ,264.5],
+        2:[264.5,265  ],
+        3:[265  ,265.5],
+        4:[265.5,266   ]
+    }
+}
+    
+NRing = {
+    1:10,
+    2:14,
+    3:18,
+    4:22,
+    5:24
+}
+
+
+#a list of windows (low, high, code) as a sorted edge table [low1, high1, low2, high2, ...] and the codes of the windows
+def edgeTable(windows):
+    windows = sorted(windows)
+    edges = np.array([edge for (low, high, code) in windows for edge in (low, high)], dtype=np.float64)
+    if np.any(np.diff(edges) < 0):
+        raise ValueError("Overlapping or inverted windows: "+str(windows))
+    codes = np.array([code for (low, high, code) in windows], dtype=np.int8)
+    return edges, codes
+
+#the code of the window [low, high) every value is in, -1 if it isn't in any window
+#searchsorted gives an index in 0..2n for an edge table with 2n edges, odd indices are inside window index//2
+def lookup(values, edges, codes):
+    index = np.searchsorted(edges, values, side="right")
+    inside = index % 2 == 1
+    return np.where(inside, codes[np.minimum(index//2, len(codes)-1)], -1).astype(np.int8)
+
+diskEdges, diskCodes = edgeTable([(low, high, di) for (di, (low, high)) in zMaskRange.items()])
+ringEdges, ringCodes = edgeTable([(low, high, ri) for (ri, (low, high)) in rMaskRange.items()])
+#the sub-disks of all disks in a single table, the code is the sub-disk within its disk
+subdiskEdges, subdiskCodes = edgeTable([(low, high, si) for di in zMaskRangeInner for (si, (low, high)) in zMaskRangeInner[di].items()])
+
+#int8 disk, sub-disk and ring codes of clusters at z and r
+def classifyClusters(z, r):
+    az = np.abs(z)
+    return lookup(az, diskEdges, diskCodes), lookup(az, subdiskEdges, subdiskCodes), lookup(r, ringEdges, ringCodes)
+
+#the same codes from the CluSide, CluDisk and CluRing branches of the tree: TEPX disks are 9-12 in the
+#TrackerTopology numbering, the clusters of other disks get -1
+#returns the disk and ring codes and the side (0 for -z, 1 for +z)
+tepxFirstDisk = 9
+
+def codesFromBranches(side, disk, ring):
+    disk = np.asarray(disk).astype(np.int16)
+    tepx = (disk >= tepxFirstDisk) & (disk < tepxFirstDisk+len(zMaskRange))
+    diskCode = np.where(tepx, disk-tepxFirstDisk+1, -1).astype(np.int8)
+    ringCode = np.where(tepx, ring, -1).astype(np.int8)
+    return diskCode, ringCode, (np.asarray(side) == 2).astype(np.int8)
+
+#the disk and ring codes and the side of a chunk of the cluster tree {branch: array}: from the CluSide, CluDisk and
+#CluRing branches if the chunk has them, otherwise from the z/r windows (needs CluX, CluY and CluZ)
+moduleColumns = ["CluSide", "CluDisk", "CluRing"]
+positionColumns = ["CluX", "CluY", "CluZ"]
+
+def chunkCodes(chunk):
+    if all(column in chunk for column in moduleColumns):
+        return codesFromBranches(chunk["CluSide"], chunk["CluDisk"], chunk["CluRing"])
+    z = np.asarray(chunk["CluZ"], dtype=np.float64)
+    r = np.sqrt(np.asarray(chunk["CluX"], dtype=np.float64)**2 + np.asarray(chunk["CluY"], dtype=np.float64)**2)
+    disk, subdisk, ring = classifyClusters(z, r)
+    return disk, ring, (z > 0).astype(np.int8)
+
+#clusters grouped by disk and ring: the order that sorts the clusters by disk and ring and the offsets of the groups
+#group (di, ri) of the sorted clusters is [offsets[g], offsets[g+1]) with g = (di-1)*(rings+1)+ri, where ri = 0 holds
+#the clusters of the disk outside of all rings and the last group the clusters outside of all disks
+#the rings of a disk are contiguous, so every disk and ring selection is a slice of the sorted arrays
+GroupIndex = namedtuple("GroupIndex", ["order", "offsets", "disks", "rings"])
+
+def groupClusters(disk, ring, disks=len(zMaskRange), rings=len(rMaskRange)):
+    group = np.where(disk > 0, disk-1, disks).astype(np.int64)*(rings+1) + np.where(ring > 0, ring, 0)
+    #all clusters outside of the disks go to a single last group
+    group = np.minimum(group, disks*(rings+1))
+    order = np.argsort(group, kind="mergesort")
+    counts = np.bincount(group, minlength=disks*(rings+1)+1)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return GroupIndex(order, offsets, disks, rings)
+
+#the clusters of disk di and ring ri
+def ringSlice(index, di, ri):
+    group = (di-1)*(index.rings+1)+ri
+    return slice(index.offsets[group], index.offsets[group+1])
+
+#the clusters of disk di, only the ones in one of the rings with inRings
+def diskSlice(index, di, inRings=False):
+    first = (di-1)*(index.rings+1)
+    return slice(index.offsets[first+1 if inRings else first], index.offsets[first+index.rings+1])
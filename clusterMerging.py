@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function, division
+#get the OS features
+import os
+#command line parsing
+import argparse
+import multiprocessing
+from collections import OrderedDict
+import numpy as np
+#chunked reader for the cluster trees
+import clusterTree
+#disk and ring codes of the clusters
+import clusterGeometry
+#output without ROOT
+import resultsIO
+
+#merged cluster analysis: CluMerge is the number of sim tracks that contributed to a cluster, a cluster with
+#more than one is a merged cluster, which is counted once although several particles crossed the module
+#for every file the merge multiplicity spectra of all disks and rings are filled in a single pass with np.bincount,
+#streaming the tree in chunks so the memory doesn't depend on the size of the file
+#the merged fraction is the fraction of clusters with CluMerge >= 2 among the clusters with at least one sim track,
+#clusters without a sim track (CluMerge = 0) are counted in the spectra but not in the fraction
+
+disks = len(clusterGeometry.zMaskRange)
+rings = len(clusterGeometry.rMaskRange)
+#multiplicities above maxmerge are counted in the last bin of the spectra
+maxmerge = 10
+
+#the merge multiplicity spectra of a tree (disks, rings, maxmerge+1), both sides together
+def mergeSpectra(fileName, maxmerge=maxmerge, chunksize=clusterTree.chunksize):
+    spectra = np.zeros(disks*rings*(maxmerge+1), dtype=np.int64)
+    useModule = clusterTree.hasColumns(fileName, clusterGeometry.moduleColumns)
+    columns = ["CluMerge"] + (clusterGeometry.moduleColumns if useModule else clusterGeometry.positionColumns)
+    for chunk in clusterTree.iterateClusters(fileName, columns, chunksize):
+        disk, ring, side = clusterGeometry.chunkCodes(chunk)
+        valid = (disk > 0) & (ring > 0)
+        group = (disk[valid].astype(np.int64)-1)*rings + ring[valid].astype(np.int64)-1
+        merge = np.minimum(np.asarray(chunk["CluMerge"])[valid].astype(np.int64), maxmerge)
+        spectra += np.bincount(group*(maxmerge+1) + merge, minlength=len(spectra))
+    return spectra.reshape(disks, rings, maxmerge+1)
+
+#the merged fraction and its binomial error sqrt(f*(1-f)/n) for spectra (..., maxmerge+1), 0 without clusters
+def mergedFraction(spectra):
+    spectra = np.asarray(spectra, dtype=np.float64)
+    matched = spectra[..., 1:].sum(axis=-1)
+    merged = spectra[..., 2:].sum(axis=-1)
+    nonzero = matched > 0
+    safe = np.where(nonzero, matched, 1.)
+    fraction = np.where(nonzero, merged/safe, 0.)
+    return fraction, np.where(nonzero, np.sqrt(fraction*(1-fraction)/safe), 0.)
+
+#the mean number of sim tracks per matched cluster, 0 without clusters
+def meanMultiplicity(spectra):
+    spectra = np.asarray(spectra, dtype=np.float64)
+    multiplicity = np.arange(spectra.shape[-1])
+    matched = spectra[..., 1:].sum(axis=-1)
+    return np.where(matched > 0, (spectra*multiplicity).sum(axis=-1)/np.where(matched > 0, matched, 1.), 0.)
+
+def _spectraWorker(args):
+    (pu, fileName, maxmerge, chunksize) = args
+    return pu, mergeSpectra(fileName, maxmerge, chunksize)
+
+#the spectra of all PU points (points, disks, rings, maxmerge+1), the files are read by jobs worker processes
+#returns the pileup (points,) sorted and the spectra in the same order
+def mergingVsPU(files, jobs=1, maxmerge=maxmerge, chunksize=clusterTree.chunksize):
+    tasks = [(float(pu), fileName, maxmerge, chunksize) for (pu, fileName) in files.items()]
+    if jobs <= 1 or len(tasks) <= 1:
+        results = [_spectraWorker(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        try:
+            results = pool.map(_spectraWorker, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    results.sort(key=lambda result: result[0])
+    pileup = np.array([result[0] for result in results])
+    spectra = np.array([result[1] for result in results]).reshape(len(results), disks, rings, maxmerge+1)
+    return pileup, spectra
+
+#the merged fractions per disk and ring and for all of TEPX as resultsIO results
+def mergingResults(pileup, spectra):
+    results = OrderedDict()
+    (fraction, error) = mergedFraction(spectra)
+    multiplicity = meanMultiplicity(spectra)
+    for i in range(disks):
+        for j in range(rings):
+            results["Merged fraction Disk"+str(i+1)+"Ring"+str(j+1)] = OrderedDict([("pileup", pileup), ("fraction", fraction[:, i, j]),
+                                                                                    ("error", error[:, i, j]), ("multiplicity", multiplicity[:, i, j])])
+    total = spectra.sum(axis=(1, 2))
+    (fraction, error) = mergedFraction(total)
+    results["Merged fraction TEPX"] = OrderedDict([("pileup", pileup), ("fraction", fraction), ("error", error),
+                                                   ("multiplicity", meanMultiplicity(total))])
+    for (index, pu) in enumerate(pileup):
+        results["Merge spectrum TEPX PU"+str(pu)] = OrderedDict([("multiplicity", np.arange(total.shape[-1])), ("clusters", total[index])])
+    return results
+
+#merging vs PU per disk with one curve per ring, and the merge multiplicity spectra of all PU points
+def plotMerging(pileup, spectra, outPath):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    (fraction, error) = mergedFraction(spectra)
+    fig = plt.figure(figsize=(10,10))
+    for i in range(disks):
+        plt.subplot(2,2,i+1)
+        for j in range(rings):
+            plt.errorbar(pileup, fraction[:, i, j], yerr=error[:, i, j], fmt='o-', label='Ring '+str(j+1))
+        plt.title('Disk '+str(i+1))
+        plt.xlabel('Pileup')
+        plt.ylabel('Fraction of merged clusters')
+        plt.grid(linestyle='--')
+        plt.legend()
+    plt.tight_layout()
+    fig.savefig(outPath+'mergedFraction_vsPU.png')
+    plt.close(fig)
+
+    total = spectra.sum(axis=(1, 2))
+    fig = plt.figure(figsize=(10,7))
+    for (index, pu) in enumerate(pileup):
+        norm = total[index].sum() if total[index].sum() > 0 else 1.
+        plt.step(np.arange(total.shape[-1]), total[index]/norm, where='mid', label='PU '+str(pu))
+    plt.yscale('log')
+    plt.xlabel('# of sim tracks per cluster')
+    plt.ylabel('Fraction of clusters')
+    plt.grid(linestyle='--')
+    plt.legend()
+    fig.savefig(outPath+'mergeSpectrum_allPU.png')
+    plt.close(fig)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merged cluster fractions per disk, ring and PU from the cluster trees')
+    parser.add_argument('--pu', nargs='+', required=True, help='PU points, e.g. 10 50 200')
+    parser.add_argument('--path', nargs='+', required=True, help='input directory with the Cluster_<PU>.0_00.root files, a single one or one per PU point')
+    parser.add_argument('--out', default='clusterPlots/', help='output directory (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of files read in parallel')
+    parser.add_argument('--maxmerge', type=int, default=maxmerge, help='last bin of the multiplicity spectra (default: %(default)s)')
+    parser.add_argument('--chunksize', type=int, default=clusterTree.chunksize, help='number of clusters read at once (default: %(default)s)')
+    parser.add_argument('--format', default='csv', choices=resultsIO.formats, help='format of the results table')
+    parser.add_argument('--no-plots', dest='plots', action='store_false', help="don't draw the figures")
+    args = parser.parse_args()
+
+    paths = args.path*len(args.pu) if len(args.path) == 1 else args.path
+    if len(paths) != len(args.pu):
+        parser.error('give either a single input path or one per PU point')
+    files = OrderedDict((pu, os.path.join(path, 'Cluster_'+pu+'.0_00.root')) for (pu, path) in zip(args.pu, paths))
+    outPath = os.path.join(args.out, '')
+    if not os.path.isdir(outPath):
+        os.makedirs(outPath)
+
+    (pileup, spectra) = mergingVsPU(files, args.jobs, args.maxmerge, args.chunksize)
+    resultsIO.writeResults(outPath+'Results_Merging', mergingResults(pileup, spectra), args.format)
+    if args.plots:
+        plotMerging(pileup, spectra, outPath)
@@ -1,171 +1,286 @@
-from root_pandas import read_root
+import os
+import argparse
+import multiprocessing
+from collections import OrderedDict
 import numpy as np
-from ROOT import TFile,TTree
+# The figures are only saved, never shown: Agg renders without a display, also in worker processes
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-from scipy.optimize import minimize
 
-import pandas as pd
+# Chunked reader for the cluster trees
+import clusterTree
+# Disk, sub-disk and ring windows and the integer classifier
+import clusterGeometry
+from clusterGeometry import rMaskRange, zMaskRange, zMaskRangeInner, NRing
+# Mergeable histograms
+from histAccumulators import Hist1D, Hist2D, saveHistograms, loadHistograms, drawHist1D, drawHist2D
+# Parallel rendering of the figures
+import renderFigures
 
 # =====================
-# Variable, input data path
-# TO DO: Make them command line arguments!
+# Variable, input data path (defaults of the command line arguments)
 varSim    = "Cluster"
 Path      = '/afs/cern.ch/work/c/cbarrera/public/clusterData_Joseph/'
 OutPath   = 'clusterPlots/'
+# Number of clusters read at once, None reads the whole tree
+ChunkSize = clusterTree.chunksize
+# Convert the trees into the columnar cache on first use and memory map it afterwards
+Columnar  = True
+# Take disk and ring from the CluDisk/CluRing branches instead of the z/r windows if the tree has them
+ModuleBranches = True
 
 
 # =====================
-# Geometrical Filters:
-# These will allow us to identify the disk/ring in which the cluster was found
-rMaskRange = { 
-    1:[6.5,9.7], 
-    2:[10.9,13.7], 
-    3:[14.5,17.3], 
-    4:[18.4,20.9], 
-    5:[21.9,25.3] 
-}
-
-zMaskRange = { 
-    1:[174,176], 
-    2:[200,202], 
-    3:[230,232], 
-    4:[264,266] 
-}
-
-zMaskRangeInner = {
-    1:{
-        1:[174  ,174.5],
-        2:[174.5,175  ],
-        3:[175  ,175.5],
-        4:[175.5,176 ]
-    },
-    2:{
-        1:[200  ,200.5],
-        2:[200.5,201  ],
-        3:[201  ,201.5],
-        4:[202.5,203  ]
-    },
-    3:{
-        1:[230  ,230.5],
-        2:[230.5,230.7],
-        3:[231.7,231.2],
-        4:[231.2,231.6]
-    },
-    4:{
-        1:[264  ,264.5],
-        2:[264.5,265  ],
-        3:[265  ,265.5],
-        4:[265.5,266   ]
-    }
-}
-    
-NRing = {
-    1:10,
-    2:14,
-    3:18,
-    4:22,
-    5:24
-}
+# Fixed binning of the histograms, so that they can be filled chunk by chunk
+rBins     = 40
+rDiskRange = [rMaskRange[1][0], rMaskRange[5][1]]
+zrBins    = 300
+zrRange   = [[-300,300],[0,30]]
+zrRangePos = [[160,275],[0,30]]
+zrDiskBins = 100
+zrDisk    = 4
 
 
 # =====================
-# Cluster Studies
-PU = ['100']
+# Histograms: mergeable accumulators with fixed edges, keyed by name
+def ringName(di, ri):
+    return 'radialDist_D'+str(di)+'R'+str(ri)
+
+def diskName(di):
+    return 'radialDist_D'+str(di)
+
+def newHistograms():
+    hists = OrderedDict()
+    for di in zMaskRange:
+        for ri in rMaskRange:
+            hists[ringName(di,ri)] = Hist1D.uniform(rBins, rMaskRange[ri][0], rMaskRange[ri][1])
+    for di in zMaskRange:
+        hists[diskName(di)] = Hist1D.uniform(rBins, rDiskRange[0], rDiskRange[1])
+    hists['ZvsR'] = Hist2D.uniform(zrBins, zrRange[0], zrBins, zrRange[1])
+    hists['ZvsR_Pos'] = Hist2D.uniform(zrBins, zrRangePos[0], zrBins, zrRangePos[1])
+    hists['ZvsR_D'+str(zrDisk)] = Hist2D.uniform(zrDiskBins, zMaskRange[zrDisk], zrDiskBins, [0,30])
+    return hists
+
+# Add a chunk of clusters to the histograms
+# the clusters are sorted by disk and ring once, every disk and ring selection is a slice of the sorted arrays
+# disk and ring are the codes of the clusters if they are known already, otherwise they come from the z/r windows
+def fillHistograms(hists, z, r, disk=None, ring=None):
+    if disk is None or ring is None:
+        disk, subdisk, ring = clusterGeometry.classifyClusters(z, r)
+    index = clusterGeometry.groupClusters(disk, ring)
+    zSorted = z[index.order]
+    rSorted = r[index.order]
+    for di in zMaskRange:
+        for ri in rMaskRange:
+            hists[ringName(di,ri)].fill(rSorted[clusterGeometry.ringSlice(index, di, ri)])
+        # all rings of the disk
+        hists[diskName(di)].fill(rSorted[clusterGeometry.diskSlice(index, di, True)])
+    hists['ZvsR'].fill(z, r)
+    hists['ZvsR_Pos'].fill(z, r)
+    onDisk = clusterGeometry.diskSlice(index, zrDisk)
+    hists['ZvsR_D'+str(zrDisk)].fill(zSorted[onDisk], rSorted[onDisk])
+    return hists
+
+# Stream the cluster tree of a file in chunks into the histograms, only the coordinates
+# (and the module position if the tree has it) are read
+def studyClusters(fileName, chunkSize=ChunkSize):
+    hists = newHistograms()
+    nClusters = 0
+    moduleColumns = ['CluSide','CluDisk','CluRing']
+    useModule = ModuleBranches and clusterTree.hasColumns(fileName, moduleColumns)
+    columns = ['CluX','CluY','CluZ'] + (moduleColumns if useModule else [])
+    for chunk in clusterTree.iterateClusters(fileName, columns, chunkSize):
+        zP = chunk['CluZ']
+        rP = np.sqrt(chunk['CluX']**2 + chunk['CluY']**2)
+        if useModule:
+            disk, ring, side = clusterGeometry.codesFromBranches(chunk['CluSide'], chunk['CluDisk'], chunk['CluRing'])
+            fillHistograms(hists, zP, rP, disk, ring)
+        else:
+            fillHistograms(hists, zP, rP)
+        nClusters += len(zP)
+    print('Read', nClusters, 'clusters from', fileName)
+    return hists
 
-data = {}
-xP, yP, zP  = {},{},{}
-phiP, thetaP, mergeP, rP = {},{},{},{}
-
-Disk      = {}
-InnerDisk = {}
-Ring      = {}
-
-for pu in PU:
-
-    # Loading data
-    fileName = Path+varSim+'_'+pu+'.0_00.root'
-    treeName = varSim.lower()+'_tree'
-
-    data[pu] = read_root(fileName,treeName)
-
-    xP[pu]      = np.array(data[pu].CluX)
-    yP[pu]      = np.array(data[pu].CluY)
-    zP[pu]      = np.array(data[pu].CluZ)
-    phiP[pu]    = np.array(data[pu].CluPhi)
-    thetaP[pu]  = np.array(data[pu].CluTheta)
-    mergeP[pu]  = np.array(data[pu].CluMerge)
-    rP[pu]      = np.sqrt(xP[pu]**2 + yP[pu]**2)
-
-    # Identifying clusters per disk and ring
-    Disk[pu]      = {}
-    InnerDisk[pu] = {}
-    Ring[pu]      = {}
-    for zi in zMaskRange:
-        PosD = np.logical_and( zP[pu] >  zMaskRange[zi][0] , zP[pu] <  zMaskRange[zi][1])
-        NegD = np.logical_and( zP[pu] < -zMaskRange[zi][0] , zP[pu] > -zMaskRange[zi][1])
-        Disk[pu][zi]      = np.logical_or(PosD,NegD) 
-        InnerDisk[pu][zi] = {}
-        for inzi in zMaskRangeInner[zi]:
-            InnerPosD = np.logical_and( zP[pu] >  zMaskRangeInner[zi][inzi][0] , zP[pu] <  zMaskRangeInner[zi][inzi][1])
-            InnerNegD = np.logical_and( zP[pu] < -zMaskRangeInner[zi][inzi][0] , zP[pu] > -zMaskRangeInner[zi][inzi][1])
-            InnerNegD = InnerPosD 
-            InnerDisk[pu][zi][inzi] = np.logical_or(InnerPosD, InnerNegD)
-
-    for ri in rMaskRange:
-        Ring[pu][ri] = np.logical_and( rP[pu] > rMaskRange[ri][0] , rP[pu] < rMaskRange[ri][1])
-
-    # Drawing cluster distributions
-    # --Plot 1: Number of clusters as a function of r for each ring 
-    mask = []
+# The histograms of a PU point are kept next to the plots, so they can be re-drawn or
+# added up with other files without reading the trees again
+def histogramFile(pu, outPath=OutPath):
+    return outPath+'clusterHists_PU'+str(pu)+'.npz'
+
+
+# =====================
+# Drawing cluster distributions from the histogram counts
+# --Plot 1: Number of clusters as a function of r for each ring 
+def plotRadialPerRing(hists, pu, outPath=OutPath):
     n = 0
     fig = plt.figure(figsize=(10,10)) 
-    for di in Disk[pu]:
-        for ri in Ring[pu]:
-            mask = np.logical_and(Disk[pu][di],Ring[pu][ri])
+    for di in zMaskRange:
+        for ri in rMaskRange:
             n+=1
             plt.subplot(4,5,n)
-            hist = plt.hist(rP[pu][mask], bins = 40, histtype = 'step')
+            drawHist1D(hists[ringName(di,ri)])
             plt.title('Disk '+str(di)+' Ring '+str(ri))
             plt.xlabel('r [cm]')
             plt.ylabel('# of Clusters')
             plt.grid(linestyle='--')
     plt.tight_layout()
-    fig.savefig(OutPath+'radialDist-perRing_PU'+str(pu)+'.png')
+    fig.savefig(outPath+'radialDist-perRing_PU'+str(pu)+'.png')
+    plt.close(fig)
 
-    # --Plot 2: Number of clusters as a function of r for each disk
-    mask = []
+# --Plot 2: Number of clusters as a function of r for each disk
+def plotRadialPerDisk(hists, pu, outPath=OutPath):
     n = 0
     fig = plt.figure(figsize=(10,10))
-    for di in Disk[pu]:
-        mask = Disk[pu][di]
-        masking = Ring[pu][1]
-        for ri in range(2,len(Ring[pu])):
-            masking = np.logical_or(masking,Ring[pu][ri])
-        mask = np.logical_and(mask,masking)
+    for di in zMaskRange:
         n+=1
         plt.subplot(2,2,n)
-        hist = plt.hist(rP[pu][mask], bins = 40, histtype = 'step')
+        drawHist1D(hists[diskName(di)])
         plt.title('Disk '+str(di))
         plt.xlabel('r [cm]')
         plt.ylabel('# of Clusters')
         plt.grid(linestyle='--')
     plt.tight_layout()
-    fig.savefig(OutPath+'radialDist-perDisk_PU'+str(pu)+'.png')   
+    fig.savefig(outPath+'radialDist-perDisk_PU'+str(pu)+'.png')
+    plt.close(fig)
 
-    # --Plot 3: z vs r distribution
+# --Plot 3: z vs r distribution
+def plotZvsR(hists, pu, outPath=OutPath):
     fig = plt.figure(figsize=(20,10))
-    plt.hist2d(zP[pu],rP[pu],bins = 300,range = [[-300,300],[0,30]])
-    fig.savefig(OutPath+'ZvsR_PU'+str(pu)+'.png')
+    drawHist2D(hists['ZvsR'])
+    fig.savefig(outPath+'ZvsR_PU'+str(pu)+'.png')
+    plt.close(fig)
 
-    # --Plot 4: z vs r distribution (+ side)
+# --Plot 4: z vs r distribution (+ side)
+def plotZvsRPos(hists, pu, outPath=OutPath):
     fig = plt.figure(figsize=(20,10))
-    plt.hist2d(zP[pu],rP[pu],bins = 300,range = [[160,275],[0,30]])
-    fig.savefig(OutPath+'ZvsR_PU'+str(pu)+'_Pos.png')
+    drawHist2D(hists['ZvsR_Pos'])
+    fig.savefig(outPath+'ZvsR_PU'+str(pu)+'_Pos.png')
+    plt.close(fig)
+
+# --Plot 5: z vs r distribution (disk 4)
+def plotZvsRDisk(hists, pu, outPath=OutPath):
+    fig = plt.figure(figsize=(10,10))
+    drawHist2D(hists['ZvsR_D'+str(zrDisk)])
+    fig.savefig(outPath+'ZvsR_PU'+str(pu)+'_D'+str(zrDisk)+'.png')
+    plt.close(fig)
 
-    # --Plot 5: z vs r distribution (disk 4)
-    d = 4
-    mask = Disk[pu][d]
+# The figures of a PU point by name, so that they can be rendered one by one in parallel (see renderFigures.py)
+figures = OrderedDict([
+    ('radialDist-perRing', plotRadialPerRing),
+    ('radialDist-perDisk', plotRadialPerDisk),
+    ('ZvsR', plotZvsR),
+    ('ZvsR_Pos', plotZvsRPos),
+    ('ZvsR_D'+str(zrDisk), plotZvsRDisk),
+])
+
+def plotClusters(hists, pu, outPath=OutPath):
+    for plot in figures.values():
+        plot(hists, pu, outPath)
+
+# Render a single figure of a PU point from its saved histograms
+def renderFigure(name, pu, outPath=OutPath):
+    figures[name](loadHistograms(histogramFile(pu, outPath)), pu, outPath)
+
+
+# --Cross-PU comparison: radial distributions of all PU points per disk (normalised)
+#   and the number of clusters per ring as a function of PU
+def plotComparison(histsPU, outPath=OutPath):
+    pus = sorted(histsPU, key=float)
+    n = 0
     fig = plt.figure(figsize=(10,10))
-    plt.hist2d(zP[pu][mask],rP[pu][mask],bins = 100,range = [zMaskRange[d],[0,30]])
-    fig.savefig(OutPath+'ZvsR_PU'+str(pu)+'_D'+str(d)+'.png')
+    for di in zMaskRange:
+        n+=1
+        plt.subplot(2,2,n)
+        for pu in pus:
+            hist = histsPU[pu][diskName(di)]
+            norm = hist.sum() if hist.sum() > 0 else 1.
+            drawHist1D(Hist1D(hist.edges, hist.counts/norm), label = 'PU '+str(pu))
+        plt.title('Disk '+str(di))
+        plt.xlabel('r [cm]')
+        plt.ylabel('Fraction of Clusters')
+        plt.grid(linestyle='--')
+        plt.legend()
+    plt.tight_layout()
+    fig.savefig(outPath+'radialDist-perDisk_allPU.png')
+    plt.close(fig)
+
+    n = 0
+    fig = plt.figure(figsize=(10,10))
+    for di in zMaskRange:
+        n+=1
+        plt.subplot(2,2,n)
+        for ri in rMaskRange:
+            plt.plot([float(pu) for pu in pus], [histsPU[pu][ringName(di,ri)].sum() for pu in pus], 'o-', label = 'Ring '+str(ri))
+        plt.title('Disk '+str(di))
+        plt.xlabel('Pileup')
+        plt.ylabel('# of Clusters')
+        plt.grid(linestyle='--')
+        plt.legend()
+    plt.tight_layout()
+    fig.savefig(outPath+'nClusters-perRing_vsPU.png')
+    plt.close(fig)
+
+
+# =====================
+# Cluster Studies
+PU = ['100']
+
+# The input file of a PU point
+def clusterFile(pu, path=Path):
+    return os.path.join(path, varSim+'_'+pu+'.0_00.root')
+
+# Process a single PU point into its histograms, run in a worker process
+def processPU(args):
+    pu, fileName, outPath, chunkSize, columnar = args
+    if columnar:
+        clusterTree.ensureColumns(fileName, chunksize = chunkSize)
+    hists = studyClusters(fileName, chunkSize)
+    saveHistograms(histogramFile(pu, outPath), hists)
+    return pu
+
+# Render the cross-PU comparison from the saved histograms
+def renderComparison(pus, outPath=OutPath):
+    plotComparison(OrderedDict((pu, loadHistograms(histogramFile(pu, outPath))) for pu in pus), outPath)
+
+# The rendering tasks of all figures for renderFigures.renderAll: every figure of every PU point and the comparison
+def figureTasks(pus, outPath=OutPath):
+    tasks = [(renderFigure, (name, pu, outPath)) for pu in pus for name in figures]
+    return tasks + [(renderComparison, (list(pus), outPath))]
+
+# Process all PU points with jobs worker processes, then render all figures from the histograms
+# with the same number of processes
+def runStudies(pus, paths, outPath=OutPath, jobs=1, chunkSize=ChunkSize, columnar=Columnar):
+    if len(paths) == 1:
+        paths = paths*len(pus)
+    elif len(paths) != len(pus):
+        raise ValueError('Give either a single input path or one per PU point')
+    if not os.path.isdir(outPath):
+        os.makedirs(outPath)
+    tasks = [(pu, clusterFile(pu, path), outPath, chunkSize, columnar) for (pu, path) in zip(pus, paths)]
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            processPU(task)
+    else:
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        try:
+            for pu in pool.imap_unordered(processPU, tasks):
+                print('Done with PU', pu)
+        finally:
+            pool.close()
+            pool.join()
+    # The figures only need the saved histograms
+    renderFigures.renderAll(figureTasks(pus, outPath), jobs)
+    return OrderedDict((pu, loadHistograms(histogramFile(pu, outPath))) for pu in pus)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cluster studies of the cluster trees for several PU points')
+    parser.add_argument('--pu', nargs='+', default=PU, help='PU points, e.g. 0.5 10 200 (default: %(default)s)')
+    parser.add_argument('--path', nargs='+', default=[Path], help='input directory with the '+varSim+'_<PU>.0_00.root files, a single one or one per PU point')
+    parser.add_argument('--out', default=OutPath, help='output directory for the plots and histograms (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of PU points processed in parallel')
+    parser.add_argument('--chunksize', type=int, default=ChunkSize, help='number of clusters read at once (default: %(default)s)')
+    parser.add_argument('--no-columnar', dest='columnar', action='store_false', help='read the ROOT files directly instead of the columnar cache')
+    args = parser.parse_args()
+
+    outPath = os.path.join(args.out, '')
+    runStudies(args.pu, args.path, outPath, args.jobs, args.chunksize, args.columnar)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function
+#get the OS features
+import os, sys, json, hashlib
+import numpy as np
+
+#streaming access to the cluster_tree written by the ITclusterAnalyzer (Cluster_*.root)
+#the tree is read in chunks of a fixed number of clusters and only the requested branches are read,
+#so the memory needed stays the same whatever the size of the file
+#the tree is read with uproot or root_pandas, see backend below
+#a tree can also be converted once into a columnar cache with compact types (see convertTree), that is then
+#memory mapped instead of reading the ROOT file
+
+treename = "cluster_tree"
+#the branches of the tree, the event number and DetId are only in trees of newer analyzer versions
+branches = ["CluX", "CluY", "CluZ", "CluTheta", "CluPhi", "CluCharge", "CluArea", "CluSize", "CluMerge", "CluNum"]
+eventBranches = ["CluEvent", "CluDetId"]
+#side (1 = -z, 2 = +z), disk (TrackerTopology numbering, 9-12 for TEPX), ring and module of the cluster's module
+moduleBranches = ["CluSide", "CluDisk", "CluRing", "CluModule"]
+#number of clusters per chunk, can be changed with the CLUSTERCHUNKSIZE environment variable
+chunksize = int(os.environ.get("CLUSTERCHUNKSIZE", 1000000))
+
+#reader for the cluster trees: uproot, root_pandas, or auto to use uproot if it is installed and root_pandas otherwise
+backend = os.environ.get("CLUSTERBACKEND", "auto")
+
+def _useUproot():
+    if backend == "auto":
+        try:
+            import uproot
+            return True
+        except ImportError:
+            return False
+    return backend == "uproot"
+
+#the branches a tree has
+def availableBranches(fileName, treeName=treename):
+    if _useUproot():
+        import uproot
+        with uproot.open(fileName) as rootfile:
+            return list(rootfile[treeName].keys())
+    #root_pandas reads the trees with root_numpy
+    from root_numpy import list_branches
+    return list(list_branches(fileName, treeName))
+
+#read the tree in chunks {branch: 1D array} with the requested columns
+#chunksize None reads the whole tree as a single chunk
+def _iterateTree(fileName, columns, chunksize=chunksize, treeName=treename):
+    columns = list(columns)
+    if _useUproot():
+        import uproot
+        if chunksize is None:
+            with uproot.open(fileName) as rootfile:
+                arrays = rootfile[treeName].arrays(columns, library="np")
+            yield dict((column, np.asarray(arrays[column])) for column in columns)
+            return
+        for arrays in uproot.iterate(fileName+":"+treeName, columns, step_size=chunksize, library="np"):
+            yield dict((column, np.asarray(arrays[column])) for column in columns)
+    else:
+        from root_pandas import read_root
+        if chunksize is None:
+            frames = [read_root(fileName, treeName, columns=columns)]
+        else:
+            frames = read_root(fileName, treeName, columns=columns, chunksize=chunksize)
+        for frame in frames:
+            yield dict((column, frame[column].values) for column in columns)
+
+#columnar cache: one raw binary file per branch and a JSON file with the metadata in a directory per tree,
+#keyed by the absolute path of the ROOT file and invalidated as soon as its mtime or size change
+#the location of the cache can be changed with the CLUSTERCACHE environment variable
+cachedir = os.environ.get("CLUSTERCACHE", ".clusterCache")
+
+#the types in the cache: float32 for the positions, angles and charge, uint16 for size and area, uint8 for the merging
+#values that don't fit into the type are clipped
+columntypes = {"CluX": "float32", "CluY": "float32", "CluZ": "float32", "CluTheta": "float32", "CluPhi": "float32",
+               "CluCharge": "float32", "CluArea": "uint16", "CluSize": "uint16", "CluMerge": "uint8", "CluNum": "uint32",
+               "CluEvent": "uint64", "CluDetId": "uint32",
+               "CluSide": "uint8", "CluDisk": "uint8", "CluRing": "uint8", "CluModule": "uint16"}
+
+def _cacheDirectory(fileName):
+    path = os.path.abspath(fileName)
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cachedir, digest+"_"+os.path.basename(path))
+
+def _fileStamp(fileName):
+    stat = os.stat(fileName)
+    return [stat.st_mtime, stat.st_size]
+
+def _toType(values, dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind in "ui":
+        limits = np.iinfo(dtype)
+        values = np.clip(np.rint(values), limits.min, limits.max)
+    return np.asarray(values).astype(dtype)
+
+#the metadata of the columnar cache of a tree, None if there is none or it is outdated
+def cacheMetadata(fileName, treeName=treename):
+    metafile = os.path.join(_cacheDirectory(fileName), "meta.json")
+    if not os.path.exists(metafile):
+        return None
+    with open(metafile) as meta:
+        metadata = json.load(meta)
+    if metadata["stamp"] != _fileStamp(fileName) or metadata["tree"] != treeName:
+        return None
+    return metadata
+
+#convert the tree into the columnar cache, chunk by chunk, the metadata is written last so
+#an interrupted conversion is never used
+#columns None converts all the branches of the tree that are in branches, eventBranches and moduleBranches
+def convertTree(fileName, columns=None, chunksize=chunksize, treeName=treename):
+    if columns is None:
+        available = availableBranches(fileName, treeName)
+        columns = [column for column in branches+eventBranches+moduleBranches if column in available]
+    directory = _cacheDirectory(fileName)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    metafile = os.path.join(directory, "meta.json")
+    if os.path.exists(metafile):
+        os.remove(metafile)
+    stamp = _fileStamp(fileName)
+    outputs = dict((column, open(os.path.join(directory, column+".bin"), "wb")) for column in columns)
+    entries = 0
+    try:
+        for chunk in _iterateTree(fileName, columns, chunksize, treeName):
+            for column in columns:
+                _toType(chunk[column], columntypes.get(column, "float64")).tofile(outputs[column])
+            entries += len(chunk[columns[0]])
+    finally:
+        for output in outputs.values():
+            output.close()
+    metadata = {"source": os.path.abspath(fileName), "tree": treeName, "stamp": stamp, "entries": entries,
+                "columns": dict((column, columntypes.get(column, "float64")) for column in columns)}
+    with open(metafile, "w") as meta:
+        json.dump(metadata, meta, indent=1)
+    print("Converted", entries, "clusters of", fileName, "to", directory)
+    return metadata
+
+#the cached columns of a tree as read-only memory maps {branch: array}
+def loadColumns(fileName, columns=None, treeName=treename):
+    metadata = cacheMetadata(fileName, treeName)
+    if metadata is None:
+        raise IOError("No up to date columnar cache for "+fileName+", run convertTree first")
+    if columns is None:
+        columns = list(metadata["columns"].keys())
+    directory = _cacheDirectory(fileName)
+    arrays = {}
+    for column in columns:
+        if metadata["entries"] == 0:
+            #an empty file can't be memory mapped
+            arrays[column] = np.zeros(0, dtype=metadata["columns"][column])
+        else:
+            arrays[column] = np.memmap(os.path.join(directory, column+".bin"), dtype=metadata["columns"][column],
+                                       mode="r", shape=(metadata["entries"],))
+    return arrays
+
+#convert the tree unless there is an up to date cache with all the columns (all the available ones for None)
+def ensureColumns(fileName, columns=None, chunksize=chunksize, treeName=treename):
+    metadata = cacheMetadata(fileName, treeName)
+    if metadata is None or (columns is not None and not set(columns).issubset(metadata["columns"])):
+        metadata = convertTree(fileName, columns, chunksize, treeName)
+    return metadata
+
+#whether the tree has all the columns, from the columnar cache if it is up to date
+def hasColumns(fileName, columns, treeName=treename):
+    metadata = cacheMetadata(fileName, treeName)
+    if metadata is not None and set(columns).issubset(metadata["columns"]):
+        return True
+    return set(columns).issubset(availableBranches(fileName, treeName))
+
+#iterate over the tree in chunks {branch: 1D array} with the requested columns
+#the chunks come from the columnar cache if it is up to date and has all columns, otherwise from the ROOT file
+#chunksize None reads the whole tree as a single chunk
+def iterateClusters(fileName, columns, chunksize=chunksize, treeName=treename):
+    columns = list(columns)
+    metadata = cacheMetadata(fileName, treeName)
+    if metadata is not None and set(columns).issubset(metadata["columns"]):
+        arrays = loadColumns(fileName, columns, treeName)
+        step = metadata["entries"] if chunksize is None else chunksize
+        for start in range(0, metadata["entries"], max(step, 1)):
+            #slices of the memory maps, nothing is copied
+            yield dict((column, arrays[column][start:start+step]) for column in columns)
+        return
+    for chunk in _iterateTree(fileName, columns, chunksize, treeName):
+        yield chunk
+
+if __name__ == '__main__':
+    #convert trees into the columnar cache: clusterTree.py file [file ...]
+    for fileName in sys.argv[1:]:
+        convertTree(fileName)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function
+from collections import OrderedDict
+import numpy as np
+
+#binned accumulators with fixed edges for the cluster studies
+#they are filled chunk by chunk with np.searchsorted and np.bincount, can be added up across chunks, files and
+#worker processes, saved to and loaded from NPZ, and the plots are drawn from the counts only
+#the binning follows np.histogram: bins are [low, high) except the last one, which includes its upper edge,
+#values outside of the edges are not counted
+
+#the bin of every value, -1 outside of the edges
+def _binIndex(values, edges):
+    index = np.searchsorted(edges, values, side="right")-1
+    #the upper edge belongs to the last bin
+    index[values == edges[-1]] = len(edges)-2
+    index[(index < 0) | (index > len(edges)-2)] = -1
+    return index
+
+class Hist1D(object):
+    def __init__(self, edges, counts=None):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges)-1) if counts is None else np.asarray(counts, dtype=np.float64)
+
+    @classmethod
+    def uniform(cls, nbins, low, high):
+        return cls(np.linspace(low, high, nbins+1))
+
+    def fill(self, values, weights=None):
+        index = _binIndex(np.asarray(values, dtype=np.float64), self.edges)
+        inside = index >= 0
+        self.counts += np.bincount(index[inside], weights=None if weights is None else np.asarray(weights)[inside],
+                                   minlength=len(self.counts))
+        return self
+
+    def centers(self):
+        return 0.5*(self.edges[1:]+self.edges[:-1])
+
+    def sum(self):
+        return self.counts.sum()
+
+    def __iadd__(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot add histograms with different binning")
+        self.counts += other.counts
+        return self
+
+    def __add__(self, other):
+        return Hist1D(self.edges, self.counts.copy()).__iadd__(other)
+
+class Hist2D(object):
+    def __init__(self, xedges, yedges, counts=None):
+        self.xedges = np.asarray(xedges, dtype=np.float64)
+        self.yedges = np.asarray(yedges, dtype=np.float64)
+        shape = (len(self.xedges)-1, len(self.yedges)-1)
+        self.counts = np.zeros(shape) if counts is None else np.asarray(counts, dtype=np.float64)
+
+    @classmethod
+    def uniform(cls, nxbins, xrange, nybins, yrange):
+        return cls(np.linspace(xrange[0], xrange[1], nxbins+1), np.linspace(yrange[0], yrange[1], nybins+1))
+
+    def fill(self, x, y, weights=None):
+        xindex = _binIndex(np.asarray(x, dtype=np.float64), self.xedges)
+        yindex = _binIndex(np.asarray(y, dtype=np.float64), self.yedges)
+        inside = (xindex >= 0) & (yindex >= 0)
+        #one bincount over the flattened (x, y) bin
+        flat = xindex[inside]*self.counts.shape[1] + yindex[inside]
+        self.counts += np.bincount(flat, weights=None if weights is None else np.asarray(weights)[inside],
+                                   minlength=self.counts.size).reshape(self.counts.shape)
+        return self
+
+    def sum(self):
+        return self.counts.sum()
+
+    def __iadd__(self, other):
+        if not (np.array_equal(self.xedges, other.xedges) and np.array_equal(self.yedges, other.yedges)):
+            raise ValueError("Cannot add histograms with different binning")
+        self.counts += other.counts
+        return self
+
+    def __add__(self, other):
+        return Hist2D(self.xedges, self.yedges, self.counts.copy()).__iadd__(other)
+
+#add up dictionaries {name: histogram} from several chunks, files or workers
+def mergeHistograms(histograms):
+    merged = OrderedDict()
+    for hists in histograms:
+        for (name, hist) in hists.items():
+            merged[name] = merged[name]+hist if name in merged else hist
+    return merged
+
+#save a dictionary {name: histogram} as "<name>/counts", "<name>/edges" or "<name>/xedges" and "<name>/yedges"
+def saveHistograms(filename, hists):
+    arrays = {}
+    for (name, hist) in hists.items():
+        arrays[name+"/counts"] = hist.counts
+        if isinstance(hist, Hist2D):
+            arrays[name+"/xedges"] = hist.xedges
+            arrays[name+"/yedges"] = hist.yedges
+        else:
+            arrays[name+"/edges"] = hist.edges
+    np.savez(filename, **arrays)
+
+def loadHistograms(filename):
+    hists = OrderedDict()
+    with np.load(filename) as npz:
+        names = []
+        for key in npz.files:
+            name = key.rsplit("/", 1)[0]
+            if name not in names:
+                names.append(name)
+        for name in names:
+            if name+"/xedges" in npz.files:
+                hists[name] = Hist2D(npz[name+"/xedges"], npz[name+"/yedges"], npz[name+"/counts"])
+            else:
+                hists[name] = Hist1D(npz[name+"/edges"], npz[name+"/counts"])
+    return hists
+
+#draw the histograms from their counts with matplotlib, on the current axes if none are given
+def drawHist1D(hist, axes=None, **options):
+    if axes is None:
+        import matplotlib.pyplot as plt
+        axes = plt.gca()
+    options.setdefault("histtype", "step")
+    return axes.hist(hist.edges[:-1], bins=hist.edges, weights=hist.counts, **options)
+
+#the map is rasterized by default, so large maps don't end up as one vector path per bin
+def drawHist2D(hist, axes=None, **options):
+    if axes is None:
+        import matplotlib.pyplot as plt
+        axes = plt.gca()
+    options.setdefault("rasterized", True)
+    return axes.pcolormesh(hist.xedges, hist.yedges, hist.counts.T, **options)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function, division
+import math
+from collections import namedtuple
+import numpy as np
+
+#batched weighted straight line fits y = slope*x + intercept for many graphs at once
+#x, y and sigma are arrays of shape (graphs, points), x can also be a single (points,) array shared by all graphs
+#points with a NaN in x or y are ignored, so graphs with different numbers of points can be stacked
+#slope and intercept correspond to [0] and [1] of the "[0]*x+[1]" TF1 used so far
+#covariance has the shape (graphs, 2, 2) in the order (slope, intercept) and is not scaled by chi2/ndf
+LinearFit = namedtuple("LinearFit", ["slope", "intercept", "covariance", "chi2", "ndf"])
+
+#fit all graphs, only points with fitrange[0] <= x <= fitrange[1] are used if a fitrange is given
+#the weights are 1/sigma^2 like for a TGraphErrors fit, points with zero error are skipped
+#unless all errors of a graph are zero, then the graph is fitted with unit weights
+def fitLinear(x, y, sigma=None, fitrange=None):
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    x = np.broadcast_to(np.asarray(x, dtype=np.float64), y.shape)
+    if sigma is None:
+        sigma = np.zeros(y.shape)
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=np.float64), y.shape)
+
+    used = np.isfinite(x) & np.isfinite(y)
+    if fitrange is not None:
+        used &= (x >= fitrange[0]) & (x <= fitrange[1])
+    haserror = used & (sigma > 0)
+    unweighted = ~haserror.any(axis=-1, keepdims=True)
+    weights = np.where(haserror, 1./np.where(haserror, sigma, 1.)**2, 0.)
+    weights = np.where(unweighted & used, 1., weights)
+    #zero the unused points so that NaNs don't propagate into the sums
+    x0 = np.where(used, x, 0.)
+    y0 = np.where(used, y, 0.)
+
+    s = weights.sum(axis=-1)
+    sx = (weights*x0).sum(axis=-1)
+    sy = (weights*y0).sum(axis=-1)
+    sxx = (weights*x0*x0).sum(axis=-1)
+    sxy = (weights*x0*y0).sum(axis=-1)
+    det = s*sxx - sx*sx
+    #less than two distinct points: the line is undefined
+    valid = det > 0
+    det = np.where(valid, det, np.nan)
+
+    slope = (s*sxy - sx*sy)/det
+    intercept = (sxx*sy - sx*sxy)/det
+    covariance = np.empty(slope.shape+(2, 2))
+    covariance[..., 0, 0] = s/det
+    covariance[..., 1, 1] = sxx/det
+    covariance[..., 0, 1] = -sx/det
+    covariance[..., 1, 0] = -sx/det
+
+    residuals = np.where(used, y0 - slope[..., np.newaxis]*x0 - intercept[..., np.newaxis], 0.)
+    chi2 = (weights*residuals**2).sum(axis=-1)
+    #only the points that carry weight count, zero error points are skipped unless the graph has no errors at all
+    ndf = np.where(unweighted, used, haserror).sum(axis=-1) - 2
+    return LinearFit(slope, intercept, covariance, chi2, ndf)
+
+#value of the fitted lines at x, shape (graphs, points)
+def evaluate(fit, x):
+    x = np.asarray(x, dtype=np.float64)
+    return fit.slope[..., np.newaxis]*x + fit.intercept[..., np.newaxis]
+
+#student t quantile for the probability p > 0.5 and ndf degrees of freedom
+#Newton iterations on the numerically integrated density, which converge monotonically from t=0
+def studentQuantile(p, ndf):
+    norm = math.exp(math.lgamma((ndf+1)/2.) - math.lgamma(ndf/2.))/math.sqrt(ndf*math.pi)
+    def density(t):
+        return norm*(1 + t*t/ndf)**(-(ndf+1)/2.)
+    def cumulative(t):
+        #simpson rule on [0, t]
+        nodes = np.linspace(0., t, 2001)
+        values = density(nodes)
+        h = t/2000.
+        return 0.5 + h/3.*(values[0] + values[-1] + 4*values[1:-1:2].sum() + 2*values[2:-1:2].sum())
+    t = 0.
+    for iteration in range(100):
+        step = (cumulative(t) - p)/density(t)
+        t -= step
+        if abs(step) < 1e-10*max(1., t):
+            break
+    return t
+
+#half width of the confidence band of the fitted lines at x, shape (graphs, points)
+#the same definition as TVirtualFitter::GetConfidenceIntervals: the error of the line from the covariance,
+#scaled with sqrt(chi2/ndf) and the student t quantile of the confidence level
+def confidenceBand(fit, x, cl=0.95):
+    x = np.asarray(x, dtype=np.float64)
+    variance = (fit.covariance[..., 0, 0, np.newaxis]*x*x + 2*fit.covariance[..., 0, 1, np.newaxis]*x
+                + fit.covariance[..., 1, 1, np.newaxis])
+    #one quantile per distinct number of degrees of freedom, graphs without any are NaN
+    quantile = np.full(fit.ndf.shape, np.nan)
+    for ndf in np.unique(fit.ndf):
+        if ndf > 0:
+            quantile[fit.ndf == ndf] = studentQuantile(0.5 + cl/2., ndf)
+    scale = quantile*np.sqrt(fit.chi2/np.where(fit.ndf > 0, fit.ndf, np.nan))
+    return scale[..., np.newaxis]*np.sqrt(np.maximum(variance, 0.))
+
+#relative deviation of the points from the fitted lines in percent, 0 where the line is 0
+def relativeNonlinearity(fit, x, y):
+    expect = evaluate(fit, x)
+    nonzero = expect != 0
+    return np.where(nonzero, (np.asarray(y) - expect)/np.where(nonzero, expect, 1.), 0.)*100
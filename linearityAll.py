@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function
+#command line parsing
+import argparse
+#shared extraction and writing of the linearity results
+import linearityTools
+import resultsIO
+
+#single pass over all summary files: every summary_PU_*.root is opened once and all observables
+#(Clusters, Hits, 2x/3x sum and real, 2x in R) of TEPX and TFPX are extracted from it
+#writes all the Results_*.root files of linearity.py, linearity_TFPX.py and linearity-OverlapInR(_TFPX).py
+#or the same results as NPZ, CSV or JSON without ROOT
+#with --incremental only new or changed summary files are read, the rest comes from the results store
+
+# def main():
+parser = argparse.ArgumentParser(description="Linearity results for all observables of TEPX and TFPX")
+parser.add_argument("path", nargs="?", default="/afs/cern.ch/user/g/gauzinge/ITsim/mySummaryPlots/",
+                    help="directory with the summary_PU_*.root files")
+parser.add_argument("jobs", nargs="?", type=int, default=1, help="number of parallel worker processes")
+parser.add_argument("format", nargs="?", default="root", choices=["root"]+resultsIO.formats, help="output format")
+parser.add_argument("--incremental", nargs="?", const=linearityTools.storefile, default=None, metavar="STORE",
+                    help="keep the extracted statistics in STORE and only process new or changed files (default store: %(const)s)")
+args = parser.parse_args()
+
+print("Filepath", args.path, "Jobs:", args.jobs, "Format:", args.format)
+#now get the files in the path
+files = linearityTools.getFiles(args.path)
+print(files)
+
+names = list(linearityTools.observables.keys())
+if args.incremental is not None:
+    points = linearityTools.extractIncremental(files, names, args.jobs, args.incremental)
+else:
+    points = linearityTools.extractAll(files, names, args.jobs)
+
+#the fits are always redone with all points, the output files are written in parallel
+linearityTools.writeAll(points, args.format, args.jobs)
@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function, division
+#get the OS features
+import os
+import multiprocessing
+from collections import OrderedDict
+import numpy as np
+#cached access to the summary histograms
+import summaryCache
+#vectorized per ring statistics
+import ringStats
+#batched linear fits
+import linearFit
+#output without ROOT
+import resultsIO
+#parallel writing of the outputs
+import renderFigures
+
+#ROOT is only needed for the ROOT output, so it is imported on first use
+root = None
+def _importRoot():
+    global root
+    if root is None:
+        import ROOT
+        root = ROOT
+        #the canvases are only written to files, no windows
+        root.gROOT.SetBatch(True)
+    return root
+
+#shared pieces of the linearity scripts so that all observables of both detectors can be
+#extracted in a single pass over every summary file (see linearityAll.py)
+
+#number of disks and rings per detector
+layouts = {"TEPX": (4, 5), "TFPX": (8, 4)}
+
+#the histograms of the summary files: observable -> (detector, directory, histogram name)
+def _buildObservables():
+    observables = OrderedDict()
+    for detector in ["TEPX", "TFPX"]:
+        observables[detector+" Clusters"] = (detector, "BRIL_IT_Analysis/"+detector+"/Clusters", "Number of clusters for Disk ")
+        observables[detector+" Hits"] = (detector, "BRIL_IT_Analysis/"+detector+"/Hits", "Number of hits for Disk ")
+        for nCoincidences in [2, 3]:
+            directory = "BRIL_IT_Analysis/"+detector+"/"+str(nCoincidences)+"xCoincidences"
+            observables[detector+" "+str(nCoincidences)+"x"] = (detector, directory, "Number of "+str(nCoincidences)+"x Coincidences for Disk ")
+            observables[detector+" real "+str(nCoincidences)+"x"] = (detector, directory, "Number of real "+str(nCoincidences)+"x Coincidences for Disk ")
+        directory = "BRIL_IT_Analysis/"+detector+"/2xCoincidences"
+        observables[detector+" 2x in R"] = (detector, directory, "Number of 2x Coincidences in R for Disk ")
+        observables[detector+" real 2x in R"] = (detector, directory, "Number of real 2x Coincidences in R for Disk ")
+    return observables
+
+observables = _buildObservables()
+
+#the summary_PU_*.root files in path, sorted by name
+def getFiles(path):
+    files = [item for item in os.listdir(path) if item.startswith("summary_PU_") and item.endswith(".root")]
+    files.sort()
+    return [os.path.join(path, item) for item in files]
+
+#the histogram keys of an observable as {-disk: key, disk: key}
+def observableKeys(name):
+    (detector, directory, histname) = observables[name]
+    return summaryCache.diskHistKeys(directory, histname, layouts[detector][0])
+
+#read all requested observables of a summary file at once and get their per ring statistics
+#returns the pileup and {observable: RingStats}, observables with missing histograms are left out
+def extractStatistics(file, names):
+    pileup = summaryCache.getPileup(file)
+    print("Found a root file for pileup", pileup, "in file", file, "Objects:", len(names), "observables")
+
+    keys = dict((name, observableKeys(name)) for name in names)
+    allkeys = [key for name in names for key in keys[name].values()]
+    #one TFile::Open at most, and none at all if everything is cached already
+    hists = summaryCache.loadHistograms(file, allkeys)
+
+    stats = {}
+    for name in names:
+        (disks, rings) = layouts[observables[name][0]]
+        if any(key not in hists for key in keys[name].values()):
+            print("Histograms for", name, "not found in", file, "skipping")
+            continue
+        diskhists = dict((disk, hists[key]) for disk, key in keys[name].items())
+        stats[name] = ringStats.diskRingStatistics(diskhists, disks, rings)
+    return (pileup, stats)
+
+def _extractWorker(args):
+    (file, names) = args
+    return extractStatistics(file, names)
+
+#extract the statistics of all (file, names) tasks with jobs worker processes, in the order of the tasks
+def _extractTasks(tasks, jobs=1):
+    if jobs <= 1 or len(tasks) <= 1:
+        return [_extractWorker(task) for task in tasks]
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    try:
+        return pool.map(_extractWorker, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+#extract the statistics of all files with jobs worker processes, in the order of files
+def _extractFiles(files, names, jobs=1):
+    return _extractTasks([(file, names) for file in files], jobs)
+
+#extract the statistics of all files with jobs worker processes
+#the points are returned sorted by pileup independent of the order in which the workers finish
+def extractAll(files, names, jobs=1):
+    points = _extractFiles(files, names, jobs)
+    points.sort(key=lambda point: point[0])
+    return points
+
+#results store of the extracted statistics for the incremental mode
+#one NPZ with the file stamp (mtime, size), the pileup, the requested observables and the RingStats of every summary file
+#it only holds a few numbers per disk and ring, so it can be kept next to the results
+storefile = os.environ.get("LINEARITYSTORE", "linearityStore.npz")
+
+#{absolute path: (stamp, pileup, requested observables, {observable: RingStats})}
+def loadStore(filename=None):
+    filename = filename or storefile
+    store = {}
+    if not os.path.exists(filename):
+        return store
+    with np.load(filename) as npz:
+        for (index, path) in enumerate(npz["files"]):
+            prefix = str(index)+"/"
+            requested = [str(name) for name in npz[prefix+"requested"]]
+            stats = {}
+            for name in requested:
+                if prefix+name+"/mean" in npz.files:
+                    stats[name] = ringStats.RingStats(*[npz[prefix+name+"/"+field] for field in ringStats.RingStats._fields])
+            store[str(path)] = (npz[prefix+"stamp"], float(npz[prefix+"pileup"]), requested, stats)
+    return store
+
+def saveStore(store, filename=None):
+    filename = filename or storefile
+    paths = sorted(store.keys())
+    arrays = {"files": np.array(paths)}
+    for (index, path) in enumerate(paths):
+        (stamp, pileup, requested, stats) = store[path]
+        prefix = str(index)+"/"
+        arrays[prefix+"stamp"] = stamp
+        arrays[prefix+"pileup"] = np.array(pileup)
+        arrays[prefix+"requested"] = np.array(requested)
+        for (name, stat) in stats.items():
+            for field in ringStats.RingStats._fields:
+                arrays[prefix+name+"/"+field] = getattr(stat, field)
+    #write to a temporary file first so an interrupted run never leaves a broken store
+    tmpfile = filename+".tmp"+str(os.getpid())
+    with open(tmpfile, "wb") as out:
+        np.savez(out, **arrays)
+    os.rename(tmpfile, filename)
+
+#incremental version of extractAll: only new or changed summary files (mtime or size) are processed,
+#the statistics of all other files come from the results store, files that are gone are dropped from it
+#for an unchanged file only the observables that are not in the store yet are extracted and added to its entry
+def extractIncremental(files, names, jobs=1, filename=None):
+    store = loadStore(filename)
+    paths = [os.path.abspath(file) for file in files]
+    stamps = [summaryCache._fileStamp(file) for file in files]
+    todo = []
+    for (file, path, stamp) in zip(files, paths, stamps):
+        entry = store.get(path)
+        if entry is None or not np.array_equal(entry[0], stamp):
+            todo.append((file, path, stamp, list(names)))
+        else:
+            missing = [name for name in names if name not in entry[2]]
+            if missing:
+                todo.append((file, path, stamp, missing))
+    print("Processing", len(todo), "new or changed of", len(files), "summary files")
+
+    for ((file, path, stamp, extracted), (pileup, stats)) in zip(todo, _extractTasks([(item[0], item[3]) for item in todo], jobs)):
+        entry = store.get(path)
+        if entry is not None and np.array_equal(entry[0], stamp):
+            #same file, keep the observables that are already stored
+            entry[3].update(stats)
+            store[path] = (stamp, pileup, entry[2]+[name for name in extracted if name not in entry[2]], entry[3])
+        else:
+            store[path] = (stamp, pileup, extracted, stats)
+    removed = [path for path in store if path not in paths]
+    store = dict((path, store[path]) for path in paths)
+    if todo or removed:
+        saveStore(store, filename)
+
+    points = [(store[path][1], dict((name, store[path][3][name]) for name in names if name in store[path][3])) for path in paths]
+    points.sort(key=lambda point: point[0])
+    return points
+
+#mean and sigma of the per ring statistics
+#rms: mean and RMS of the distribution (linearity.py)
+#poisson: mean with sqrt(mean) as sigma, a mean of 0.5 means all entries are in the first bin, i.e. nothing found
+def getParams(stats, statistic="rms"):
+    if statistic == "rms":
+        return (stats.mean, stats.rms)
+    mean = np.where(stats.mean == 0.5, 0., stats.mean)
+    return (mean, np.sqrt(mean))
+
+#the extracted points of an observable as arrays sorted by pileup
+#points is a list of (pileup, {observable: RingStats}) as returned by extractStatistics
+#returns pileup (points,) and the mean, sigma and integral (disks, rings, points)
+def pointArrays(points, name, statistic="rms"):
+    (disks, rings) = layouts[observables[name][0]]
+    selected = sorted([(pileup, stats[name]) for (pileup, stats) in points if name in stats], key=lambda point: point[0])
+    pileup = np.array([point[0] for point in selected], dtype=np.float64)
+    (mean, sigma, integral) = [np.zeros((disks, rings, len(selected))) for i in range(3)]
+    for (index, (p, stats)) in enumerate(selected):
+        (mean[..., index], sigma[..., index]) = getParams(stats, statistic)
+        integral[..., index] = stats.integral
+    return (pileup, mean, sigma, integral)
+
+#build the 2D array of TGraphErrors (first index is disk and second is ring) from the extracted points
+def makeGraphs(points, name, statistic="rms"):
+    _importRoot()
+    (pileup, means, sigmas, integral) = pointArrays(points, name, statistic)
+    (disks, rings) = means.shape[:2]
+    graphs = [[root.TGraphErrors() for j in range(rings)] for i in range(disks)]
+    for i in range(disks):
+        for j in range(rings):
+            for point in range(len(pileup)):
+                graphs[i][j].SetPoint(point, pileup[point], means[i][j][point])
+                graphs[i][j].SetPointError(point, 0, sigmas[i][j][point])
+    return graphs
+
+#the points of a 2D array of TGraphErrors as (x, y, ey) arrays of shape (graphs, points), padded with NaN
+def graphArrays(graphs):
+    flat = [graph for row in graphs for graph in row]
+    npoints = max([graph.GetN() for graph in flat]+[0])
+    (x, y, ey) = [np.full((len(flat), npoints), np.nan) for i in range(3)]
+    for index, graph in enumerate(flat):
+        graph.Sort()
+        for point in range(graph.GetN()):
+            x[index][point] = graph.GetX()[point]
+            y[index][point] = graph.GetY()[point]
+            ey[index][point] = graph.GetEY()[point]
+    return (x, y, ey)
+
+#fit all graphs of a 2D array in one go in fitrange and extrapolate the lines to extrarange
+#returns 2D arrays of the extrapolated TF1, a TGraphErrors with the 95% confidence band
+#and a TGraph with the relative deviation from linearity in percent
+def extrapolateLinear(graphs, fitrange=(0, 2), extrarange=(0, 200)):
+    _importRoot()
+    (x, y, ey) = graphArrays(graphs)
+    fit = linearFit.fitLinear(x, y, ey, fitrange)
+    expect = linearFit.evaluate(fit, x)
+    band = linearFit.confidenceBand(fit, x, 0.95)
+    relative = linearFit.relativeNonlinearity(fit, x, y)
+
+    rings = len(graphs[0])
+    extrapolated = [[None for j in range(rings)] for i in range(len(graphs))]
+    errors = [[None for j in range(rings)] for i in range(len(graphs))]
+    deviations = [[None for j in range(rings)] for i in range(len(graphs))]
+    for index in range(x.shape[0]):
+        (i, j) = divmod(index, rings)
+        print("Disk",i+1,"Ring",j+1,"par0",fit.slope[index],"par1",fit.intercept[index])
+        extrapolated[i][j] = root.TF1("extra","[0]*x+[1]",extrarange[0],extrarange[1])
+        extrapolated[i][j].SetParameter(0,fit.slope[index])
+        extrapolated[i][j].SetParameter(1,fit.intercept[index])
+        extrapolated[i][j].SetLineColor(6)
+
+        errors[i][j] = root.TGraphErrors()
+        errors[i][j].SetFillColor(6)
+        errors[i][j].SetFillStyle(3003)
+        deviations[i][j] = root.TGraph()
+        deviations[i][j].SetTitle("Deviation from Linearity;PU;Diff[%]")
+        deviations[i][j].SetMarkerStyle(8)
+        for point in range(graphs[i][j].GetN()):
+            errors[i][j].SetPoint(point,x[index][point],expect[index][point])
+            errors[i][j].SetPointError(point,0,band[index][point])
+            deviations[i][j].SetPoint(point,x[index][point],relative[index][point])
+
+    return (extrapolated,errors,deviations)
+
+#write the linearity graphs of an observable, with fit, extrapolation and deviation from linearity
+#if realname is given the graphs of the real coincidences are drawn on top of the sum
+#label is used for the object names ("Deviation <label> Disk1Ring1", "<label>[Coincidences] Disk1Ring1")
+#summaryname is the name of the summary canvas, None to not write it
+def writeLinearity(filename, points, name, realname, statistic, label, title, summaryname, fitrange=(0, 2), extrarange=(0, 200), deviations=True):
+    _importRoot()
+    (disks, rings) = layouts[observables[name][0]]
+    graphs = makeGraphs(points, name, statistic)
+    if realname is not None:
+        graphsreal = makeGraphs(points, realname, statistic)
+        prefix = label+"Coincidences"
+    else:
+        prefix = label
+    #fit and extrapolate all disks and rings at once
+    (extrapolated,errors,deviation) = extrapolateLinear(graphs,fitrange,extrarange)
+
+    c_canvas = root.TCanvas("Summary","Summary")
+    c_canvas.Divide(rings,disks)
+
+    rootfile = root.TFile(filename,"RECREATE")
+    index = 1
+    for i in range(disks):
+        for j in range(rings):
+            #Cosmetics
+            if realname is not None:
+                graphs[i][j].SetLineColor(4)
+                graphsreal[i][j].SetLineColor(8)
+                graphs[i][j].SetMarkerColor(4)
+                graphsreal[i][j].SetMarkerColor(8)
+                graphs[i][j].SetMarkerStyle(8)
+                graphsreal[i][j].SetMarkerStyle(8)
+            else:
+                graphs[i][j].SetLineColor(1)
+            graphs[i][j].SetTitle("Linearity Disk"+str(i+1)+"Ring"+str(j+1)+title)
+            c_canvas.cd(index)
+            graphs[i][j].Draw("ap")
+            if realname is not None:
+                graphsreal[i][j].Draw("p same")
+
+            errors[i][j].Draw("e3 same")
+            extrapolated[i][j].Draw("same")
+
+            #relative nonlinearity
+            if deviations:
+                deviation[i][j].Write("Deviation "+label+" Disk"+str(i+1)+"Ring"+str(j+1))
+
+            #save canvases for the individual disk/ring combos
+            canvasname = prefix+" Disk"+str(i+1)+"Ring"+str(j+1)
+            savecanvas = root.TCanvas(canvasname,canvasname)
+            savecanvas.cd()
+            graphs[i][j].Draw("ap")
+            if realname is not None:
+                graphsreal[i][j].Draw("p same")
+            errors[i][j].Draw("e3 same")
+            extrapolated[i][j].Draw("same")
+            savecanvas.Write(canvasname)
+            index = index+1
+
+    #Write out the summary as well
+    if summaryname is not None:
+        c_canvas.Write(summaryname)
+    rootfile.Close()
+
+#statistical error of a luminosity measurement from the mean number of objects
+#per nibble of ln4 triggers at a trigger rate of trgkhz, 0 where the mean is 0
+def statError(mean, ln4=16384, trgkhz=0.075):
+    mean = np.asarray(mean, dtype=np.float64)
+    nonzero = mean > 0
+    return np.where(nonzero, 1./np.sqrt(np.where(nonzero, mean, 1.)*ln4), 0.)/np.sqrt(np.asarray(trgkhz)/40.)
+
+#statistical error per disk and ring (disks, rings, points) and for the full detector (points,)
+#from the mean number of objects, 0 for pileup 0
+def statErrorArrays(points, name, ln4=16384, trgkhz=0.075):
+    (pileup, means, sigmas, integral) = pointArrays(points, name, "rms")
+    values = np.where(pileup > 0, statError(means, ln4, trgkhz), 0.)
+    total = np.where(pileup > 0, statError(means.sum(axis=(0, 1)), ln4, trgkhz), 0.)
+    return (pileup, values, total)
+
+#write the statistical error graphs per disk and ring and for the full detector
+def writeStatError(filename, points, name, ln4=16384, trgkhz=0.075):
+    _importRoot()
+    detector = observables[name][0]
+    (pileup, values, total) = statErrorArrays(points, name, ln4, trgkhz)
+    (disks, rings) = values.shape[:2]
+    graphs = [[root.TGraphErrors() for j in range(rings)] for i in range(disks)]
+    totalgraph = root.TGraph()
+    totalgraph.SetMarkerStyle(8)
+    totalgraph.SetTitle("Stat. Error "+detector+" [NB4]")
+    for point in range(len(pileup)):
+        for i in range(disks):
+            for j in range(rings):
+                graphs[i][j].SetPoint(point, pileup[point], values[i][j][point])
+        totalgraph.SetPoint(point, pileup[point], total[point])
+
+    c_canvas = root.TCanvas("Summary","Summary")
+    c_canvas.Divide(rings,disks)
+
+    rootfile = root.TFile(filename,"RECREATE")
+    index = 1
+    for i in range(disks):
+        for j in range(rings):
+            #Cosmetics
+            graphs[i][j].SetLineColor(1)
+            graphs[i][j].SetTitle("Statistical Error [NB4] Disk"+str(i+1)+"Ring"+str(j+1)+";Pileup;Statistical Error [%]")
+            graphs[i][j].SetMarkerStyle(8)
+            c_canvas.cd(index)
+            graphs[i][j].Draw("ap")
+
+            #save canvases for the individual disk/ring combos
+            canvasname = "Clusters Disk"+str(i+1)+"Ring"+str(j+1)
+            savecanvas = root.TCanvas(canvasname,canvasname)
+            savecanvas.cd()
+            graphs[i][j].GetYaxis().SetTitleOffset(1.2)
+            graphs[i][j].GetXaxis().SetTitleSize(0.04)
+            graphs[i][j].GetXaxis().SetLabelSize(0.04)
+            graphs[i][j].GetYaxis().SetTitleSize(0.04)
+            graphs[i][j].GetYaxis().SetLabelSize(0.04)
+            graphs[i][j].Draw("ap")
+            savecanvas.Write(canvasname)
+            index = index+1
+
+    #Write out the summary as well
+    c_canvas.Write("SummaryStatError")
+    aCanvas = root.TCanvas(detector,detector)
+    aCanvas.cd()
+    totalgraph.Draw("ap")
+    aCanvas.Write("StatError"+detector)
+    rootfile.Close()
+
+#the linearity results as arrays: per disk and ring the points, the fitted line with its 95% band
+#and the deviation from linearity in percent, plus the fit parameters
+def linearityResults(points, name, realname, statistic, label, fitrange=(0, 2)):
+    (pileup, means, sigmas, integral) = pointArrays(points, name, statistic)
+    (disks, rings) = means.shape[:2]
+    y = means.reshape(disks*rings, -1)
+    fit = linearFit.fitLinear(pileup, y, sigmas.reshape(disks*rings, -1), fitrange)
+    expect = linearFit.evaluate(fit, pileup)
+    band = linearFit.confidenceBand(fit, pileup, 0.95)
+    deviation = linearFit.relativeNonlinearity(fit, pileup, y)
+    if realname is not None:
+        (realpileup, realmeans, realsigmas, realintegral) = pointArrays(points, realname, statistic)
+
+    results = OrderedDict()
+    for i in range(disks):
+        for j in range(rings):
+            index = i*rings+j
+            diskring = " Disk"+str(i+1)+"Ring"+str(j+1)
+            results[label+diskring] = OrderedDict([("pileup", pileup), ("mean", means[i][j]), ("sigma", sigmas[i][j]),
+                                                   ("fit", expect[index]), ("band", band[index]), ("deviation", deviation[index])])
+            if realname is not None:
+                results[label+" real"+diskring] = OrderedDict([("pileup", realpileup), ("mean", realmeans[i][j]), ("sigma", realsigmas[i][j])])
+            results["Fit "+label+diskring] = OrderedDict([("slope", fit.slope[index]), ("intercept", fit.intercept[index]),
+                                                          ("covariance", fit.covariance[index].ravel()),
+                                                          ("chi2", fit.chi2[index]), ("ndf", fit.ndf[index])])
+    return results
+
+#the statistical error per disk and ring and for the full detector as arrays
+def statErrorResults(points, name, ln4=16384, trgkhz=0.075):
+    detector = observables[name][0]
+    (pileup, values, total) = statErrorArrays(points, name, ln4, trgkhz)
+    results = OrderedDict()
+    for i in range(values.shape[0]):
+        for j in range(values.shape[1]):
+            results["StatError Disk"+str(i+1)+"Ring"+str(j+1)] = OrderedDict([("pileup", pileup), ("staterror", values[i][j])])
+    results["StatError "+detector] = OrderedDict([("pileup", pileup), ("staterror", total)])
+    return results
+
+#the outputs of linearity.py, linearity_TFPX.py and the linearity-OverlapInR scripts with the same names, titles and fit ranges:
+#(file name, observable, real observable, statistic, label, title, summary canvas, fit range, extrapolation range, deviations)
+linearityOutputs = [
+    #TEPX, mean and RMS as in linearity.py
+    ("Results_Hits", "TEPX Hits", None, "rms", "Hits", ";Pileup;# of Hits", "SummaryHits", (0, 2), (0, 200), True),
+    ("Results_Coincidences_2x", "TEPX 2x", "TEPX real 2x", "rms", "2x", ";<N_{PU}>;<Number of 2x Coincidences", "SummaryClusters", (0, 2), (0, 200), True),
+    ("Results_Coincidences_3x", "TEPX 3x", "TEPX real 3x", "rms", "3x", ";<N_{PU}>;<Number of 3x Coincidences", "SummaryClusters", (0, 2), (0, 200), True),
+    #TFPX, poisson errors and the fit between PU 10 and 20 as in linearity_TFPX.py
+    ("Results_Clusters_TFPX", "TFPX Clusters", None, "poisson", "Clusters", ";Pileup;# of Clusters", "SummaryClusters", (10, 20), (10, 200), True),
+    ("Results_Hits_TFPX", "TFPX Hits", None, "poisson", "Hits", ";Pileup;# of Hits", "SummaryHits", (10, 20), (10, 200), True),
+    ("Results_Coincidences_TFPX_2x", "TFPX 2x", "TFPX real 2x", "poisson", "2x", ";Pileup;# of 2x Coincidences", None, (10, 20), (10, 200), False),
+    ("Results_Coincidences_TFPX_3x", "TFPX 3x", "TFPX real 3x", "poisson", "3x", ";Pileup;# of 3x Coincidences", None, (10, 20), (10, 200), False),
+    #coincidences in R as in the linearity-OverlapInR scripts
+    ("Results_CoincidencesInR_2x", "TEPX 2x in R", "TEPX real 2x in R", "poisson", "2x", ";Pileup;# of 2x Coincidences", "SummaryClusters", (0, 2), (0, 200), True),
+    ("Results_CoincidencesInR_TFPX_2x", "TFPX 2x in R", "TFPX real 2x in R", "poisson", "2x", ";Pileup;# of 2x Coincidences", "SummaryClusters", (0, 2), (0, 200), True),
+]
+
+#write all results, fmt is root for the Results_*.root files or one of resultsIO.formats
+#every output file is a separate task, with jobs > 1 they are written by a pool of worker processes
+def _writeResults(filename, results, fmt):
+    resultsIO.writeResults(filename, results, fmt)
+
+def _writeLinearityResults(filename, points, name, realname, statistic, label, fitrange, fmt):
+    resultsIO.writeResults(filename, linearityResults(points, name, realname, statistic, label, fitrange), fmt)
+
+def writeAll(points, fmt="root", jobs=1):
+    tasks = []
+    if fmt == "root":
+        tasks.append((writeStatError, ("Results_StatError.root", points, "TEPX Clusters")))
+    else:
+        tasks.append((_writeResults, ("Results_StatError", statErrorResults(points, "TEPX Clusters"), fmt)))
+    for (filename, name, realname, statistic, label, title, summaryname, fitrange, extrarange, deviations) in linearityOutputs:
+        if fmt == "root":
+            tasks.append((writeLinearity, (filename+".root", points, name, realname, statistic, label, title, summaryname, fitrange, extrarange, deviations)))
+        else:
+            tasks.append((_writeLinearityResults, (filename, points, name, realname, statistic, label, fitrange, fmt)))
+    renderFigures.renderAll(tasks, jobs)
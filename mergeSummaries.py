@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function
+#get the OS features
+import os, re, shutil, tempfile
+#command line parsing
+import argparse
+import multiprocessing
+from collections import OrderedDict
+
+#parallel replacement for "hadd -f summary_PU_X.root temp_*.root" for the ITclusterAnalyzer outputs
+#the histograms are summed in a tree reduction: the inputs are merged in groups of fanin files by a pool of
+#worker processes, the outputs of a level are the inputs of the next one until a single file is left
+#every merge goes through the files one directory at a time, so only the histograms of a single directory
+#of fanin files are in memory at once
+#ROOT is only imported in the processes that merge, never before the worker processes are started
+
+root = None
+def _importRoot():
+    global root
+    if root is None:
+        import ROOT
+        root = ROOT
+        #histograms read from the inputs belong to us and not to the file they were read from
+        root.TH1.AddDirectory(False)
+    return root
+
+#the histograms of a file per directory {path: [name, ...]}, appended to layout so that the layouts of all
+#inputs can be combined, other objects are skipped with a message
+def _collectLayout(directory, path, layout):
+    names = layout.setdefault(path, [])
+    for key in directory.GetListOfKeys():
+        name = key.GetName()
+        cls = root.TClass.GetClass(key.GetClassName())
+        if cls.InheritsFrom("TDirectory"):
+            _collectLayout(directory.Get(name), path+name+"/", layout)
+        elif cls.InheritsFrom("TH1"):
+            #there can be several cycles of a key, Get returns the highest one
+            if name not in names:
+                names.append(name)
+        else:
+            print("Skipping", path+name, "of class", key.GetClassName())
+    return layout
+
+#get or create the (nested) directory path in the output file
+def _makeDirectory(rootfile, path):
+    directory = rootfile
+    for name in path.strip("/").split("/"):
+        if not name:
+            continue
+        subdirectory = directory.GetDirectory(name)
+        directory = subdirectory if subdirectory else directory.mkdir(name)
+    return directory
+
+#sum the histograms of all inputs into output, one directory at a time
+#histograms whose path matches one of the skip regular expressions are not written
+def mergeFiles(inputs, output, skip=None):
+    _importRoot()
+    skip = [re.compile(pattern) for pattern in (skip or [])]
+    files = [root.TFile.Open(name) for name in inputs]
+    for (name, rootfile) in zip(inputs, files):
+        if not rootfile or rootfile.IsZombie():
+            raise IOError("Could not open "+name)
+    layout = OrderedDict()
+    for rootfile in files:
+        _collectLayout(rootfile, "", layout)
+
+    outfile = root.TFile(output, "RECREATE")
+    for (path, names) in layout.items():
+        outdir = _makeDirectory(outfile, path)
+        for name in names:
+            if any(pattern.search(path+name) for pattern in skip):
+                continue
+            merged = None
+            for rootfile in files:
+                hist = rootfile.Get(path+name)
+                if not hist:
+                    continue
+                if merged is None:
+                    merged = hist
+                elif not merged.Add(hist):
+                    raise ValueError("Could not add "+path+name+" of "+rootfile.GetName()+", the binning differs")
+            outdir.WriteTObject(merged, name)
+        #the histograms of this directory are not needed any more
+        merged = hist = None
+    outfile.Close()
+    for rootfile in files:
+        rootfile.Close()
+    return output
+
+def _mergeWorker(args):
+    (inputs, output, skip) = args
+    return mergeFiles(inputs, output, skip)
+
+#merge the inputs into output with a tree reduction, jobs worker processes merge the groups of a level in parallel
+#the intermediate files are kept in a temporary directory next to the output (or in workdir) and removed
+#as soon as the next level is written
+def mergeTree(inputs, output, jobs=1, fanin=2, skip=None, workdir=None):
+    if not inputs:
+        raise ValueError("No input files to merge into "+output)
+    fanin = max(fanin, 2)
+    if workdir is None:
+        workdir = os.path.dirname(os.path.abspath(output))
+    tmpdir = tempfile.mkdtemp(prefix="mergeSummaries_", dir=workdir)
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    try:
+        current = list(inputs)
+        level = 0
+        while len(current) > fanin:
+            groups = [current[index:index+fanin] for index in range(0, len(current), fanin)]
+            tasks = []
+            merged = []
+            for (index, group) in enumerate(groups):
+                if len(group) == 1:
+                    #nothing to merge, goes to the next level as it is
+                    merged.append(group[0])
+                    continue
+                filename = os.path.join(tmpdir, "level"+str(level)+"_"+str(index)+".root")
+                tasks.append((group, filename, skip))
+                merged.append(filename)
+            print("Level", level, ": merging", len(current), "files into", len(merged), "with", jobs, "jobs")
+            if pool is None:
+                for task in tasks:
+                    _mergeWorker(task)
+            else:
+                for filename in pool.imap_unordered(_mergeWorker, tasks):
+                    print("Merged", filename)
+            #the intermediate files of the previous level are merged now
+            for filename in current:
+                if filename not in merged and os.path.dirname(filename) == tmpdir:
+                    os.remove(filename)
+            current = merged
+            level = level+1
+        print("Writing", output, "from", len(current), "files")
+        #the last merge runs in a worker too, so the main process never loads ROOT
+        if pool is None:
+            mergeFiles(current, output, skip)
+        else:
+            pool.apply(_mergeWorker, ((current, output, skip),))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return output
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merge the histograms of ITclusterAnalyzer outputs with a parallel tree reduction")
+    parser.add_argument("output", help="merged summary file, e.g. summary_PU_200.root")
+    parser.add_argument("inputs", nargs="+", help="ITclusterAnalyzer output files")
+    parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(), help="number of parallel worker processes (default: %(default)s)")
+    parser.add_argument("--fanin", type=int, default=2, help="number of files merged by a worker at once (default: %(default)s)")
+    parser.add_argument("--skip", nargs="+", default=None, metavar="REGEX",
+                        help="don't write histograms whose path matches, e.g. 'RVsZ|XVsY' for the tracker layout plots")
+    parser.add_argument("--workdir", default=None, help="directory for the intermediate files (default: next to the output)")
+    args = parser.parse_args()
+
+    mergeTree(args.inputs, args.output, args.jobs, args.fanin, args.skip, args.workdir)
@@ -2,41 +2,70 @@
 
 #make compatible 2.7 and 3
 from __future__ import print_function
-#get root
-# from ROOT import TFile, TH1F, TDirectoryFile
-import ROOT as root
 #get the OS features
 import os, sys, re, math
+from collections import OrderedDict
 import numpy as np
-
-
-def getClusterDistributions(file):
+#cached access to the summary histograms
+import summaryCache
+#output without ROOT
+import resultsIO
+
+#build the 1D projection on Y of a single ring from the cached bin contents (under/overflow included)
+def projectionY(contents, yedges, ring, name):
+    import ROOT as root
+    proj = root.TH1D(name, name, len(yedges)-1, np.asarray(yedges, dtype=np.float64))
+    proj.SetDirectory(0)
+    for ybin in range(contents.shape[1]):
+        proj.SetBinContent(ybin, contents[ring+1][ybin])
+    proj.SetEntries(contents[ring+1].sum())
+    return proj
+
+#the distributions of the number of clusters per ring without ROOT: bin edges, contents, under- and overflow
+def clusterDistributions(hists, disks, rings):
+    results = OrderedDict()
+    for disk in range(1,disks+1):
+        summed = hists[-disk].contents + hists[disk].contents
+        for ring in range(rings):
+            results["Clusters Disk "+str(disk)+" Ring "+str(ring+1)] = OrderedDict([
+                ("edges", hists[disk].yedges), ("counts", summed[ring+1][1:-1]),
+                ("underflow", summed[ring+1][0]), ("overflow", summed[ring+1][-1])])
+    return results
+
+#fmt is root for nClusters_<pileup>.root or one of resultsIO.formats
+def getClusterDistributions(file, fmt="root"):
 
     disks,rings = 4,5
-    h = [[root.TH1D() for j in range(rings)] for i in range(disks)]
 
-    pileupstring = re.findall('summary_PU_(.*).root', file)
-    pileup = float(pileupstring[0])
+    pileup = summaryCache.getPileup(file)
     print("Found a root file for pileup", pileup, "in file", file, "Objects: Clusters")
 
-    rootfile = root.TFile.Open(file)
-    rootfile.cd('BRIL_IT_Analysis/TEPX/Clusters')
+    directory = 'BRIL_IT_Analysis/TEPX/Clusters'
 
     #build the histogram names
     histname = "Number of clusters for Disk "
 
     #outfile = root.TFile("Results_Clusters.root","RECREATE")
 
+    hists = summaryCache.getDiskHistograms(file, directory, histname, 4)
+
+    if fmt != "root":
+        resultsIO.writeResults("nClusters_"+str(pileup), clusterDistributions(hists, disks, rings), fmt)
+        return
+
+    import ROOT as root
+    root.gROOT.SetBatch(True)
+    h = [[root.TH1D() for j in range(rings)] for i in range(disks)]
+
     #loop the disks
     for disk in range(1,5):
-        histminusz = root.gDirectory.Get(histname +"-"+str(disk))
-        histplusz = root.gDirectory.Get(histname+str(disk))
         #add plus and minus Z histograms
-        histminusz.Add(histplusz)
+        histminusz = hists[-disk].contents + hists[disk].contents
+        yedges = hists[disk].yedges
 
         #now loop the rings
         for ring in range(5):
-            h[disk-1][ring] = histminusz.ProjectionY("Ring", ring+1, ring+1)
+            h[disk-1][ring] = projectionY(histminusz, yedges, ring, "Disk"+str(disk)+"Ring"+str(ring+1))
 
 
     outfile = root.TFile("nClusters_"+str(pileup)+".root","RECREATE")
@@ -54,13 +83,16 @@ def getClusterDistributions(file):
 
 # def main():
 args = len(sys.argv)
-if args==3:
+if args==3 or args==4:
     path = sys.argv[1]
     observable = sys.argv[2]
+    #optional output format, root or one of resultsIO.formats
+    fmt = sys.argv[3] if args==4 else "root"
 else:
-    print("Error, call with command line arguments: [1] path and [2] observable; the options for the latter are Clusters or 2x or 3x")
+    print("Error, call with command line arguments: [1] path and [2] observable; the options for the latter are Clusters or 2x or 3x; optionally [3] output format root, npz, csv or json")
     path = "/afs/cern.ch/user/g/gauzinge/ITsim/mySummaryPlots/"
     observable ="Clusters"
+    fmt = "root"
     print("default values are:")
     print(path)
     print(observable)
@@ -78,7 +110,7 @@ if observable == "Clusters":
         if file.find(".root"):
             filename = path+file
             #fill the actual graph for all available PU steps
-            getClusterDistributions(filename)
+            getClusterDistributions(filename, fmt)
         else:
             print("Not a root file, skipping")
             continue
@@ -28,8 +28,9 @@ function runAnalysis() {
 runAnalysis
 
 echo "Now merging output histograms"
-command="hadd -f summary_PU_${PUIN}.root"
-for rootfile in ${PWD}/temp_?.root; do
+#parallel tree reduction instead of a single hadd, on all cores unless MERGEJOBS is set
+command="python mergeSummaries.py -j ${MERGEJOBS:-$(nproc)} summary_PU_${PUIN}.root"
+for rootfile in ${PWD}/temp_*.root; do
   command+=" ${rootfile}"
 done
 echo $command
@@ -40,10 +41,10 @@ rm temp_*.root
 
 echo "Merging trees and cleaning them up..."
 command2="hadd -f ${outputTree}/Cluster_${PUIN}.root"
-for treefile in ${outputTree}/Cluster_${PUIN}_?.root; do
+for treefile in ${outputTree}/Cluster_${PUIN}_*.root; do
   command2+=" ${treefile}"
 done
 echo $command2
 ${command2}
-rm ${outputTree}/Cluster_${PUIN}_?.root
+rm ${outputTree}/Cluster_${PUIN}_*.root
 
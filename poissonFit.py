@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function, division
+import math
+from collections import namedtuple
+import numpy as np
+
+#maximum likelihood fits of Poisson and scaled Poisson distributions to histogrammed counts,
+#for all rings and disks at once
+#the scaled Poisson is the model of fitPoisson in the linearity scripts:
+#   [0]*([1]/[2])^(x/[2])*exp(-[1]/[2])/Gamma(x/[2]+1)
+#i.e. x/[2] is Poisson distributed with mean [1]/[2], so x has the mean [1] and the variance [2]*[1]
+#the mean has the closed form solution mean = <x> for both models, the scale [2] is found with
+#Newton iterations on the profile likelihood
+
+#status of a fit
+CONVERGED = 0
+NOTCONVERGED = 1
+#no entries
+EMPTY = 2
+#all entries in a single bin or a mean of 0, the scale is undefined
+DEGENERATE = 3
+
+#all arrays have the shape of the input without the last (bin) axis, e.g. (disks, rings)
+PoissonFit = namedtuple("PoissonFit", ["mean", "scale", "meanerror", "scaleerror", "loglikelihood", "status", "iterations"])
+
+#digamma and trigamma for x > 0: recurrence up to x >= 6, then the asymptotic series
+def digamma(x):
+    x = np.array(x, dtype=np.float64)
+    result = np.zeros(x.shape)
+    for i in range(6):
+        small = x < 6
+        result -= np.where(small, 1./x, 0.)
+        x = np.where(small, x+1, x)
+    inv2 = 1./(x*x)
+    return result + np.log(x) - 0.5/x - inv2*(1./12 - inv2*(1./120 - inv2*(1./252 - inv2*(1./240 - inv2/132.))))
+
+def trigamma(x):
+    x = np.array(x, dtype=np.float64)
+    result = np.zeros(x.shape)
+    for i in range(6):
+        small = x < 6
+        result += np.where(small, 1./(x*x), 0.)
+        x = np.where(small, x+1, x)
+    inv2 = 1./(x*x)
+    return result + 1./x + 0.5*inv2 + inv2/x*(1./6 - inv2*(1./30 - inv2*(1./42 - inv2/30.)))
+
+_lgamma = np.vectorize(math.lgamma, otypes=[np.float64])
+
+#the values of the histogrammed variable: the "Number of ... for Disk" histograms have unit bins
+#starting at 0 that are filled with integer counts, so the count of a bin is its lower edge
+def binValues(yedges):
+    return np.asarray(yedges, dtype=np.float64)[:-1]
+
+#log likelihood of the scaled Poisson for counts (..., nbins) at values (nbins)
+def logLikelihood(counts, values, mean, scale):
+    u = values/scale[..., np.newaxis]
+    lam = (mean/scale)[..., np.newaxis]
+    terms = u*np.log(np.where(lam > 0, lam, 1.)) - lam - _lgamma(u+1) - np.log(scale)[..., np.newaxis]
+    return (counts*np.where(counts > 0, terms, 0.)).sum(axis=-1)
+
+#Poisson fit: the mean is the only parameter, with the error sqrt(mean/N)
+def fitPoisson(counts, yedges, values=None):
+    counts = np.asarray(counts, dtype=np.float64)
+    values = binValues(yedges) if values is None else np.asarray(values, dtype=np.float64)
+    entries = counts.sum(axis=-1)
+    norm = np.where(entries > 0, entries, 1.)
+    mean = np.dot(counts, values)/norm
+    scale = np.ones(mean.shape)
+    meanerror = np.sqrt(mean/norm)
+    status = np.where(entries > 0, CONVERGED, EMPTY)
+    return PoissonFit(mean, scale, meanerror, np.zeros(mean.shape), logLikelihood(counts, values, mean, scale),
+                      status, np.zeros(mean.shape, dtype=int))
+
+#scaled Poisson fit, the scale starts from the moments (variance/mean) and is iterated in log(scale)
+#to keep it positive; a Newton step is only taken where the likelihood is concave, otherwise a
+#limited step along the gradient
+def fitScaledPoisson(counts, yedges, values=None, maxiterations=50, tolerance=1e-8):
+    counts = np.asarray(counts, dtype=np.float64)
+    values = binValues(yedges) if values is None else np.asarray(values, dtype=np.float64)
+    entries = counts.sum(axis=-1)
+    norm = np.where(entries > 0, entries, 1.)
+    mean = np.dot(counts, values)/norm
+    variance = np.dot(counts, values**2)/norm - mean**2
+
+    status = np.full(mean.shape, NOTCONVERGED)
+    status[(mean <= 0) | (variance <= 0)] = DEGENERATE
+    status[entries <= 0] = EMPTY
+    active = status == NOTCONVERGED
+    scale = np.where(active, variance/np.where(mean > 0, mean, 1.), 1.)
+    safemean = np.where(mean > 0, mean, 1.)
+    iterations = np.zeros(mean.shape, dtype=int)
+
+    hessian = np.zeros(mean.shape)
+    for iteration in range(maxiterations):
+        if not active.any():
+            break
+        s = scale[..., np.newaxis]
+        u = values/s
+        m = safemean[..., np.newaxis]
+        bracket = np.log(s) - np.log(m) - 1 + digamma(u+1)
+        #first and second derivative of the log likelihood with respect to the scale
+        gradient = (counts*((u/s)*bracket + m/s**2 - 1./s)).sum(axis=-1)
+        hessian = (counts*(-2*(u/s**2)*bracket + (u/s)*(1./s - trigamma(u+1)*u/s) - 2*m/s**3 + 1./s**2)).sum(axis=-1)
+        #in t = log(scale)
+        dt = scale*gradient
+        ddt = scale*gradient + scale**2*hessian
+        step = np.where(ddt < 0, -dt/np.where(ddt < 0, ddt, -1.), np.sign(dt)*0.5)
+        step = np.clip(np.where(active, step, 0.), -1., 1.)
+        scale = scale*np.exp(step)
+        iterations += active
+        converged = active & (np.abs(step) < tolerance)
+        status[converged] = CONVERGED
+        active &= ~converged
+
+    meanerror = np.where(entries > 0, np.sqrt(np.maximum(scale*mean, 0.)/norm), 0.)
+    #mean and scale are uncorrelated at the maximum, the scale error is from the second derivative
+    fitted = status == CONVERGED
+    scaleerror = np.where(fitted & (hessian < 0), np.sqrt(-1./np.where(hessian < 0, hessian, -1.)), 0.)
+    return PoissonFit(mean, scale, meanerror, scaleerror, logLikelihood(counts, values, mean, scale), status, iterations)
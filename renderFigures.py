@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function
+#command line parsing
+import argparse
+import multiprocessing
+
+#rendering stage: figures are drawn from precomputed histogram data by a pool of worker processes
+#a task is (function, args) with a module level function, so it can be sent to a worker, that draws and saves
+#one figure (or writes one ROOT file of canvases) and returns nothing
+#matplotlib figures are drawn with the Agg backend and ROOT canvases in batch mode, so no display is needed
+
+def _renderWorker(task):
+    (function, args) = task
+    function(*args)
+    return function.__name__
+
+#run all tasks with jobs worker processes, in the order they are given for jobs <= 1
+def renderAll(tasks, jobs=1):
+    tasks = list(tasks)
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            _renderWorker(task)
+        return
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    try:
+        for name in pool.imap_unordered(_renderWorker, tasks):
+            print("Rendered", name)
+    finally:
+        pool.close()
+        pool.join()
+
+if __name__ == '__main__':
+    #re-render the cluster study figures from the saved clusterHists_PU*.npz without reading the trees
+    import clusterStudies
+    parser = argparse.ArgumentParser(description='Render the cluster study figures from the saved histograms')
+    parser.add_argument('--pu', nargs='+', required=True, help='PU points, e.g. 10 50 200')
+    parser.add_argument('--out', default=clusterStudies.OutPath, help='directory with the histograms and for the figures (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='number of worker processes (default: %(default)s)')
+    args = parser.parse_args()
+
+    renderAll(clusterStudies.figureTasks(args.pu, clusterStudies.os.path.join(args.out, '')), args.jobs)
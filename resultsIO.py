@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function
+#file formats
+import csv, json
+from collections import OrderedDict
+import numpy as np
+
+#writers for results without ROOT
+#results are an OrderedDict {name: OrderedDict {column: 1D array}}, e.g.
+#{"Hits Disk1Ring1": {"pileup": [...], "mean": [...], "sigma": [...]}}
+formats = ["npz", "csv", "json"]
+
+#npz: one array per name and column, "<name>/<column>"
+def writeNPZ(filename, results):
+    arrays = {}
+    for name, columns in results.items():
+        for column, values in columns.items():
+            arrays[name+"/"+column] = np.asarray(values)
+    np.savez(filename, **arrays)
+
+def readNPZ(filename):
+    results = OrderedDict()
+    with np.load(filename) as npz:
+        for key in npz.files:
+            (name, column) = key.rsplit("/", 1)
+            results.setdefault(name, OrderedDict())[column] = npz[key]
+    return results
+
+#csv: one row per entry with the name in the first column, columns a result doesn't have are left empty
+def writeCSV(filename, results):
+    header = []
+    for columns in results.values():
+        header += [column for column in columns if column not in header]
+    with open(filename, "w") as out:
+        writer = csv.writer(out)
+        writer.writerow(["name"]+header)
+        for name, columns in results.items():
+            length = max([len(np.atleast_1d(values)) for values in columns.values()]+[0])
+            for index in range(length):
+                row = [name]
+                for column in header:
+                    values = np.atleast_1d(columns[column]) if column in columns else []
+                    row.append(repr(float(values[index])) if index < len(values) else "")
+                writer.writerow(row)
+
+#json: the nested dictionaries with lists of numbers
+def writeJSON(filename, results):
+    tree = OrderedDict()
+    for name, columns in results.items():
+        tree[name] = OrderedDict((column, np.atleast_1d(values).tolist()) for column, values in columns.items())
+    with open(filename, "w") as out:
+        json.dump(tree, out, indent=1)
+
+#write the results in the given format, the extension is added to basename
+def writeResults(basename, results, fmt):
+    filename = basename+"."+fmt
+    print("Writing", len(results), "results to", filename)
+    if fmt == "npz":
+        writeNPZ(filename, results)
+    elif fmt == "csv":
+        writeCSV(filename, results)
+    elif fmt == "json":
+        writeJSON(filename, results)
+    else:
+        raise ValueError("Unknown output format "+fmt+", the options are "+", ".join(formats))
+    return filename
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function, division
+from collections import namedtuple
+import numpy as np
+#cached access to the summary histograms
+import summaryCache
+
+#vectorized per ring statistics of the "Number of ... for Disk N" histograms
+#all arrays have the shape of the input without the last (bin) axis, e.g. (disks, rings)
+#quantiles has an additional last axis with one entry per requested probability
+RingStats = namedtuple("RingStats", ["mean", "rms", "quantiles", "integral"])
+
+#mean, RMS and quantiles of the distributions in counts (..., nbins) with the bin edges yedges (nbins+1)
+#the definitions are the ones of TH1::GetMean, TH1::GetRMS and TH1::GetQuantiles on the ProjectionY
+#of a single ring, so under- and overflow must not be included in counts
+def ringStatistics(counts, yedges, quantiles=(0.5,)):
+    counts = np.asarray(counts, dtype=np.float64)
+    yedges = np.asarray(yedges, dtype=np.float64)
+    centers = summaryCache.binCenters(yedges)
+    prob = np.atleast_1d(np.asarray(quantiles, dtype=np.float64))
+
+    integral = counts.sum(axis=-1)
+    #avoid division by zero for empty rings, their statistics are all 0
+    norm = np.where(integral > 0, integral, 1.)
+    mean = np.dot(counts, centers)/norm
+    rms = np.sqrt(np.maximum(np.dot(counts, centers**2)/norm - mean**2, 0.))
+
+    #normalized cumulative distribution starting at 0, shape (..., nbins+1)
+    nbins = counts.shape[-1]
+    cumulative = np.cumsum(counts, axis=-1)/norm[..., np.newaxis]
+    cumulative = np.concatenate((np.zeros(cumulative.shape[:-1]+(1,)), cumulative), axis=-1)
+    #last bin with cumulative <= prob for every probability, shape (..., nprob)
+    ibin = (cumulative[..., np.newaxis, :] <= prob[:, np.newaxis]).sum(axis=-1)-1
+    ibin = np.clip(ibin, 0, nbins-1)
+    low = np.take_along_axis(cumulative, ibin, axis=-1)
+    high = np.take_along_axis(cumulative, ibin+1, axis=-1)
+    dint = high-low
+    q = yedges[ibin] + np.where(dint > 0, (yedges[ibin+1]-yedges[ibin])*(prob-low)/np.where(dint > 0, dint, 1.), 0.)
+
+    empty = integral <= 0
+    mean = np.where(empty, 0., mean)
+    rms = np.where(empty, 0., rms)
+    q = np.where(empty[..., np.newaxis], 0., q)
+    return RingStats(mean, rms, q, integral)
+
+#stack the plus and minus Z histograms of all disks into a (disks, rings, nbins) matrix
+#hists is the {-disk: CachedHist, disk: CachedHist} dictionary of summaryCache.getDiskHistograms
+def diskRingMatrix(hists, disks, rings):
+    return np.stack([hists[-disk].contents[1:rings+1, 1:-1] + hists[disk].contents[1:rings+1, 1:-1]
+                     for disk in range(1, disks+1)])
+
+#statistics for all disks and rings of a directory in one go, arrays have the shape (disks, rings)
+def diskRingStatistics(hists, disks, rings, quantiles=(0.5,)):
+    return ringStatistics(diskRingMatrix(hists, disks, rings), hists[1].yedges, quantiles)
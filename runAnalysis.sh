@@ -32,8 +32,9 @@ function runAnalysis() {
     done
     
     echo "Now merging output histograms"
-    command="hadd -f summary_PU_${PUIN}.root"
-    for rootfile in ${PWD}/temp_?.root; do
+    #parallel tree reduction instead of a single hadd, on all cores unless MERGEJOBS is set
+    command="python mergeSummaries.py -j ${MERGEJOBS:-$(nproc)} summary_PU_${PUIN}.root"
+    for rootfile in ${PWD}/temp_*.root; do
         command+=" ${rootfile}"
     done
     echo $command
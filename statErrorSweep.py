@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function, division
+#command line parsing
+import argparse
+import re
+from collections import OrderedDict
+import numpy as np
+#extraction of the per ring statistics of all PU points
+import linearityTools
+#output without ROOT
+import resultsIO
+
+#statistical error projections for many readout scenarios at once
+#the statistical error of a nibble is 1/sqrt(N) with N = mean*ln4*trgkhz/40 the number of objects counted
+#in ln4 orbits at a trigger rate of trgkhz (in units of the 40 MHz bunch crossing rate), see linearityTools.statError
+#all trigger rates, nibble lengths, ring/disk selections and PU points are evaluated in a single broadcast:
+#the result has the shape (triggers, nibbles, selections, points)
+
+#rings with a dedicated trigger rate that doesn't change with the scenario: {(disk, ring): trgkhz}, counting from 1
+#Disk 4 Ring 1 of TEPX is read out at 825 kHz as in linearityStat.py
+overrides = {"TEPX": {(4, 1): 0.825}, "TFPX": {}}
+
+#a selection of disks and rings as "D<disks>R<rings>", each a comma separated list or * for all, e.g.
+#D4R1, D*R1 or D1,2R*; the mask has the shape (disks, rings)
+def selectionMask(selection, disks, rings):
+    match = re.match(r"^D([0-9,]+|\*)R([0-9,]+|\*)$", selection)
+    if match is None:
+        raise ValueError("Invalid selection "+selection+", use D<disks>R<rings> with comma separated numbers or *, e.g. D4R1 or D*R1")
+    mask = np.zeros((disks, rings), dtype=bool)
+    diskindices = slice(None) if match.group(1) == "*" else [int(disk)-1 for disk in match.group(1).split(",")]
+    ringindices = slice(None) if match.group(2) == "*" else [int(ring)-1 for ring in match.group(2).split(",")]
+    if isinstance(diskindices, list) and not all(0 <= disk < disks for disk in diskindices):
+        raise ValueError("Selection "+selection+" has a disk outside of 1-"+str(disks))
+    if isinstance(ringindices, list) and not all(0 <= ring < rings for ring in ringindices):
+        raise ValueError("Selection "+selection+" has a ring outside of 1-"+str(rings))
+    mask[np.ix_(np.arange(disks)[diskindices], np.arange(rings)[ringindices])] = True
+    return mask
+
+#the default selections: every ring, every disk, every ring position on all disks and the full detector
+def defaultSelections(disks, rings):
+    selections = ["D"+str(i+1)+"R"+str(j+1) for i in range(disks) for j in range(rings)]
+    selections += ["D"+str(i+1)+"R*" for i in range(disks)]
+    selections += ["D*R"+str(j+1) for j in range(rings)]
+    return selections+["D*R*"]
+
+#trigger rates per scenario and ring (triggers, disks, rings), overridden rings keep their dedicated rate
+def ringTriggers(trgkhz, disks, rings, override=None):
+    rates = np.empty((len(trgkhz), disks, rings))
+    rates[...] = np.asarray(trgkhz, dtype=np.float64)[:, np.newaxis, np.newaxis]
+    for ((disk, ring), rate) in (override or {}).items():
+        rates[:, disk-1, ring-1] = rate
+    return rates
+
+#statistical error of the selections for all scenarios
+#pileup (points,), means (disks, rings, points), ln4 (nibbles,), trgkhz (triggers,), masks (selections, disks, rings)
+#the counts of the selected rings add up, so a selection with rings at different trigger rates is handled exactly
+#returns (triggers, nibbles, selections, points), 0 where nothing is counted and for pileup 0 as in linearityStat.py
+def sweep(pileup, means, ln4, trgkhz, masks, override=None):
+    means = np.asarray(means, dtype=np.float64)
+    (disks, rings) = means.shape[:2]
+    rates = ringTriggers(trgkhz, disks, rings, override)
+    #objects per orbit of each selection (triggers, selections, points)
+    counts = np.einsum("sdr,tdr,drp->tsp", np.asarray(masks, dtype=np.float64), rates/40., means)
+    counts = counts[:, np.newaxis]*np.asarray(ln4, dtype=np.float64)[np.newaxis, :, np.newaxis, np.newaxis]
+    nonzero = (counts > 0) & (np.asarray(pileup, dtype=np.float64) > 0)
+    return np.where(nonzero, 1./np.sqrt(np.where(nonzero, counts, 1.)), 0.)
+
+#the sweep as resultsIO results, one entry per selection with one row per trigger rate, nibble length and PU point
+def sweepResults(pileup, errors, ln4, trgkhz, selections):
+    (triggers, nibbles, nselections, npoints) = errors.shape
+    (trggrid, ln4grid, pileupgrid) = np.meshgrid(np.asarray(trgkhz, dtype=np.float64), np.asarray(ln4, dtype=np.float64),
+                                                 pileup, indexing="ij")
+    results = OrderedDict()
+    for (index, selection) in enumerate(selections):
+        results["StatError "+selection] = OrderedDict([("trgkhz", trggrid.ravel()), ("ln4", ln4grid.ravel()),
+                                                        ("pileup", pileupgrid.ravel()), ("staterror", errors[:, :, index].ravel())])
+    return results
+
+#summary plots: the error against pileup of every scenario per selection, and the error at the highest pileup
+#against the trigger rate per nibble length for every selection
+def writeSweep(filename, pileup, errors, ln4, trgkhz, selections):
+    import ROOT as root
+    root.gROOT.SetBatch(True)
+    rootfile = root.TFile(filename,"RECREATE")
+    for (index, selection) in enumerate(selections):
+        c_canvas = root.TCanvas("StatError "+selection,"StatError "+selection)
+        multigraph = root.TMultiGraph()
+        multigraph.SetTitle("Statistical Error "+selection+";Pileup;Statistical Error")
+        legend = root.TLegend(0.55,0.55,0.88,0.88)
+        color = 1
+        for t in range(len(trgkhz)):
+            for n in range(len(ln4)):
+                graph = root.TGraph(len(pileup), np.ascontiguousarray(pileup), np.ascontiguousarray(errors[t, n, index]))
+                graph.SetMarkerStyle(8)
+                graph.SetMarkerColor(color)
+                graph.SetLineColor(color)
+                multigraph.Add(graph, "lp")
+                legend.AddEntry(graph, str(trgkhz[t]*1000)+" kHz, 2^{"+str(int(np.log2(ln4[n])))+"} orbits", "lp")
+                color = color+1
+        multigraph.Draw("a")
+        legend.Draw()
+        c_canvas.Write("StatError_"+selection)
+
+    #scenario overview at the highest pileup
+    c_summary = root.TCanvas("Summary","Summary")
+    c_summary.Divide(len(ln4))
+    summarygraphs = []
+    for n in range(len(ln4)):
+        c_summary.cd(n+1)
+        multigraph = root.TMultiGraph()
+        multigraph.SetTitle("Statistical Error at PU "+str(pileup[-1])+", 2^{"+str(int(np.log2(ln4[n])))+"} orbits;Trigger rate [kHz];Statistical Error")
+        for index in range(len(selections)):
+            graph = root.TGraph(len(trgkhz), np.ascontiguousarray(np.asarray(trgkhz, dtype=np.float64)*1000), np.ascontiguousarray(errors[:, n, index, -1]))
+            graph.SetTitle(selections[index])
+            graph.SetMarkerStyle(8)
+            multigraph.Add(graph, "lp")
+        multigraph.Draw("a")
+        summarygraphs.append(multigraph)
+    c_summary.Write("StatError_Summary")
+    rootfile.Close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statistical error for a grid of trigger rates, nibble lengths and ring/disk selections")
+    parser.add_argument("path", nargs="?", default="/afs/cern.ch/user/g/gauzinge/ITsim/mySummaryPlots/",
+                        help="directory with the summary_PU_*.root files")
+    parser.add_argument("jobs", nargs="?", type=int, default=1, help="number of parallel worker processes")
+    parser.add_argument("format", nargs="?", default="root", choices=["root"]+resultsIO.formats, help="output format of the table")
+    parser.add_argument("--observable", default="TEPX Clusters", choices=list(linearityTools.observables.keys()),
+                        help="observable whose mean counts are used")
+    parser.add_argument("--trigger", type=float, nargs="+", default=[0.075], help="trigger rates in MHz, e.g. 0.075 for 75 kHz")
+    parser.add_argument("--nibble", type=int, nargs="+", default=[16384], help="nibble lengths in orbits")
+    parser.add_argument("--select", nargs="+", default=None,
+                        help="ring/disk selections D<disks>R<rings>, e.g. D4R1 D*R1 D1,2R*; default every ring, disk, ring position and all")
+    parser.add_argument("--no-override", dest="override", action="store_false",
+                        help="use the scenario trigger rate also for the rings with a dedicated rate (TEPX Disk 4 Ring 1)")
+    parser.add_argument("--incremental", nargs="?", const=linearityTools.storefile, default=None, metavar="STORE",
+                        help="keep the extracted statistics in STORE and only process new or changed files (default store: %(const)s)")
+    args = parser.parse_args()
+
+    print("Filepath", args.path, "Observable:", args.observable, "Jobs:", args.jobs, "Format:", args.format)
+    files = linearityTools.getFiles(args.path)
+    print(files)
+    if args.incremental is not None:
+        points = linearityTools.extractIncremental(files, [args.observable], args.jobs, args.incremental)
+    else:
+        points = linearityTools.extractAll(files, [args.observable], args.jobs)
+
+    #a mean of 0.5 means no objects, as in linearityStat.py
+    (pileup, means, sigmas, integral) = linearityTools.pointArrays(points, args.observable, "poisson")
+    (disks, rings) = means.shape[:2]
+    detector = linearityTools.observables[args.observable][0]
+    selections = args.select if args.select is not None else defaultSelections(disks, rings)
+    masks = np.array([selectionMask(selection, disks, rings) for selection in selections])
+    override = overrides[detector] if args.override else None
+    errors = sweep(pileup, means, args.nibble, args.trigger, masks, override)
+    print("Evaluated", len(args.trigger), "trigger rates x", len(args.nibble), "nibble lengths x", len(selections), "selections x", len(pileup), "PU points")
+
+    basename = "Results_StatErrorSweep_"+args.observable.replace(" ", "_")
+    if args.format == "root":
+        writeSweep(basename+".root", pileup, errors, args.nibble, args.trigger, selections)
+        #the table is always written, csv is the default next to the plots
+        resultsIO.writeResults(basename, sweepResults(pileup, errors, args.nibble, args.trigger, selections), "csv")
+    else:
+        resultsIO.writeResults(basename, sweepResults(pileup, errors, args.nibble, args.trigger, selections), args.format)
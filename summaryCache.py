@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+#make compatible 2.7 and 3
+from __future__ import print_function
+#get the OS features
+import os, sys, re, hashlib
+import multiprocessing
+from collections import namedtuple
+import numpy as np
+
+#columnar cache for the histograms in the summary_PU_*.root files
+#every TH2F that is requested is extracted once (bin contents incl. under/overflow, bin edges, entries)
+#and stored in an uncompressed NPZ file per summary file - the NPZ is keyed by the absolute path of the
+#summary file and invalidated as soon as its mtime or size change
+#the location of the cache can be changed with the SUMMARYCACHE environment variable
+#the ROOT files are read with uproot or PyROOT, see backend below
+cachedir = os.environ.get("SUMMARYCACHE", ".summaryCache")
+
+#contents are indexed like hist.GetBinContent(xbin, ybin), so [0] and [-1] are under- and overflow
+CachedHist = namedtuple("CachedHist", ["contents", "xedges", "yedges", "entries"])
+
+#extract the pileup from the file name
+def getPileup(file):
+    pileupstring = re.findall('summary_PU_(.*).root', file)
+    return float(pileupstring[0])
+
+#the histogram names per disk, minus side first: {-disk: name, disk: name}
+def diskHistNames(histname, disks):
+    names = {}
+    for disk in range(1, disks+1):
+        names[-disk] = histname+"-"+str(disk)
+        names[disk] = histname+str(disk)
+    return names
+
+def _cacheFile(file):
+    path = os.path.abspath(file)
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cachedir, digest+"_"+os.path.basename(path)+".npz")
+
+def _fileStamp(file):
+    stat = os.stat(file)
+    return np.array([stat.st_mtime, stat.st_size], dtype=np.float64)
+
+#the bin edges of a TAxis
+def _axisEdges(axis):
+    nbins = axis.GetNbins()
+    return np.array([axis.GetBinLowEdge(i) for i in range(1, nbins+2)], dtype=np.float64)
+
+#convert a TH2 into numpy arrays
+def histToArrays(hist):
+    nx = hist.GetNbinsX()
+    ny = hist.GetNbinsY()
+    ncells = hist.GetNcells()
+    contents = None
+    #fast path: read the internal array directly, fall back to GetBinContent if the buffer is not usable
+    if hist.InheritsFrom("TH2F") or hist.InheritsFrom("TH2D"):
+        dtype = np.float32 if hist.InheritsFrom("TH2F") else np.float64
+        try:
+            buf = hist.GetArray()
+            if hasattr(buf, "reshape"):
+                buf.reshape((ncells,))
+            contents = np.frombuffer(buf, dtype=dtype, count=ncells).astype(np.float64)
+        except (TypeError, ValueError, AttributeError):
+            contents = None
+    if contents is None:
+        contents = np.array([hist.GetBinContent(i) for i in range(ncells)], dtype=np.float64)
+    #ROOT global bin = xbin + (nx+2)*ybin
+    contents = contents.reshape(ny+2, nx+2).T.copy()
+    return CachedHist(contents, _axisEdges(hist.GetXaxis()), _axisEdges(hist.GetYaxis()), float(hist.GetEntries()))
+
+#open the summary file with ROOT and extract the requested histograms
+def _extractRoot(file, keys):
+    import ROOT as root
+    rootfile = root.TFile.Open(file)
+    extracted = {}
+    for key in keys:
+        hist = rootfile.Get(key)
+        if not hist:
+            print("Histogram", key, "not found in", file)
+            #remember it, so we don't re-open the file every time it is requested
+            extracted[key] = None
+            continue
+        extracted[key] = histToArrays(hist)
+    rootfile.Close()
+    return extracted
+
+#the same with uproot, which needs neither PyROOT nor a ROOT install
+def _extractUproot(file, keys):
+    import uproot
+    extracted = {}
+    with uproot.open(file) as rootfile:
+        for key in keys:
+            try:
+                hist = rootfile[key]
+            except KeyError:
+                print("Histogram", key, "not found in", file)
+                extracted[key] = None
+                continue
+            #values(flow=True) is indexed [xbin][ybin] including under- and overflow, like CachedHist.contents
+            contents = np.asarray(hist.values(flow=True), dtype=np.float64)
+            xedges = np.asarray(hist.axis(0).edges(), dtype=np.float64)
+            yedges = np.asarray(hist.axis(1).edges(), dtype=np.float64)
+            extracted[key] = CachedHist(contents, xedges, yedges, float(hist.member("fEntries")))
+    return extracted
+
+#reader for the summary files: uproot, root, or auto to use uproot if it is installed and ROOT otherwise
+backend = os.environ.get("SUMMARYBACKEND", "auto")
+
+def _useUproot():
+    if backend == "auto":
+        try:
+            import uproot
+            return True
+        except ImportError:
+            return False
+    return backend == "uproot"
+
+def _extract(file, keys):
+    print("Reading", len(keys), "histograms from", file)
+    if _useUproot():
+        return _extractUproot(file, keys)
+    return _extractRoot(file, keys)
+
+#read the cached histograms of a summary file, only the requested keys are read from the NPZ
+def _loadCache(file, stamp, keys=None):
+    cachefile = _cacheFile(file)
+    if not os.path.exists(cachefile):
+        return {}
+    cached = {}
+    with np.load(cachefile) as npz:
+        if "__stamp__" not in npz.files or not np.array_equal(npz["__stamp__"], stamp):
+            print("Cache for", file, "is outdated, re-reading")
+            return {}
+        available = set(name.rsplit("/", 1)[0] for name in npz.files if not name.startswith("__"))
+        if "__missing__" in npz.files:
+            for key in npz["__missing__"]:
+                cached[str(key)] = None
+        if keys is not None:
+            available = available.intersection(keys)
+        for key in available:
+            cached[key] = CachedHist(npz[key+"/contents"], npz[key+"/xedges"], npz[key+"/yedges"],
+                                     float(npz[key+"/entries"]))
+    return cached
+
+def _writeCache(file, stamp, hists):
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+    arrays = {"__stamp__": stamp}
+    missing = [key for key, hist in hists.items() if hist is None]
+    if missing:
+        arrays["__missing__"] = np.array(missing)
+    for key, hist in hists.items():
+        if hist is None:
+            continue
+        arrays[key+"/contents"] = hist.contents
+        arrays[key+"/xedges"] = hist.xedges
+        arrays[key+"/yedges"] = hist.yedges
+        arrays[key+"/entries"] = np.array(hist.entries)
+    #write to a temporary file first so a concurrent reader never sees a partial cache
+    cachefile = _cacheFile(file)
+    tmpfile = cachefile+".tmp"+str(os.getpid())
+    with open(tmpfile, "wb") as out:
+        np.savez(out, **arrays)
+    os.rename(tmpfile, cachefile)
+
+#get the histograms for a list of keys ("BRIL_IT_Analysis/TEPX/Clusters/Number of clusters for Disk 1", ...)
+#only keys that are not cached yet are read from the ROOT file, all of them in a single TFile::Open
+def loadHistograms(file, keys):
+    stamp = _fileStamp(file)
+    cached = _loadCache(file, stamp, keys)
+    missing = [key for key in keys if key not in cached]
+    if missing:
+        #keep what is already in the cache and add the new histograms
+        cached = _loadCache(file, stamp)
+        cached.update(_extract(file, missing))
+        _writeCache(file, stamp, cached)
+    return dict((key, cached[key]) for key in keys if cached.get(key) is not None)
+
+#the keys of the per disk histograms of a directory as {-disk: key, disk: key}
+def diskHistKeys(directory, histname, disks):
+    names = diskHistNames(histname, disks)
+    return dict((disk, directory+"/"+name) for disk, name in names.items())
+
+#get the per disk histograms of a directory as {-disk: CachedHist, disk: CachedHist}
+def getDiskHistograms(file, directory, histname, disks):
+    keys = diskHistKeys(directory, histname, disks)
+    hists = loadHistograms(file, list(keys.values()))
+    return dict((disk, hists[key]) for disk, key in keys.items())
+
+#worker of prefetch, only the cache file is written so nothing has to be sent back
+def _prefetchWorker(args):
+    (file, keys) = args
+    loadHistograms(file, keys)
+    return file
+
+#fill the cache for the keys of all files, with jobs worker processes reading the ROOT files in parallel
+#every worker writes the cache of a different summary file, afterwards loadHistograms only reads NPZ files
+def prefetch(files, keys, jobs=1):
+    keys = list(keys)
+    tasks = [(file, keys) for file in files]
+    if jobs <= 1 or len(files) <= 1:
+        for task in tasks:
+            _prefetchWorker(task)
+        return
+    pool = multiprocessing.Pool(min(jobs, len(files)))
+    try:
+        for file in pool.imap_unordered(_prefetchWorker, tasks):
+            print("Cached", file)
+    finally:
+        pool.close()
+        pool.join()
+
+#bin centers of an axis given its edges
+def binCenters(edges):
+    return 0.5*(edges[1:]+edges[:-1])
+
+if __name__ == '__main__':
+    #pre-fill the cache for all histograms of a summary file: summaryCache.py file [file ...]
+    for file in sys.argv[1:]:
+        keys = []
+        if _useUproot():
+            import uproot
+            with uproot.open(file) as rootfile:
+                for (key, classname) in rootfile.classnames().items():
+                    if classname.startswith("TH2"):
+                        #drop the ;cycle
+                        keys.append(key.rsplit(";", 1)[0])
+        else:
+            import ROOT as root
+            rootfile = root.TFile.Open(file)
+            def walk(directory, path):
+                for key in directory.GetListOfKeys():
+                    obj = key.ReadObj()
+                    if obj.InheritsFrom("TDirectory"):
+                        walk(obj, path+key.GetName()+"/")
+                    elif obj.InheritsFrom("TH2"):
+                        keys.append(path+key.GetName())
+            walk(rootfile, "")
+            rootfile.Close()
+        loadHistograms(file, keys)
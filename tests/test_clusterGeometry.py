@@ -0,0 +1,78 @@
+#make compatible 2.7 and 3
+from __future__ import division
+import numpy as np
+import clusterGeometry
+
+#the window masks of the old clusterStudies.py: strict < on both edges, both sides in z
+#(the old sub-disk masks only selected +z, which was fixed together with the classifier)
+#returns the code of the window every value is in, -1 outside of all windows
+def _maskCodes(values, windows):
+    codes = np.full(len(values), -1, dtype=np.int8)
+    for (code, (low, high)) in windows.items():
+        mask = np.logical_or(np.logical_and(values > low, values < high), np.logical_and(values < -low, values > -high))
+        codes[mask] = code
+    return codes
+
+def _subdiskWindows():
+    return dict(((di, si), window) for di in clusterGeometry.zMaskRangeInner
+                for (si, window) in clusterGeometry.zMaskRangeInner[di].items())
+
+def _points(rng, windows, low, high, n):
+    #random positions and every edge, slightly inside and slightly outside of it
+    edges = np.array([edge for window in windows for edge in window])
+    return np.concatenate([rng.uniform(low, high, n), edges, edges-1e-6, edges+1e-6])
+
+#a value on a lower edge is in the window [low, high), the old masks excluded both edges
+def _onLowerEdge(values, windows):
+    return np.isin(np.abs(values), [low for (low, high) in windows])
+
+def test_disks():
+    rng = np.random.RandomState(11)
+    windows = list(clusterGeometry.zMaskRange.values())
+    z = _points(rng, windows, 160., 280., 5000)
+    z = np.concatenate([z, -z])
+    disk = clusterGeometry.classifyClusters(z, np.zeros(len(z)))[0]
+    old = _maskCodes(z, clusterGeometry.zMaskRange)
+    lower = _onLowerEdge(z, windows)
+    assert np.array_equal(disk[~lower], old[~lower])
+    assert np.all(old[lower] == -1)
+    assert np.all(disk[lower] > 0)
+
+def test_rings():
+    rng = np.random.RandomState(12)
+    windows = list(clusterGeometry.rMaskRange.values())
+    r = _points(rng, windows, 0., 30., 5000)
+    ring = clusterGeometry.classifyClusters(np.zeros(len(r)), r)[2]
+    old = _maskCodes(r, clusterGeometry.rMaskRange)
+    lower = _onLowerEdge(r, windows)
+    assert np.array_equal(ring[~lower], old[~lower])
+    assert np.all(old[lower] == -1)
+    #the upper edge is outside in both
+    upper = np.isin(r, [high for (low, high) in windows])
+    assert np.all(ring[upper & ~lower] == -1)
+
+def test_subdisks():
+    rng = np.random.RandomState(13)
+    windows = _subdiskWindows()
+    z = _points(rng, windows.values(), 170., 270., 5000)
+    z = np.concatenate([z, -z])
+    subdisk = clusterGeometry.classifyClusters(z, np.zeros(len(z)))[1]
+    #the old masks per disk and sub-disk, with the sub-disk within its disk as code
+    oldsub = np.full(len(z), -1, dtype=np.int8)
+    for (key, window) in windows.items():
+        oldsub[_maskCodes(z, {1: window}) == 1] = key[1]
+    lower = _onLowerEdge(z, windows.values())
+    assert np.array_equal(subdisk[~lower], oldsub[~lower])
+    assert np.all(subdisk[lower] > 0)
+
+def test_lookup():
+    edges, codes = clusterGeometry.edgeTable([(5., 6., 2), (1., 2., 7), (2., 3., 4)])
+    values = np.array([0.5, 1., 1.5, 2., 2.5, 3., 4., 5., 5.99, 6., 7.])
+    assert np.array_equal(clusterGeometry.lookup(values, edges, codes), [-1, 7, 7, 4, 4, -1, -1, 2, 2, -1, -1])
+
+def test_edgeTable_overlap():
+    try:
+        clusterGeometry.edgeTable([(1., 3., 1), (2., 4., 2)])
+    except ValueError:
+        return
+    raise AssertionError("overlapping windows didn't raise")
@@ -0,0 +1,65 @@
+#make compatible 2.7 and 3
+from __future__ import division
+import numpy as np
+import histAccumulators
+
+def _values(rng, edges, n):
+    #random values inside and outside of the edges, plus every edge itself
+    values = rng.uniform(edges[0]-5, edges[-1]+5, n)
+    return np.concatenate([values, edges, [edges[0]-1e-9, edges[-1]+1e-9]])
+
+def test_hist1d_histogram():
+    rng = np.random.RandomState(5)
+    for edges in [np.linspace(0., 30., 41), np.array([0., 1., 2.5, 7., 10.])]:
+        values = _values(rng, edges, 1000)
+        weights = rng.uniform(0.5, 2., len(values))
+        assert np.array_equal(histAccumulators.Hist1D(edges).fill(values).counts, np.histogram(values, edges)[0])
+        assert np.allclose(histAccumulators.Hist1D(edges).fill(values, weights).counts,
+                           np.histogram(values, edges, weights=weights)[0])
+
+def test_hist2d_histogram2d():
+    rng = np.random.RandomState(6)
+    xedges = np.linspace(170., 270., 51)
+    yedges = np.array([0., 6.5, 9.7, 10.9, 13.7, 30.])
+    x = _values(rng, xedges, 2000)
+    y = rng.permutation(_values(rng, yedges, len(x)-len(yedges)-2))
+    hist = histAccumulators.Hist2D(xedges, yedges).fill(x, y)
+    assert np.array_equal(hist.counts, np.histogram2d(x, y, [xedges, yedges])[0])
+    #the corners: all four outermost edge combinations
+    corners = histAccumulators.Hist2D(xedges, yedges).fill([170., 170., 270., 270.], [0., 30., 0., 30.])
+    assert np.array_equal(corners.counts, np.histogram2d([170., 170., 270., 270.], [0., 30., 0., 30.], [xedges, yedges])[0])
+    assert corners.sum() == 4
+
+def test_merge_chunks():
+    #filling chunk by chunk and adding up gives the histogram of all values
+    rng = np.random.RandomState(8)
+    edges = np.linspace(-1., 1., 21)
+    values = _values(rng, edges, 3000)
+    chunks = [histAccumulators.Hist1D(edges).fill(chunk) for chunk in np.array_split(values, 4)]
+    total = chunks[0] + chunks[1]
+    total += chunks[2]
+    total += chunks[3]
+    assert np.array_equal(total.counts, np.histogram(values, edges)[0])
+    assert np.array_equal(chunks[0].counts + chunks[1].counts, (chunks[0] + chunks[1]).counts)
+    merged = histAccumulators.mergeHistograms([{"h": histAccumulators.Hist1D(edges).fill(chunk), "h2": histAccumulators.Hist2D(edges, edges).fill(chunk, -chunk)}
+                                               for chunk in np.array_split(values, 4)])
+    assert np.array_equal(merged["h"].counts, np.histogram(values, edges)[0])
+    assert np.array_equal(merged["h2"].counts, np.histogram2d(values, -values, [edges, edges])[0])
+
+def test_add_binning_mismatch():
+    try:
+        histAccumulators.Hist1D.uniform(10, 0., 1.) + histAccumulators.Hist1D.uniform(11, 0., 1.)
+    except ValueError:
+        return
+    raise AssertionError("adding histograms with different binning didn't raise")
+
+def test_save_load(tmpdir):
+    hists = {"a": histAccumulators.Hist1D.uniform(5, 0., 5.).fill([0., 1.5, 5.]),
+             "b/c": histAccumulators.Hist2D.uniform(2, (0., 2.), 3, (0., 3.)).fill([0.5, 1.5], [2.5, 0.])}
+    filename = str(tmpdir.join("hists.npz"))
+    histAccumulators.saveHistograms(filename, hists)
+    loaded = histAccumulators.loadHistograms(filename)
+    assert set(loaded) == set(hists)
+    for name in hists:
+        assert type(loaded[name]) is type(hists[name])
+        assert np.array_equal(loaded[name].counts, hists[name].counts)
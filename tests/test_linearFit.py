@@ -0,0 +1,52 @@
+#make compatible 2.7 and 3
+from __future__ import division
+import numpy as np
+import linearFit
+
+#two-sided 95% quantiles of the student t distribution from the tables
+def test_studentQuantile():
+    for (ndf, expected) in [(1, 12.706), (2, 4.303), (5, 2.571), (30, 2.042)]:
+        assert abs(linearFit.studentQuantile(0.975, ndf) - expected) < 1e-3
+
+def test_fitLinear_polyfit():
+    rng = np.random.RandomState(3)
+    x = np.linspace(0., 200., 12)
+    sigma = rng.uniform(0.5, 2., len(x))
+    y = 0.37*x + 4.2 + rng.normal(0., sigma)
+    fit = linearFit.fitLinear(x, y, sigma)
+    #np.polyfit takes the weights as 1/sigma, not 1/sigma^2
+    (slope, intercept), covariance = np.polyfit(x, y, 1, w=1./sigma, cov="unscaled")
+    assert np.allclose(fit.slope, slope)
+    assert np.allclose(fit.intercept, intercept)
+    assert np.allclose(fit.covariance[0], covariance)
+    assert fit.ndf[0] == len(x) - 2
+
+def test_fitLinear_fitrange_nan():
+    x = np.arange(10.)
+    y = np.array([2*x + 1, np.where(x == 3, np.nan, -x + 5)])
+    fit = linearFit.fitLinear(x, y, fitrange=(0, 8))
+    assert np.allclose(fit.slope, [2., -1.])
+    assert np.allclose(fit.intercept, [1., 5.])
+    assert np.array_equal(fit.ndf, [7, 6])
+
+def test_fitLinear_zero_error_point():
+    #the zero error point inside the fit range has no weight, it must not count in ndf or the band
+    x = np.array([0., .5, 1., 1.5, 2., 10.])
+    y = np.array([0., 1., 1.4, 1.7, 2., 4.])
+    sigma = np.array([0., .1, .1, .1, .1, .1])
+    fit = linearFit.fitLinear(x, y, sigma, fitrange=(0, 2))
+    assert np.array_equal(fit.ndf, [2])
+    #the same fit without the point
+    reference = linearFit.fitLinear(x[1:5], y[1:5], sigma[1:5])
+    assert np.allclose(fit.slope, reference.slope)
+    assert np.allclose(fit.chi2, reference.chi2)
+    band = linearFit.confidenceBand(fit, x)
+    assert np.allclose(band, linearFit.confidenceBand(reference, x))
+    #explicitly: t(0.975, 2)*sqrt(chi2/2)*the error of the line
+    variance = fit.covariance[0, 0, 0]*x*x + 2*fit.covariance[0, 0, 1]*x + fit.covariance[0, 1, 1]
+    assert np.allclose(band[0], 4.303*np.sqrt(fit.chi2[0]/2.)*np.sqrt(variance), rtol=1e-4)
+
+def test_fitLinear_unweighted_ndf():
+    #without any errors all used points count
+    fit = linearFit.fitLinear(np.arange(5.), [0., 1.1, 1.9, 3.2, 4.], fitrange=(0, 3))
+    assert np.array_equal(fit.ndf, [2])
@@ -0,0 +1,51 @@
+#make compatible 2.7 and 3
+from __future__ import division
+import numpy as np
+import poissonFit
+
+#the asymptotic series is truncated at x >= 6, good to a few 1e-10
+def test_digamma_trigamma():
+    assert abs(poissonFit.digamma(1.) + np.euler_gamma) < 1e-9
+    assert abs(poissonFit.digamma(0.5) + np.euler_gamma + 2*np.log(2.)) < 1e-9
+    assert abs(poissonFit.trigamma(1.) - np.pi**2/6) < 1e-9
+    assert abs(poissonFit.trigamma(0.5) - np.pi**2/2) < 1e-9
+    #the recurrence psi(x+1) = psi(x) + 1/x across the switch to the asymptotic series
+    x = np.linspace(0.3, 12., 50)
+    assert np.allclose(poissonFit.digamma(x+1), poissonFit.digamma(x) + 1./x, rtol=0, atol=1e-9)
+    assert np.allclose(poissonFit.trigamma(x+1), poissonFit.trigamma(x) - 1./x**2, rtol=0, atol=1e-9)
+
+#histogram of x = scale*k with k Poisson distributed with mean mean/scale, in unit bins from 0
+def _scaledPoissonCounts(rng, mean, scale, entries, nbins=200):
+    values = scale*rng.poisson(mean/scale, entries)
+    return np.bincount(values.astype(int), minlength=nbins)[:nbins]
+
+def test_fitScaledPoisson_roundtrip():
+    rng = np.random.RandomState(7)
+    edges = np.arange(201.)
+    points = [(30., 1.), (40., 2.), (60., 3.)]
+    counts = np.array([_scaledPoissonCounts(rng, mean, scale, 100000) for (mean, scale) in points])
+    fit = poissonFit.fitScaledPoisson(counts, edges)
+    assert np.all(fit.status == poissonFit.CONVERGED)
+    for (index, (mean, scale)) in enumerate(points):
+        assert abs(fit.mean[index] - mean) < 4*fit.meanerror[index]
+        assert abs(fit.scale[index] - scale) < 0.01*scale
+
+def test_fitScaledPoisson_newton():
+    #a geometric distribution is far from the moment start, the Newton steps have to converge to the
+    #maximum of the likelihood: zero derivative in the scale and lower than at nearby scales
+    edges = np.arange(101.)
+    counts = 1e4*0.9**np.arange(100.)
+    fit = poissonFit.fitScaledPoisson(counts, edges)
+    assert fit.status == poissonFit.CONVERGED
+    assert 1 < fit.iterations < 50
+    values = poissonFit.binValues(edges)
+    for factor in (0.99, 1.01):
+        assert poissonFit.logLikelihood(counts, values, fit.mean, fit.scale*factor) < fit.loglikelihood
+
+def test_fitScaledPoisson_status():
+    edges = np.arange(11.)
+    counts = np.zeros((2, 10))
+    counts[1, 3] = 5
+    fit = poissonFit.fitScaledPoisson(counts, edges)
+    assert np.array_equal(fit.status, [poissonFit.EMPTY, poissonFit.DEGENERATE])
+    assert fit.mean[1] == 3.